@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Векторный движок аспектов для Lunaria AI (транзиты, синастрия)
+
+Долготы натальных точек хранятся как матрица numpy (строка - карта,
+столбец - точка из NATAL_POINTS, NaN - точки нет). Угловое расстояние
+до каждой планеты дня и подбор аспекта считаются одной операцией над
+всеми картами сразу, без AstrologicalSubject на каждого пользователя.
+Положения планет дня считаются один раз напрямую через swisseph
+(те же файлы эфемерид, что у kerykeion, без импорта самого kerykeion),
+медленные тела - из таблицы эфемерид, если она собрана. Для периода
+(гороскоп на неделю, месяц) положения на все дни берутся сразу
+(body_positions_many): медленные тела - одной выборкой numpy из таблицы.
+
+Аспекты и орбисы - как по умолчанию в kerykeion (DEFAULT_ACTIVE_ASPECTS),
+для транзитов орбисы уже (TRANSIT_ORBS).
+
+Синастрия: полная матрица аспектов "точка карты A x точка карты B" для
+одной карты против многих сразу и числовая оценка совместимости по методу
+Ciro Discepolo - с тем же результатом, что RelationshipScoreFactory из
+kerykeion: аспект для очков подбирается, как в kerykeion, по целой части
+расстояния и орбисам по умолчанию, а орбис для надбавки 8 -> 11 берется со
+знаком. Аспекты в ответе синастрии (synastry_aspects) считаются точно и с
+орбисами запроса - на очки они не влияют.
+
+    python3 aspect_engine.py positions [YYYY-MM-DD [HH:MM]]
+"""
+
+import json
+import os
+import sys
+
+# Натальные точки в порядке столбцов матрицы долгот (имена как в kerykeion)
+NATAL_POINTS = (
+    "Sun", "Moon", "Mercury", "Venus", "Mars", "Jupiter", "Saturn",
+    "Uranus", "Neptune", "Pluto", "Chiron", "Mean_Lilith", "Mean_Node",
+    "True_Node", "Ascendant", "Medium_Coeli",
+)
+
+# Транзитные тела: (имя, номер тела swisseph)
+TRANSIT_BODIES = (
+    ("Sun", 0), ("Moon", 1), ("Mercury", 2), ("Venus", 3), ("Mars", 4),
+    ("Jupiter", 5), ("Saturn", 6), ("Uranus", 7), ("Neptune", 8),
+    ("Pluto", 9), ("Mean_Node", 10), ("Chiron", 15),
+)
+
+# (название, угол, орбис) - как DEFAULT_ACTIVE_ASPECTS в kerykeion
+ASPECTS = (
+    ("conjunction", 0.0, 10.0),
+    ("opposition", 180.0, 10.0),
+    ("trine", 120.0, 8.0),
+    ("sextile", 60.0, 6.0),
+    ("square", 90.0, 5.0),
+    ("quintile", 72.0, 1.0),
+)
+
+# Транзитный аспект "работает" в узком орбисе - для гороскопа на день
+TRANSIT_ORBS = {
+    "conjunction": 3.0, "opposition": 3.0, "trine": 3.0,
+    "sextile": 2.0, "square": 3.0, "quintile": 1.0,
+}
+
+SIGNS = ("Ari", "Tau", "Gem", "Can", "Leo", "Vir", "Lib", "Sco", "Sag", "Cap", "Aqu", "Pis")
+
+# Карты обрабатываются блоками: временные массивы (блок x точки x тела)
+# помещаются в кэш процессора - на 100k карт быстрее, чем блоками по 8192
+DEFAULT_CHUNK_SIZE = 1024
+
+
+def get_ephe_path():
+    """Папка файлов эфемерид kerykeion (ищется без импорта пакета)"""
+    import importlib.util
+    spec = importlib.util.find_spec("kerykeion")
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    return os.path.join(list(spec.submodule_search_locations)[0], "sweph")
+
+
+_swe = None
+
+
+def get_swisseph():
+    """Модуль swisseph с путем к эфемеридам kerykeion (настраивается один раз)"""
+    global _swe
+    if _swe is None:
+        import swisseph as swe
+        ephe_path = get_ephe_path()
+        if ephe_path:
+            swe.set_ephe_path(ephe_path)
+        _swe = swe
+    return _swe
+
+
+def julian_day(date=None, time="12:00"):
+    """
+    Юлианский день (UT) для даты "YYYY-MM-DD" и времени "HH:MM" по UTC.
+    Без даты - сегодня по UTC. Возвращает (jd, "YYYY-MM-DDTHH:MMZ").
+    """
+    import datetime
+    if date:
+        day = datetime.date.fromisoformat(date)
+    else:
+        day = datetime.datetime.now(datetime.timezone.utc).date()
+    hour, minute = (int(part) for part in (time or "12:00").split(":"))
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"Invalid time: {time}")
+    jd = get_swisseph().julday(day.year, day.month, day.day, hour + minute / 60.0)
+    return jd, f"{day.isoformat()}T{hour:02d}:{minute:02d}Z"
+
+
+def body_positions_many(jds, bodies=TRANSIT_BODIES, table=None):
+    """
+    Долготы и скорости (град/сутки) тел на много моментов - массивы numpy
+    формы (len(jds), len(bodies)). Медленные тела берутся одной векторной
+    выборкой из таблицы эфемерид (ephemeris_table.py), если она собрана и
+    покрывает даты, остальные - из swisseph. table=False - только swisseph.
+    """
+    import numpy as np
+    if table is None:
+        from ephemeris_table import get_ephemeris_table
+        table = get_ephemeris_table()
+    jds = np.asarray(jds, dtype=np.float64).reshape(-1)
+    longitudes = np.full((len(jds), len(bodies)), np.nan)
+    speeds = np.full((len(jds), len(bodies)), np.nan)
+
+    columns = [column for column, (_, body_id) in enumerate(bodies) if table and body_id in table.body_ids]
+    if columns and len(jds):
+        longitudes[:, columns], speeds[:, columns] = table.positions_many(
+            jds, [bodies[column][1] for column in columns]
+        )
+
+    # Быстрые тела и моменты вне таблицы - swisseph
+    swe = get_swisseph()
+    flags = swe.FLG_SWIEPH | swe.FLG_SPEED
+    for row, column in zip(*np.nonzero(np.isnan(longitudes))):
+        position = swe.calc_ut(float(jds[row]), bodies[column][1], flags)[0]
+        longitudes[row, column] = position[0]
+        speeds[row, column] = position[3]
+    return longitudes, speeds
+
+
+def body_positions(jd, bodies=TRANSIT_BODIES):
+    """Долготы и скорости (град/сутки) тел на момент jd - массивы numpy"""
+    longitudes, speeds = body_positions_many([jd], bodies)
+    return longitudes[0], speeds[0]
+
+
+def sign_of(longitude):
+    return SIGNS[int(longitude // 30) % 12]
+
+
+def subject_longitudes(subject):
+    """
+    Долготы натальных точек subject (AstrologicalSubject, его модель или
+    словарь model_dump) в порядке NATAL_POINTS; None - точки нет.
+    """
+    longitudes = []
+    for name in NATAL_POINTS:
+        key = name.lower()
+        point = subject.get(key) if isinstance(subject, dict) else getattr(subject, key, None)
+        if point is None:
+            longitudes.append(None)
+        elif isinstance(point, dict):
+            longitudes.append(point.get("abs_pos"))
+        else:
+            longitudes.append(point.abs_pos)
+    return longitudes
+
+
+def longitudes_row(value):
+    """
+    Строка матрицы из переданных долгот: словарь {"Sun": 123.4, ...}
+    или список в порядке NATAL_POINTS. Отсутствующие точки - None.
+    """
+    if isinstance(value, dict):
+        row = [value.get(name) for name in NATAL_POINTS]
+    elif isinstance(value, (list, tuple)):
+        if len(value) > len(NATAL_POINTS):
+            raise ValueError(f"Expected at most {len(NATAL_POINTS)} longitudes, got {len(value)}")
+        row = list(value) + [None] * (len(NATAL_POINTS) - len(value))
+    else:
+        raise ValueError("Longitudes must be an object or a list")
+    for item in row:
+        if item is not None and not isinstance(item, (int, float)):
+            raise ValueError(f"Invalid longitude: {item!r}")
+    return row
+
+
+def natal_matrix(rows):
+    """Матрица долгот (N, len(NATAL_POINTS)) из списков, None -> NaN"""
+    import numpy as np
+    matrix = np.array(
+        [[float("nan") if value is None else value for value in row] for row in rows],
+        dtype=np.float64,
+    ).reshape(len(rows), len(NATAL_POINTS))
+    return np.mod(matrix, 360.0)
+
+
+def resolve_orbs(orbs=None, defaults=None):
+    """Орбисы в порядке ASPECTS; orbs переопределяет отдельные аспекты"""
+    defaults = defaults or {}
+    orbs = orbs or {}
+    unknown = set(orbs) - {name for name, _, _ in ASPECTS}
+    if unknown:
+        raise ValueError(f"Unknown aspects in orbs: {sorted(unknown)}")
+    return [float(orbs.get(name, defaults.get(name, orb))) for name, _, orb in ASPECTS]
+
+
+def match_aspects(delta, orbs):
+    """
+    Подбирает аспект для массива разностей долгот delta (любой формы,
+    значения в [-180, 180)). Возвращает (индекс аспекта или -1, орбис).
+    NaN в delta не дает аспекта.
+    """
+    import numpy as np
+    separation = np.abs(delta)
+    aspect_index = np.full(separation.shape, -1, dtype=np.int8)
+    best_orb = np.full(separation.shape, np.inf)
+    # Буферы переиспользуются, а copyto(where=) в разы быстрее булевой индексации
+    orb = np.empty_like(separation)
+    hit = np.empty(separation.shape, dtype=bool)
+    closer = np.empty(separation.shape, dtype=bool)
+    for index, (_, angle, _) in enumerate(ASPECTS):
+        np.subtract(separation, angle, out=orb)
+        np.abs(orb, out=orb)
+        np.less_equal(orb, orbs[index], out=hit)
+        np.less(orb, best_orb, out=closer)
+        hit &= closer
+        np.copyto(aspect_index, index, where=hit)
+        np.copyto(best_orb, orb, where=hit)
+    return aspect_index, best_orb
+
+
+def wrap_delta(first, second):
+    """Разность долгот first - second, приведенная к [-180, 180)"""
+    import numpy as np
+    delta = first - second
+    delta += 180.0
+    np.mod(delta, 360.0, out=delta)
+    delta -= 180.0
+    return delta
+
+
+def transit_aspects(natal, transit_longitudes, transit_speeds, orbs, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Аспекты транзитных тел ко всем натальным точкам всех карт.
+
+    natal - матрица (N, P), transit_longitudes/speeds - массивы (T,).
+    Возвращает массивы одинаковой длины: (карта, натальная точка,
+    транзитное тело, аспект, орбис, сходящийся ли аспект).
+    """
+    import numpy as np
+    parts = []
+    for start in range(0, natal.shape[0], chunk_size):
+        block = natal[start:start + chunk_size]
+        # (n, P, T): транзитное тело минус натальная точка
+        delta = wrap_delta(transit_longitudes[None, None, :], block[:, :, None])
+        aspect_index, orb = match_aspects(delta, orbs)
+        rows, points, bodies = np.nonzero(aspect_index >= 0)
+        aspect_hits = aspect_index[rows, points, bodies]
+        angles = np.array([angle for _, angle, _ in ASPECTS])[aspect_hits]
+        hit_delta = delta[rows, points, bodies]
+        # Натальная точка неподвижна: расстояние меняется со скоростью транзитного тела
+        separation_rate = np.sign(hit_delta) * transit_speeds[bodies]
+        applying = (np.abs(hit_delta) - angles) * separation_rate < 0
+        parts.append((rows + start, points, bodies, aspect_hits, orb[rows, points, bodies], applying))
+
+    if not parts:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty, empty.astype(np.int8), np.empty(0), np.empty(0, dtype=bool)
+    return tuple(np.concatenate(column) for column in zip(*parts))
+
+
+def synastry_aspects(first, others, orbs, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Матрица аспектов одной карты (строка first, форма (P,)) со многими
+    (others, форма (M, P)). Возвращает массивы одинаковой длины:
+    (карта из others, точка first, точка other, аспект, орбис).
+    """
+    import numpy as np
+    parts = []
+    for start in range(0, others.shape[0], chunk_size):
+        block = others[start:start + chunk_size]
+        # (m, P, P): точка first минус точка other
+        delta = wrap_delta(first[None, :, None], block[:, None, :])
+        aspect_index, orb = match_aspects(delta, orbs)
+        rows, first_points, other_points = np.nonzero(aspect_index >= 0)
+        parts.append((rows + start, first_points, other_points,
+                      aspect_index[rows, first_points, other_points], orb[rows, first_points, other_points]))
+
+    if not parts:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty, empty.astype(np.int8), np.empty(0)
+    return tuple(np.concatenate(column) for column in zip(*parts))
+
+
+# Оценка совместимости по Discepolo (тот же результат, что RelationshipScoreFactory):
+# учитываются только мажорные аспекты между Солнцем, Луной, Асцендентом,
+# Венерой и Марсом; +5, если Солнца в знаках одного креста (качества)
+RELATIONSHIP_SCORE_MAPPING = (
+    ("Minimal", 5),
+    ("Medium", 10),
+    ("Important", 15),
+    ("Very Important", 20),
+    ("Exceptional", 30),
+    ("Rare Exceptional", float("inf")),
+)
+MAJOR_ASPECTS = ("conjunction", "opposition", "square", "trine", "sextile")
+DESTINY_SIGN_POINTS = 5
+# Порог "Rare Exceptional": оценка выше считается 100%
+RELATIONSHIP_PERCENT_SCALE = 30
+
+_relationship_tables = None
+
+
+def _get_relationship_tables():
+    """
+    Таблицы очков (P, P, A) для пары точек и аспекта: базовые очки и
+    надбавка при орбисе не больше 2 градусов (8 -> 11).
+    """
+    global _relationship_tables
+    if _relationship_tables is None:
+        import numpy as np
+        points = {name: index for index, name in enumerate(NATAL_POINTS)}
+        aspects = {name: index for index, (name, _, _) in enumerate(ASPECTS)}
+        base = np.zeros((len(NATAL_POINTS), len(NATAL_POINTS), len(ASPECTS)))
+        close_bonus = np.zeros_like(base)
+
+        def both_ways(first, second, aspect_names, score, bonus=0):
+            for one, two in {(first, second), (second, first)}:
+                for aspect in aspect_names:
+                    base[points[one], points[two], aspects[aspect]] = score
+                    close_bonus[points[one], points[two], aspects[aspect]] = bonus
+
+        tense = ("conjunction", "opposition", "square")
+        both_ways("Sun", "Sun", tense, 8, 3)
+        both_ways("Sun", "Sun", [a for a in MAJOR_ASPECTS if a not in tense], 4)
+        both_ways("Sun", "Moon", ("conjunction",), 8, 3)
+        both_ways("Sun", "Moon", [a for a in MAJOR_ASPECTS if a != "conjunction"], 4)
+        both_ways("Sun", "Ascendant", MAJOR_ASPECTS, 4)
+        both_ways("Moon", "Ascendant", MAJOR_ASPECTS, 4)
+        both_ways("Venus", "Mars", MAJOR_ASPECTS, 4)
+        _relationship_tables = (base, close_bonus)
+    return _relationship_tables
+
+
+def relationship_scores(first, others):
+    """
+    Очки совместимости first (форма (P,)) с каждой картой others (форма (M, P))
+    по правилам RelationshipScoreFactory. Аспект - первый из ASPECTS, в орбис
+    которого по умолчанию попадает целая часть расстояния (как
+    get_aspect_from_two_points в kerykeion); орбис - расстояние минус угол
+    аспекта со знаком. Возвращает (очки, одинаковый крест Солнц).
+    """
+    import numpy as np
+    base, close_bonus = _get_relationship_tables()
+    # Очки дают только пары Солнца, Луны, Асцендента, Венеры и Марса
+    columns = np.flatnonzero(base.any(axis=(1, 2)))
+    separation = np.abs(wrap_delta(first[columns][None, :, None], others[:, columns][:, None, :]))
+    whole_degrees = np.floor(separation)
+    aspect_index = np.full(separation.shape, -1, dtype=np.int8)
+    orb = np.zeros_like(separation)
+    for index, (_, angle, default_orb) in reversed(list(enumerate(ASPECTS))):
+        hit = (whole_degrees >= angle - default_orb) & (whole_degrees <= angle + default_orb)
+        np.copyto(aspect_index, index, where=hit)
+        np.copyto(orb, separation - angle, where=hit)
+
+    rows, first_points, other_points = np.nonzero(aspect_index >= 0)
+    first_points, other_points = columns[first_points], columns[other_points]
+    aspects = aspect_index[aspect_index >= 0]
+    points = base[first_points, other_points, aspects] + (orb[aspect_index >= 0] <= 2) * close_bonus[first_points, other_points, aspects]
+    scores = np.bincount(rows, weights=points, minlength=others.shape[0])
+
+    sun = NATAL_POINTS.index("Sun")
+    # Крест (кардинальный/фиксированный/мутабельный) - номер знака по модулю 3
+    first_quality = int(first[sun] // 30) % 3 if not np.isnan(first[sun]) else -1
+    other_quality = np.where(np.isnan(others[:, sun]), -2, np.floor_divide(np.nan_to_num(others[:, sun]), 30) % 3)
+    destiny_sign = other_quality == first_quality
+    scores += destiny_sign * DESTINY_SIGN_POINTS
+    return scores, destiny_sign
+
+
+def relationship_description(score):
+    for description, threshold in RELATIONSHIP_SCORE_MAPPING:
+        if score < threshold:
+            return description
+    return RELATIONSHIP_SCORE_MAPPING[-1][0]
+
+
+def relationship_percent(score):
+    """Оценка в процентах для списков друзей (линейно до порога "Rare Exceptional")"""
+    return min(100, round(score * 100 / RELATIONSHIP_PERCENT_SCALE))
+
+
+def group_by_row(rows, orbs, count):
+    """
+    Индексы попаданий, сгруппированные по картам и отсортированные по
+    орбису (самый точный аспект первым). Возвращает список из count списков.
+    """
+    import numpy as np
+    order = np.lexsort((orbs, rows))
+    bounds = np.searchsorted(rows[order], np.arange(count + 1))
+    return [order[bounds[i]:bounds[i + 1]] for i in range(count)]
+
+
+def main():
+    args = sys.argv[1:]
+    command = args[0] if args else None
+    if command == "positions":
+        jd, moment = julian_day(args[1] if len(args) > 1 else None, args[2] if len(args) > 2 else "12:00")
+        longitudes, speeds = body_positions(jd)
+        print(json.dumps({
+            "moment": moment,
+            "positions": {
+                name: [round(float(lon), 4), round(float(speed), 4), sign_of(lon)]
+                for (name, _), lon, speed in zip(TRANSIT_BODIES, longitudes, speeds)
+            },
+        }, ensure_ascii=False))
+    else:
+        print(__doc__, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
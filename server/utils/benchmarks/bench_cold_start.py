@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк холодного старта калькулятора натальных карт
+
+Node запускает скрипт отдельным процессом на каждый запрос, поэтому время
+старта интерпретатора и импортов платит каждый вызов. Замеряется время
+"спавн -> выход" (медиана) для быстрых путей, которым kerykeion не нужен:
+    --version, --check <валидный вход>, невалидный вход
+и для сравнения - голый интерпретатор и импорт kerykeion. Бюджет задан
+как надбавка к голому интерпретатору: она почти не зависит от машины CI.
+
+Разбивка времени импорта по модулям - через python -X importtime:
+собственное время каждого модуля суммируется по пакету верхнего уровня
+(для быстрого пути --check и для полного набора импортов расчета), без
+модулей, которые импортирует уже голый интерпретатор.
+
+    python3 bench_cold_start.py [--runs N] [--top N] [--assert]
+
+С --assert код выхода 1, если какой-то быстрый путь превысил бюджет.
+"""
+
+import json
+import subprocess
+import sys
+import time
+
+from bench_common import CALCULATOR_PATH, UTILS_DIR, load_corpus, summarize
+
+# Надбавка к голому `python -c pass`, мс (медиана). Замер на машине
+# разработки: все три пути 0-7 мс при голом старте ~37 мс (разброс спавна
+# +-5 мс); до выноса кода в модуль и ленивых импортов было ~20 мс, а
+# импорт одного только kerykeion - ~300 мс.
+COLD_START_BUDGET_MS = {
+    "version": 15,
+    "check": 15,
+    "invalid_input": 15,
+}
+
+# Импорты полного расчета: соседние модули + kerykeion с отрисовкой SVG
+FULL_IMPORTS = (
+    "import natal_chart_cache, svg_artifact_store, city_geocoder, timezone_index\n"
+    "from kerykeion import AstrologicalSubject, KerykeionChartSVG\n"
+)
+
+
+def spawn(args, stdin_text=None):
+    """Один запуск процесса; возвращает время до выхода в секундах"""
+    started = time.perf_counter()
+    subprocess.run(
+        args,
+        input=stdin_text,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        encoding="utf-8",
+    )
+    return time.perf_counter() - started
+
+
+def measure_spawn(args, runs, stdin_text=None):
+    spawn(args, stdin_text)  # прогрев файлового кэша ОС
+    return summarize([spawn(args, stdin_text) for _ in range(runs)])
+
+
+def run_importtime(args):
+    """Пары (модуль, собственное время в мкс) из вывода python -X importtime"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime"] + args,
+        input="",
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+        cwd=str(UTILS_DIR),
+    )
+    timings = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        timings.append((name.strip(), int(self_us)))
+    return timings
+
+
+def import_breakdown(args, top, baseline=()):
+    """
+    Суммирует собственное время импорта по пакетам верхнего уровня.
+    Модули из baseline (их уже импортирует голый интерпретатор через site
+    и .pth-файлы) не учитываются - остается то, что добавил сам скрипт.
+    """
+    baseline = set(baseline)
+    by_package = {}
+    total_us = 0
+    for name, self_us in run_importtime(args):
+        if name in baseline:
+            continue
+        package = name.split(".")[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+        total_us += self_us
+
+    ranking = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "total_import_ms": round(total_us / 1000, 2),
+        "modules": [
+            {"module": package, "self_ms": round(self_us / 1000, 2),
+             "share": round(self_us / total_us, 3) if total_us else 0.0}
+            for package, self_us in ranking
+        ],
+    }
+
+
+def main():
+    runs = 15
+    top = 15
+    if "--runs" in sys.argv:
+        runs = int(sys.argv[sys.argv.index("--runs") + 1])
+    if "--top" in sys.argv:
+        top = int(sys.argv[sys.argv.index("--top") + 1])
+
+    script = [sys.executable, str(CALCULATOR_PATH)]
+    valid_input = json.dumps(load_corpus(limit=1)[0], ensure_ascii=False)
+    invalid_input = json.dumps({"user_name": "Benchmark"})
+
+    bare = measure_spawn([sys.executable, "-c", "pass"], runs)
+    paths = {
+        "version": measure_spawn(script + ["--version"], runs),
+        "check": measure_spawn(script + ["--check"], runs, valid_input),
+        "invalid_input": measure_spawn(script, runs, invalid_input),
+    }
+    kerykeion_import = measure_spawn([sys.executable, "-c", "import kerykeion"], max(3, runs // 3))
+
+    baseline = [name for name, _ in run_importtime(["-c", "pass"])]
+
+    over_budget = []
+    fast_paths = {}
+    for name, stats in paths.items():
+        overhead = round(stats["median_ms"] - bare["median_ms"], 2)
+        budget = COLD_START_BUDGET_MS[name]
+        fast_paths[name] = {"wall": stats, "overhead_ms": overhead, "budget_ms": budget,
+                            "within_budget": overhead <= budget}
+        if overhead > budget:
+            over_budget.append(name)
+
+    report = {
+        "python": sys.version.split()[0],
+        "bare_interpreter": bare,
+        "fast_paths": fast_paths,
+        "kerykeion_import": kerykeion_import,
+        "imports_check_path": import_breakdown([str(CALCULATOR_PATH), "--check", valid_input], top, baseline),
+        "imports_full_calculation": import_breakdown(["-c", FULL_IMPORTS], top, baseline),
+        "within_budget": not over_budget,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    if over_budget:
+        print(f"❌ Cold start over budget: {', '.join(over_budget)}", file=sys.stderr)
+        if "--assert" in sys.argv:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
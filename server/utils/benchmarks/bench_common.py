@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Общие помощники бенчмарков калькулятора натальных карт
+
+Код калькулятора импортируется как модуль natal_chart_calculator, а
+CALCULATOR_PATH - точка входа, которую запускает Node. Корпус входных данных (corpus.json) зафиксирован
+и содержит координаты и пояс - сеть для расчета не нужна.
+
+write_report добавляет к результату сведения о прогоне (время, версии
+Python и kerykeion, коммит) и по --output сохраняет его в файл - прогоны
+разных версий сравнивает bench_compare.py. Папка benchmarks/results/ для
+сохраненных результатов в git не попадает.
+"""
+
+import json
+import os
+import statistics
+import sys
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+UTILS_DIR = BENCHMARKS_DIR.parent
+CALCULATOR_PATH = UTILS_DIR / 'natal-chart-calculator-NEW.py'
+CORPUS_PATH = BENCHMARKS_DIR / 'corpus.json'
+
+if str(UTILS_DIR) not in sys.path:
+    sys.path.insert(0, str(UTILS_DIR))
+
+
+def load_calculator():
+    """Модуль калькулятора natal_chart_calculator"""
+    import natal_chart_calculator
+    return natal_chart_calculator
+
+
+def load_corpus(limit=None):
+    """Фиксированный корпус входных данных рождения"""
+    with open(CORPUS_PATH, encoding="utf-8") as corpus_file:
+        corpus = json.load(corpus_file)
+    return corpus[:limit] if limit else corpus
+
+
+def make_subject(input_data):
+    """AstrologicalSubject из элемента корпуса без обращения к сети"""
+    from kerykeion import AstrologicalSubject
+    return AstrologicalSubject(
+        input_data["user_name"],
+        input_data["birth_year"],
+        input_data["birth_month"],
+        input_data["birth_day"],
+        input_data["birth_hour"],
+        input_data["birth_minute"],
+        input_data["birth_city"],
+        input_data["birth_country_code"],
+        lat=input_data["birth_lat"],
+        lng=input_data["birth_lng"],
+        tz_str=input_data["birth_tz"],
+        online=False
+    )
+
+
+def summarize(samples_seconds):
+    """Сводка по замерам в миллисекундах"""
+    samples = sorted(samples_seconds)
+    return {
+        "runs": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 4),
+        "median_ms": round(statistics.median(samples) * 1000, 4),
+        "min_ms": round(samples[0] * 1000, 4),
+        "max_ms": round(samples[-1] * 1000, 4),
+    }
+
+
+def percentiles(samples_seconds, points=(50, 95, 99)):
+    """Перцентили (метод ближайшего ранга) в миллисекундах: {"p50_ms": ...}"""
+    samples = sorted(samples_seconds)
+    result = {}
+    for point in points:
+        rank = max(1, -(-point * len(samples) // 100))
+        result[f"p{point}_ms"] = round(samples[rank - 1] * 1000, 3)
+    return result
+
+
+def isolated_environment(root):
+    """
+    Переменные окружения, уводящие кэш результатов, SVG и записи карт во
+    временную папку root: бенчмарк не трогает рабочий cache/ и public/.
+    """
+    return {
+        "NATAL_CHART_CACHE_PATH": str(Path(root) / "natal_chart_cache.sqlite"),
+        "NATAL_CHART_SVG_DIR": str(Path(root) / "svg"),
+    }
+
+
+def run_info():
+    """Сведения о прогоне для сравнения результатов между версиями"""
+    import platform
+    import subprocess
+    from datetime import datetime, timezone
+    from importlib import metadata
+
+    try:
+        kerykeion_version = metadata.version("kerykeion")
+    except metadata.PackageNotFoundError:
+        kerykeion_version = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=str(BENCHMARKS_DIR),
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "kerykeion": kerykeion_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "commit": commit,
+    }
+
+
+def write_report(benchmark, report, output_path=None):
+    """Печатает отчет JSON в stdout и, если задан output_path, сохраняет его в файл"""
+    report = {"benchmark": benchmark, "run": run_info(), **report}
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if output_path:
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        output_path.write_text(text + "\n", encoding="utf-8")
+    print(text)
+    return report
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сравнение двух сохраненных результатов бенчмарка (--output FILE)
+
+Сравниваются числовые метрики с одинаковым путем в обоих файлах: время
+(*_ms) и память (*_kb) - чем меньше, тем лучше; пропускная
+способность (*_rps) и speedup - чем больше, тем лучше. Из сводок замеров
+(summarize) берется только медиана, уровни нагрузки сопоставляются по
+параллельности. Регрессия - ухудшение больше чем в --threshold раз.
+
+    python3 bench_compare.py OLD.json NEW.json [--threshold 1.10] [--assert]
+
+Результат - JSON в stdout; с --assert код выхода 1 при любой регрессии.
+"""
+
+import json
+import sys
+
+HIGHER_IS_BETTER_SUFFIXES = ("_rps",)
+LOWER_IS_BETTER_SUFFIXES = ("_ms", "_kb")
+SKIPPED_KEYS = ("run",)
+
+
+def metric_leaves(value, path=""):
+    """Пары (путь, число) для сравниваемых метрик отчета"""
+    if isinstance(value, dict):
+        if "runs" in value and "median_ms" in value:
+            yield f"{path}.median_ms", value["median_ms"]
+            return
+        for key, item in value.items():
+            if not path and key in SKIPPED_KEYS:
+                continue
+            yield from metric_leaves(item, f"{path}.{key}" if path else key)
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            label = item.get("concurrency", index) if isinstance(item, dict) else index
+            yield from metric_leaves(item, f"{path}[{label}]")
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield path, value
+
+
+def direction(path):
+    """1 - меньше лучше, -1 - больше лучше, None - не метрика"""
+    parts = path.replace("[", ".").split(".")
+    if parts[-1] == "speedup" or parts[-1].endswith(HIGHER_IS_BETTER_SUFFIXES):
+        return -1
+    if any(part.endswith(LOWER_IS_BETTER_SUFFIXES) for part in parts):
+        return 1
+    return None
+
+
+def compare(old_report, new_report, threshold):
+    old_metrics = dict(metric_leaves(old_report))
+    metrics = []
+    for path, new_value in metric_leaves(new_report):
+        better = direction(path)
+        old_value = old_metrics.get(path)
+        if better is None or old_value is None or old_value == 0:
+            continue
+        ratio = new_value / old_value
+        # Во сколько раз хуже (больше 1 - ухудшение)
+        worse = ratio if better > 0 else (1 / ratio if ratio else float("inf"))
+        metrics.append({
+            "metric": path,
+            "old": old_value,
+            "new": new_value,
+            "ratio": round(ratio, 3),
+            "regression": worse > threshold,
+        })
+    return metrics
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if "--threshold" in sys.argv:
+        threshold_value = sys.argv[sys.argv.index("--threshold") + 1]
+        args.remove(threshold_value)
+        threshold = float(threshold_value)
+    else:
+        threshold = 1.10
+    if len(args) != 2:
+        print(__doc__, file=sys.stderr)
+        sys.exit(1)
+
+    with open(args[0], encoding="utf-8") as old_file, open(args[1], encoding="utf-8") as new_file:
+        old_report, new_report = json.load(old_file), json.load(new_file)
+    if old_report.get("benchmark") != new_report.get("benchmark"):
+        print(f"Different benchmarks: {old_report.get('benchmark')} vs {new_report.get('benchmark')}",
+              file=sys.stderr)
+        sys.exit(1)
+
+    metrics = compare(old_report, new_report, threshold)
+    regressions = [metric["metric"] for metric in metrics if metric["regression"]]
+    print(json.dumps({
+        "benchmark": new_report.get("benchmark"),
+        "old_run": old_report.get("run"),
+        "new_run": new_report.get("run"),
+        "threshold": threshold,
+        "metrics": metrics,
+        "regressions": regressions,
+    }, indent=2, ensure_ascii=False))
+
+    if "--assert" in sys.argv and regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
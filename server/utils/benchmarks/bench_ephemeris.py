@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Таблица эфемерид против swisseph в транзитах за период
+
+Таблица медленных тел (ephemeris_table.py) строится во временной папке на
+--start-year..--end-year. Замеряется:
+    positions   body_positions_many на --days дней - с таблицей и только swisseph
+    transits    command transits с "days": N для --users натальных карт
+                (корпус по кругу) - с таблицей и без
+    accuracy    наибольшая ошибка долготы таблицы на этих днях, угл. секунды
+"speedup" - во сколько раз быстрее с таблицей (медианы).
+
+    python3 bench_ephemeris.py [--days 30] [--users 1000] [--repeat 5] [--start-year 2020] [--end-year 2030] [--output FILE]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from bench_common import isolated_environment, load_calculator, load_corpus, summarize, write_report
+
+
+def measure(run, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def main():
+    def option(name, default):
+        return int(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+    days = option("--days", 30)
+    user_count = option("--users", 1000)
+    repeat = option("--repeat", 5)
+    start_year = option("--start-year", 2020)
+    end_year = option("--end-year", 2030)
+    output_path = sys.argv[sys.argv.index("--output") + 1] if "--output" in sys.argv else None
+
+    with tempfile.TemporaryDirectory(prefix="natal-ephemeris-") as workdir:
+        table_path = os.path.join(workdir, "ephemeris_slow.bin")
+        os.environ.update(isolated_environment(workdir), NATAL_CHART_EPHEMERIS_PATH=table_path)
+        calculator = load_calculator()
+        import ephemeris_table
+        from aspect_engine import body_positions_many, julian_day, subject_longitudes
+
+        started = time.perf_counter()
+        stats = ephemeris_table.build_table(table_path, start_year, end_year)
+        build_s = time.perf_counter() - started
+        table = ephemeris_table.get_ephemeris_table()
+
+        jd, _ = julian_day(f"{start_year + (end_year - start_year) // 2}-03-20")
+        jds = [jd + day for day in range(days)]
+        positions = {
+            "table": measure(lambda: body_positions_many(jds, table=table), repeat),
+            "swisseph": measure(lambda: body_positions_many(jds, table=False), repeat),
+        }
+        positions["speedup"] = round(positions["swisseph"]["median_ms"] / positions["table"]["median_ms"], 2)
+
+        with_table, _ = body_positions_many(jds, table=table)
+        reference, _ = body_positions_many(jds, table=False)
+        error = abs((with_table - reference + 180.0) % 360.0 - 180.0) * 3600
+
+        corpus = load_corpus()
+        longitudes = [subject_longitudes(calculator.create_subject(item)) for item in corpus]
+        request = {
+            "command": "transits",
+            "date": f"{start_year + (end_year - start_year) // 2}-03-20",
+            "days": days,
+            "users": [{"id": index, "longitudes": longitudes[index % len(longitudes)]} for index in range(user_count)],
+        }
+        transits = {"table": measure(lambda: calculator.process_request(request), repeat)}
+        # Процесс без таблицы: общий экземпляр помечается как недоступный
+        ephemeris_table._table = False
+        transits["swisseph"] = measure(lambda: calculator.process_request(request), repeat)
+        transits["speedup"] = round(transits["swisseph"]["median_ms"] / transits["table"]["median_ms"], 2)
+
+    write_report("ephemeris", {
+        "days": days,
+        "users": user_count,
+        "repeat": repeat,
+        "table": {"years": [start_year, end_year], "size_bytes": stats["size_bytes"], "build_s": round(build_s, 2)},
+        "positions": positions,
+        "transits": transits,
+        "accuracy": {"max_arcsec": round(float(error.max()), 4)},
+    }, output_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный тест калькулятора натальных карт в режиме Node
+
+Повторяет вызов из server/routes.ts: на каждый запрос - новый процесс
+python3 natal-chart-calculator-NEW.py, JSON входа в stdin, ответ - из
+stdout до закрытия процесса. Запросы берутся по кругу из корпуса и
+выполняются с заданной параллельностью (несколько уровней - через запятую).
+
+Для каждого уровня:
+    throughput_rps  запросов в секунду за весь прогон
+    latency         p50/p95/p99 времени "спавн -> закрытие процесса", мс
+    peak_rss_kb     пиковый RSS процесса-калькулятора (p50 и максимум)
+    cpu_ms          CPU процесса (user + sys) на запрос, среднее
+    errors          ответы без "success": true или с ненулевым кодом выхода
+
+    python3 bench_load.py [--requests N] [--concurrency 1,2,4] [--use-cache] [--output FILE]
+
+По умолчанию "use_cache": false - каждый запрос считает карту заново; с
+--use-cache после первого прохода корпуса запросы попадают в кэш.
+Кэш, SVG и записи карт - во временной папке. Перед замером - один
+прогревочный запрос (файловый кэш ОС), в результаты он не входит.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_common import CALCULATOR_PATH, isolated_environment, load_corpus, percentiles, write_report
+
+
+def spawn_request(input_data, env):
+    """
+    Один запрос отдельным процессом. Возвращает (успех, секунды, пиковый RSS
+    в КБ, CPU в секундах); RSS и CPU - из rusage процесса (os.wait4).
+    """
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, str(CALCULATOR_PATH)],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        env=env,
+    )
+    process.stdin.write(json.dumps(input_data, ensure_ascii=False).encode("utf-8"))
+    process.stdin.close()
+    output = process.stdout.read()
+    process.stdout.close()
+
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(process.pid, 0)
+        # Процесс уже собран wait4 - Popen не должен ждать его повторно
+        process.returncode = os.waitstatus_to_exitcode(status)
+        peak_rss_kb = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+        cpu_seconds = usage.ru_utime + usage.ru_stime
+    else:
+        process.wait()
+        peak_rss_kb = cpu_seconds = None
+    elapsed = time.perf_counter() - started
+
+    try:
+        success = process.returncode == 0 and json.loads(output).get("success") is True
+    except ValueError:
+        success = False
+    return success, elapsed, peak_rss_kb, cpu_seconds
+
+
+def run_level(requests, concurrency, env):
+    """Все запросы с заданной параллельностью; сводка уровня"""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda input_data: spawn_request(input_data, env), requests))
+    wall = time.perf_counter() - started
+
+    latencies = [elapsed for _, elapsed, _, _ in results]
+    rss = [peak for _, _, peak, _ in results if peak is not None]
+    cpu = [cpu_seconds for _, _, _, cpu_seconds in results if cpu_seconds is not None]
+    summary = {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": sum(not success for success, _, _, _ in results),
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(results) / wall, 2),
+        "latency": {
+            **percentiles(latencies),
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+            "max_ms": round(max(latencies) * 1000, 3),
+        },
+    }
+    if rss:
+        summary["peak_rss_kb"] = {"p50": round(statistics.median(rss)), "max": max(rss)}
+    if cpu:
+        summary["cpu_ms"] = round(statistics.fmean(cpu) * 1000, 3)
+    return summary
+
+
+def main():
+    request_count = 40
+    if "--requests" in sys.argv:
+        request_count = int(sys.argv[sys.argv.index("--requests") + 1])
+    concurrency_levels = [1, os.cpu_count() or 1]
+    if "--concurrency" in sys.argv:
+        concurrency_levels = [int(level) for level in sys.argv[sys.argv.index("--concurrency") + 1].split(",")]
+    use_cache = "--use-cache" in sys.argv
+    output_path = None
+    if "--output" in sys.argv:
+        output_path = sys.argv[sys.argv.index("--output") + 1]
+
+    corpus = load_corpus()
+    requests = [dict(corpus[index % len(corpus)], use_cache=use_cache) for index in range(request_count)]
+
+    levels = []
+    with tempfile.TemporaryDirectory(prefix="natal-load-") as workdir:
+        # Окружение как у spawn в server/routes.ts
+        env = dict(os.environ, PYTHONIOENCODING="utf-8", PYTHONUTF8="1", **isolated_environment(workdir))
+        spawn_request(requests[0], env)
+        for concurrency in sorted(set(concurrency_levels)):
+            levels.append(run_level(requests, concurrency, env))
+
+    write_report("load", {
+        "mode": "spawn",
+        "use_cache": use_cache,
+        "levels": levels,
+    }, output_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сравнение форматов промта натальной карты по размеру
+
+Для каждого формата ("full", "compact", "split") и языка - средний размер
+промта в символах и оценка токенов (prompt_tokens.py: эвристика или
+tiktoken при NATAL_CHART_TOKENIZER), а для "split" - доля токенов
+system-сообщения, которое одинаково для всех карт и кэшируется провайдером.
+
+    python3 bench_prompt_formats.py [--language RU|EN] [--repeat N]
+
+Результат - JSON в stdout; CPU-время форматирования - на карту.
+"""
+
+import json
+import statistics
+import sys
+import time
+
+from bench_common import load_calculator, load_corpus, make_subject, summarize
+
+
+def main():
+    language = "RU"
+    if "--language" in sys.argv:
+        language = sys.argv[sys.argv.index("--language") + 1]
+    repeat = 5
+    if "--repeat" in sys.argv:
+        repeat = int(sys.argv[sys.argv.index("--repeat") + 1])
+
+    calculator = load_calculator()
+    from prompt_tokens import estimate_tokens, tokenizer_name
+
+    translated = [calculator.translate_natal_chart(make_subject(item), language) for item in load_corpus()]
+
+    report = {"charts": len(translated), "language": language, "tokenizer": tokenizer_name(), "formats": {}}
+    for prompt_format in calculator.PROMPT_FORMATS:
+        prompts = [calculator.format_prompt(data, language, prompt_format) for data in translated]
+        samples = []
+        for _ in range(repeat):
+            started = time.process_time()
+            for data in translated:
+                calculator.format_prompt(data, language, prompt_format)
+            samples.append((time.process_time() - started) / len(translated))
+
+        entry = {
+            "mean_chars": round(statistics.fmean(len(p.get("ai_system_prompt", "")) + len(p["ai_prompt"])
+                                                 for p in prompts)),
+            "mean_tokens": round(statistics.fmean(p["prompt_tokens"] for p in prompts), 1),
+            "max_tokens": max(p["prompt_tokens"] for p in prompts),
+            "cpu_per_chart": summarize(samples),
+        }
+        if prompt_format == "split":
+            entry["system_tokens"] = estimate_tokens(prompts[0]["ai_system_prompt"])
+        report["formats"][prompt_format] = entry
+
+    full_tokens = report["formats"]["full"]["mean_tokens"]
+    for entry in report["formats"].values():
+        entry["tokens_vs_full"] = round(entry["mean_tokens"] / full_tokens, 3)
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
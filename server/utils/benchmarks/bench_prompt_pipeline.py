@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк стадии "subject -> промт для ИИ"
+
+Сравнивает прежний путь (subject.json() -> json.loads -> рекурсивный перевод
+со сборкой словарей на каждый вызов -> промт через += -> clean_unicode_data)
+с текущим (таблицы на уровне модуля, атрибуты прямо из subject, один join).
+Прежний путь сохранен ниже дословно как эталон; перед замером проверяется,
+что оба пути дают байт-в-байт одинаковый промт на всем корпусе.
+
+    python3 bench_prompt_pipeline.py [--repeat N]
+
+Результат - JSON в stdout: CPU-время на карту для обоих путей и экономия.
+"""
+
+import json
+import sys
+import time
+
+from bench_common import load_calculator, load_corpus, make_subject, summarize
+
+
+# --- Прежний путь (как был в calculate_natal_chart) --------------------------
+
+def translate_natal_chart(natal_data):
+    """Переводит натальную карту JSON на русский язык"""
+    
+    # Словари для перевода (точно как в версии заказчиков)
+    SIGN_TRANSLATION = {
+        "Ari": "Овен", "Tau": "Телец", "Gem": "Близнецы", "Can": "Рак",
+        "Leo": "Лев", "Vir": "Дева", "Lib": "Весы", "Sco": "Скорпион",
+        "Sag": "Стрелец", "Cap": "Козерог", "Aqu": "Водолей", "Pis": "Рыбы"
+    }
+    
+    QUALITY_TRANSLATION = {
+        "Cardinal": "Кардинальный",
+        "Fixed": "Фиксированный",
+        "Mutable": "Мутабельный"
+    }
+    
+    ELEMENT_TRANSLATION = {
+        "Fire": "Огонь", "Earth": "Земля", 
+        "Air": "Воздух", "Water": "Вода"
+    }
+    
+    HOUSE_TRANSLATION = {
+        "First_House": "Первый дом",
+        "Second_House": "Второй дом",
+        "Third_House": "Третий дом",
+        "Fourth_House": "Четвертый дом",
+        "Fifth_House": "Пятый дом",
+        "Sixth_House": "Шестой дом",
+        "Seventh_House": "Седьмой дом",
+        "Eighth_House": "Восьмой дом",
+        "Ninth_House": "Девятый дом",
+        "Tenth_House": "Десятый дом",
+        "Eleventh_House": "Одиннадцатый дом",
+        "Twelfth_House": "Двенадцатый дом"
+    }
+
+    HOUSE_NUMBER_TRANSLATION = {
+        "First": "Первый", "Second": "Второй", "Third": "Третий",
+        "Fourth": "Четвертый", "Fifth": "Пятый", "Sixth": "Шестой",
+        "Seventh": "Седьмой", "Eighth": "Восьмой", "Ninth": "Девятый",
+        "Tenth": "Десятый", "Eleventh": "Одиннадцатый", "Twelfth": "Двенадцатый"
+    }
+    
+    POINT_TYPE_TRANSLATION = {
+        "Planet": "Планета",
+        "AxialCusps": "Осевая точка",
+        "House": "Дом"
+    }
+    
+    PLANET_TRANSLATION = {
+        "Sun": "Солнце", "Moon": "Луна", "Mercury": "Меркурий",
+        "Venus": "Венера", "Mars": "Марс", "Jupiter": "Юпитер",
+        "Saturn": "Сатурн", "Uranus": "Уран", "Neptune": "Нептун",
+        "Pluto": "Плутон", "Chiron": "Хирон", "Mean_Lilith": "Черная Луна (Лилит)",
+        "Ascendant": "Асцендент", "Descendant": "Десцендент",
+        "Medium_Coeli": "Середина неба", "Imum_Coeli": "Глубина неба",
+        "Mean_Node": "Восходящий узел (Раху)", "True_Node": "Восходящий узел (истинный)",
+        "Mean_South_Node": "Нисходящий узел (Кету)", "True_South_Node": "Нисходящий узел (истинный)"
+    }
+    
+    MOON_PHASE_TRANSLATION = {
+        "Waxing Crescent": "Растущий серп", "First Quarter": "Первая четверть",
+        "Waxing Gibbous": "Растущая луна", "Full Moon": "Полнолуние",
+        "Waning Gibbous": "Убывающая луна", "Last Quarter": "Последняя четверть",
+        "Waning Crescent": "Убывающий серп", "New Moon": "Новолуние"
+    }
+    
+    SYSTEM_TRANSLATION = {
+        "Placidus": "Плацидус", "Koch": "Коха", "Regiomontanus": "Региомонтанус",
+        "Whole": "Целых знаков", "Equal": "Равных домов", "Tropic": "Тропический",
+        "Apparent Geocentric": "Видимый геоцентрический"
+    }
+    
+    translated_data = natal_data.copy()
+    
+    # Переводим системные поля
+    for field in ["zodiac_type", "houses_system_name", "perspective_type"]:
+        if field in translated_data and translated_data[field] in SYSTEM_TRANSLATION:
+            translated_data[field] = SYSTEM_TRANSLATION[translated_data[field]]
+    
+    # Переводим лунную фазу
+    if "lunar_phase" in translated_data:
+        moon_phase = translated_data["lunar_phase"]
+        if "moon_phase_name" in moon_phase and moon_phase["moon_phase_name"] in MOON_PHASE_TRANSLATION:
+            moon_phase["moon_phase_name"] = MOON_PHASE_TRANSLATION[moon_phase["moon_phase_name"]]
+    
+    def translate_point(point_data):
+        translated = {}
+        for key, value in point_data.items():
+            if isinstance(value, dict):
+                translated[key] = translate_point(value)
+                continue
+                
+            if key == "name" and value in HOUSE_TRANSLATION:
+                parts = value.split('_')
+                if len(parts) > 0 and parts[0] in HOUSE_NUMBER_TRANSLATION:
+                    translated["name"] = f"{HOUSE_NUMBER_TRANSLATION[parts[0]]} дом"
+                else:
+                    translated["name"] = HOUSE_TRANSLATION.get(value, value)
+            else:    
+                if key == "quality" and value in QUALITY_TRANSLATION:
+                    translated[key] = QUALITY_TRANSLATION[value]
+                elif key == "element" and value in ELEMENT_TRANSLATION:
+                    translated[key] = ELEMENT_TRANSLATION[value]
+                elif key == "sign" and value in SIGN_TRANSLATION:
+                    translated[key] = SIGN_TRANSLATION[value]
+                elif key == "house" and value in HOUSE_TRANSLATION:
+                    translated[key] = HOUSE_TRANSLATION[value]
+                elif key == "point_type" and value in POINT_TYPE_TRANSLATION:
+                    translated[key] = POINT_TYPE_TRANSLATION[value]
+                elif key == "name" and value in PLANET_TRANSLATION:
+                    translated[key] = PLANET_TRANSLATION[value]
+                else:
+                    translated[key] = value
+        return translated
+    
+    # Переводим все астрологические точки
+    for point_name in ["sun", "moon", "mercury", "venus", "mars", "jupiter", 
+                      "saturn", "uranus", "neptune", "pluto", "ascendant", 
+                      "descendant", "medium_coeli", "imum_coeli", "chiron", 
+                      "mean_lilith", "first_house", "second_house", 
+                      "third_house", "fourth_house", "fifth_house", 
+                      "sixth_house", "seventh_house", "eighth_house", 
+                      "ninth_house", "tenth_house", "eleventh_house", 
+                      "twelfth_house", "mean_node", "true_node", 
+                      "mean_south_node", "true_south_node"]:
+        if point_name in translated_data:
+            translated_data[point_name] = translate_point(translated_data[point_name])
+    
+    # Переводим списки названий
+    for list_name in ["planets_names_list", "axial_cusps_names_list", "houses_names_list"]:
+        if list_name in translated_data:
+            translated_data[list_name] = [
+                PLANET_TRANSLATION.get(name, name) 
+                for name in translated_data[list_name]
+            ]
+    
+    return translated_data
+
+def format_natal_chart_ai(translated_data):
+    """Форматирует переведенную натальную карту в текстовый вид для ИИ"""
+    
+    def deg_to_dms(decimal_deg):
+        degrees = int(decimal_deg)
+        fractional = decimal_deg - degrees
+        minutes_full = fractional * 60
+        minutes = int(minutes_full)
+        seconds = round((minutes_full - minutes) * 60)
+        return degrees, minutes, seconds
+
+    if 'error' in translated_data:
+        return f"Ошибка: {translated_data['error']}"
+    
+    output = '''Представь, что ты опытный астролог, специализирующийся на составлении и анализе натальных карт.
+Ты помогаешь пользователям понять, как положение планет в момент их рождения влияет на их характер, 
+внутренние возможности и жизненные события. Ты способствуешь осознанию того, какие черты и тенденции 
+они могут развивать, и как их природные дары могут быть использованы для достижения целей. 
+Сделай подробный анализ по всем аспектам. Данные пользователя:  \n'''
+    
+    # Основная информация
+    output += f"Имя: {translated_data['name']}\n"
+    output += f"Место рождения: {translated_data['city']}, {translated_data['nation']}\n"
+    output += f"Дата и время рождения: {translated_data['iso_formatted_local_datetime']}\n\n"
+    output += f"Знак зодиака: {translated_data['sun']['sign']}\n\n"
+    
+    # Асцендент
+    asc = translated_data['ascendant']
+    deg, min, sec = deg_to_dms(asc['position'])
+    output += 'Проведи подробный анализ асцендента: \n'
+    output += f"Асцендент: {asc['sign']} ({deg}° {min}' {sec}'')\n\n"
+    
+    # Середина неба (MC)
+    mc = translated_data['medium_coeli']
+    deg, min, sec = deg_to_dms(mc['position'])
+    output += 'Проведи подробный анализ середины неба (MC):\n'
+    output += f"Середина неба (MC): {mc['sign']} ({deg}° {min}' {sec}'')\n\n"        
+    
+    # Планеты
+    output += 'Проведи подробный анализ сначала положения планеты, а затем нахождение планеты в доме. '
+    output += 'Приведи минимум 5 пунктов для положения планеты и минимум 5 пунктов для дома планеты: \n'
+    
+    planet_keys = [
+        'sun', 'moon', 'mercury', 'venus', 'mars', 'jupiter', 
+        'saturn', 'uranus', 'neptune', 'pluto', 'chiron', 'mean_lilith',
+        'mean_node', 'true_node'
+    ]
+    
+    for key in planet_keys:
+        planet = translated_data.get(key)
+        if planet:
+            deg, min, sec = deg_to_dms(planet['position'])
+            output += f"{planet['name']}: {planet['sign']} ({deg}° {min}' {sec}'') в {planet['house']}\n"
+    
+    # Дома
+    output += '\nПроведи подробный анализ домов. Опиши минимум в 8 предложениях каждый дом:\n'
+    house_keys = [
+        'first_house', 'second_house', 'third_house', 'fourth_house',
+        'fifth_house', 'sixth_house', 'seventh_house', 'eighth_house',
+        'ninth_house', 'tenth_house', 'eleventh_house', 'twelfth_house'
+    ]
+    
+    for key in house_keys:
+        house = translated_data.get(key)
+        if house:
+            deg, min, sec = deg_to_dms(house['position'])
+            output += f"{house['name']}: {house['sign']} ({deg}° {min}' {sec}'')\n"
+    
+    # Лунная фаза
+    lunar_phase = translated_data.get('lunar_phase', {})
+    if lunar_phase:
+        output += f"\nЛунная фаза: {lunar_phase.get('moon_phase_name', '')} {lunar_phase.get('moon_emoji', '')}\n"
+    
+    # Заключение
+    output += '\nСделай вывод и дай рекомендации по результатам составленной натальной карты и проведенного анализа. '
+    output += 'Не задавай вопросов. Учти следующие особенности:\n'
+    output += '- Анализируй ретроградность планет там, где она присутствует\n'
+    output += '- Учитывай стихии (огонь, земля, воздух, вода) и качества (кардинальный, фиксированный, мутабельный)\n'
+    output += '- Проанализируй взаимодействие домов и планет\n'
+    output += '- Укажи на сильные и слабые позиции в карте\n'
+    output += '- Дай практические рекомендации по использованию выявленных потенциалов'
+    
+    return output
+
+
+def legacy_build_ai_prompt(subject, clean_unicode_data):
+    json_data = subject.json(dump=False, indent=2)
+    translated_data = translate_natal_chart(json.loads(json_data))
+    return clean_unicode_data(format_natal_chart_ai(translated_data))
+
+
+# --- Замер --------------------------------------------------------------------
+
+def measure(build, subjects, repeat):
+    """CPU-время (process_time) на одну карту, по каждому прогону корпуса"""
+    samples = []
+    for _ in range(repeat):
+        started = time.process_time()
+        for subject in subjects:
+            build(subject)
+        samples.append((time.process_time() - started) / len(subjects))
+    return summarize(samples)
+
+
+def main():
+    repeat = 20
+    if "--repeat" in sys.argv:
+        repeat = int(sys.argv[sys.argv.index("--repeat") + 1])
+
+    calculator = load_calculator()
+    subjects = [make_subject(item) for item in load_corpus()]
+
+    def legacy(subject):
+        return legacy_build_ai_prompt(subject, calculator.clean_unicode_data)
+
+    mismatches = sum(legacy(subject) != calculator.build_ai_prompt(subject) for subject in subjects)
+    if mismatches:
+        print(f"❌ Prompt mismatch on {mismatches} of {len(subjects)} charts", file=sys.stderr)
+        sys.exit(1)
+
+    legacy_stats = measure(legacy, subjects, repeat)
+    current_stats = measure(calculator.build_ai_prompt, subjects, repeat)
+    saved_ms = legacy_stats["median_ms"] - current_stats["median_ms"]
+
+    print(json.dumps({
+        "charts": len(subjects),
+        "identical_output": True,
+        "legacy_cpu_per_chart": legacy_stats,
+        "current_cpu_per_chart": current_stats,
+        "saved_cpu_ms_per_chart": round(saved_ms, 4),
+        "speedup": round(legacy_stats["median_ms"] / current_stats["median_ms"], 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Микробенчмарки этапов расчета натальной карты
+
+Каждый этап замеряется отдельно на всем корпусе (wall и CPU на карту):
+    subject        create_subject - kerykeion и swisseph по переданным координатам
+    translate      translate_natal_chart
+    format         format_natal_chart_ai
+    clean_unicode  clean_unicode_data готового промта
+    svg            render_chart_svg_text (шаблон уже построен)
+    calculate      calculate_natal_chart целиком, без кэша результатов
+    cached         calculate_natal_chart_cached при попадании в кэш
+и отдельно - первая отрисовка SVG (svg_first_render_ms) с построением
+шаблона для темы и языка. Кэш, SVG и записи карт - во временной папке.
+
+    python3 bench_stages.py [--repeat N] [--language RU|EN] [--theme dark] [--output FILE]
+
+Результат - JSON в stdout (и в FILE); "share" - доля этапа в сумме
+subject + translate + format + clean_unicode + svg.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from bench_common import isolated_environment, load_calculator, load_corpus, summarize, write_report
+
+PIPELINE_STAGES = ("subject", "translate", "format", "clean_unicode", "svg")
+
+
+def measure(run, items, repeat):
+    """Wall (perf_counter) и CPU (process_time) на один элемент, по каждому прогону корпуса"""
+    wall_samples, cpu_samples = [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        started_cpu = time.process_time()
+        for item in items:
+            run(item)
+        wall_samples.append((time.perf_counter() - started) / len(items))
+        cpu_samples.append((time.process_time() - started_cpu) / len(items))
+    return {"wall": summarize(wall_samples), "cpu": summarize(cpu_samples)}
+
+
+def main():
+    repeat = 5
+    if "--repeat" in sys.argv:
+        repeat = int(sys.argv[sys.argv.index("--repeat") + 1])
+    language = "RU"
+    if "--language" in sys.argv:
+        language = sys.argv[sys.argv.index("--language") + 1]
+    theme = "dark"
+    if "--theme" in sys.argv:
+        theme = sys.argv[sys.argv.index("--theme") + 1]
+    output_path = None
+    if "--output" in sys.argv:
+        output_path = sys.argv[sys.argv.index("--output") + 1]
+
+    with tempfile.TemporaryDirectory(prefix="natal-bench-") as workdir:
+        os.environ.update(isolated_environment(workdir))
+        calculator = load_calculator()
+
+        # Первый проход - прогрев импортов kerykeion; в замеры не входит
+        corpus = load_corpus()
+        requests = [dict(item, language=language, theme=theme) for item in corpus]
+        subjects = [calculator.create_subject(item) for item in corpus]
+        translated = [calculator.translate_natal_chart(subject, language) for subject in subjects]
+        prompts = [calculator.format_natal_chart_ai(data, language) for data in translated]
+
+        started = time.perf_counter()
+        calculator.render_chart_svg_text(subjects[0], theme, language)
+        svg_first_render_ms = (time.perf_counter() - started) * 1000
+
+        stages = {
+            "subject": measure(calculator.create_subject, corpus, repeat),
+            "translate": measure(lambda subject: calculator.translate_natal_chart(subject, language), subjects, repeat),
+            "format": measure(lambda data: calculator.format_natal_chart_ai(data, language), translated, repeat),
+            "clean_unicode": measure(calculator.clean_unicode_data, prompts, repeat),
+            "svg": measure(lambda subject: calculator.render_chart_svg_text(subject, theme, language),
+                           subjects, repeat),
+        }
+        pipeline_ms = sum(stages[name]["wall"]["median_ms"] for name in PIPELINE_STAGES)
+        for name in PIPELINE_STAGES:
+            stages[name]["share"] = round(stages[name]["wall"]["median_ms"] / pipeline_ms, 3)
+
+        stages["calculate"] = measure(calculator.calculate_natal_chart, requests, repeat)
+        for item in requests:
+            calculator.calculate_natal_chart_cached(item)
+        stages["cached"] = measure(calculator.calculate_natal_chart_cached, requests, repeat)
+
+    write_report("stages", {
+        "charts": len(corpus),
+        "repeat": repeat,
+        "language": language,
+        "theme": theme,
+        "stages": stages,
+        "pipeline_median_ms": round(pipeline_ms, 4),
+        "svg_first_render_ms": round(svg_first_render_ms, 2),
+    }, output_path)
+
+
+if __name__ == "__main__":
+    main()
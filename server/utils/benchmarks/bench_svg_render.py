@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк отрисовки SVG натальной карты
+
+Сравнивает прежний путь KerykeionChartSVG(..., theme="dark",
+chart_language="RU").makeSVG() (запись файла во временную папку),
+makeTemplate() (та же отрисовка без записи) и svg_chart_renderer с кэшем
+шаблона. Перед замером проверяется, что рендерер дает байт-в-байт тот же
+SVG, что makeTemplate(), на всем корпусе.
+
+    python3 bench_svg_render.py [--repeat N]
+
+Результат - JSON в stdout: CPU-время на карту для каждого пути, время
+первой отрисовки (с построением шаблона для темы и языка) и размер SVG:
+как есть, в gzip и в сравнении с файлом makeSVG().
+"""
+
+import gzip
+import json
+import sys
+import tempfile
+import time
+
+from bench_common import load_corpus, make_subject, summarize
+
+THEME = "dark"
+LANGUAGE = "RU"
+
+
+def measure(render, subjects, repeat):
+    """CPU-время (process_time) на одну карту, по каждому прогону корпуса"""
+    samples = []
+    for _ in range(repeat):
+        started = time.process_time()
+        for subject in subjects:
+            render(subject)
+        samples.append((time.process_time() - started) / len(subjects))
+    return summarize(samples)
+
+
+def size_stats(svg_texts):
+    raw = [len(text.encode("utf-8")) for text in svg_texts]
+    compressed = [len(gzip.compress(text.encode("utf-8"), 6)) for text in svg_texts]
+    return {
+        "mean_bytes": round(sum(raw) / len(raw)),
+        "mean_gzip_bytes": round(sum(compressed) / len(compressed)),
+    }
+
+
+def main():
+    repeat = 5
+    if "--repeat" in sys.argv:
+        repeat = int(sys.argv[sys.argv.index("--repeat") + 1])
+
+    from kerykeion import KerykeionChartSVG
+    import svg_chart_renderer
+
+    subjects = [make_subject(item) for item in load_corpus()]
+
+    # Первая карта: рендерер строит статичные части для (тема, язык)
+    started = time.perf_counter()
+    svg_chart_renderer.render_natal_svg(subjects[0], THEME, LANGUAGE)
+    first_render_ms = (time.perf_counter() - started) * 1000
+
+    def make_template(subject):
+        return KerykeionChartSVG(subject, theme=THEME, chart_language=LANGUAGE).makeTemplate()
+
+    def render_template_cached(subject):
+        return svg_chart_renderer.render_natal_svg(subject, THEME, LANGUAGE)
+
+    reference = [make_template(subject) for subject in subjects]
+    rendered = [render_template_cached(subject) for subject in subjects]
+    mismatches = sum(a != b for a, b in zip(reference, rendered))
+    if mismatches:
+        print(f"❌ SVG mismatch on {mismatches} of {len(subjects)} charts", file=sys.stderr)
+        sys.exit(1)
+
+    make_svg_outputs = []
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        def make_svg(subject):
+            chart = KerykeionChartSVG(subject, new_output_directory=output_dir, theme=THEME, chart_language=LANGUAGE)
+            chart.makeSVG()
+            # Имя файла - по имени пользователя, повторы перезаписываются; размер берем из записанного текста
+            make_svg_outputs.append(chart.template)
+
+        # makeSVG печатает путь каждого файла в stdout - уводим его в stderr
+        stdout = sys.stdout
+        sys.stdout = sys.stderr
+        try:
+            make_svg_stats = measure(make_svg, subjects, repeat)
+        finally:
+            sys.stdout = stdout
+
+    make_template_stats = measure(make_template, subjects, repeat)
+    renderer_stats = measure(render_template_cached, subjects, repeat)
+
+    print(json.dumps({
+        "charts": len(subjects),
+        "theme": THEME,
+        "language": LANGUAGE,
+        "identical_output": True,
+        "make_svg_cpu_per_chart": make_svg_stats,
+        "make_template_cpu_per_chart": make_template_stats,
+        "template_cached_cpu_per_chart": renderer_stats,
+        "template_cached_first_render_ms": round(first_render_ms, 2),
+        "speedup_vs_make_svg": round(make_svg_stats["median_ms"] / renderer_stats["median_ms"], 2),
+        "size_make_svg": size_stats(make_svg_outputs[:len(subjects)]),
+        "size_template_cached": size_stats(rendered),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
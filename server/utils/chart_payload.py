@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Компактное структурированное представление натальной карты для Lunaria AI
+
+Ответ расчета содержит "chart" - все, что нужно последующим командам,
+массивами фиксированного порядка (формат CHART_FORMAT):
+    lon    - долготы точек в порядке aspect_engine.NATAL_POINTS (null - точки нет)
+    sign   - номер знака 0..11 (Овен = 0); градус в знаке = lon - 30 * sign
+    house  - номер дома 1..12
+    retro  - 1, если точка ретроградна
+    cusps  - долготы куспидов 12 домов
+    lunar  - [угол Солнце-Луна, фаза Луны 1..28, фаза Солнца, эмодзи, название фазы]
+плюс имя, город, страна, пояс, местное время, юлианский день (UT),
+координаты, зодиак и система домов. Node сохраняет "chart" в БД один раз
+и передает обратно в transits / synastry ("chart" вместо "longitudes") и
+в команду prompt - без повторного расчета kerykeion.
+
+Двоичная форма (в ответе "chart_b64" при "chart_binary": true) - тот же
+набор полей в struct little-endian, base64; примерно вдвое короче JSON:
+    заголовок  <4sBccddd  magic, формат, зодиак (T/S), система домов, jd, lat, lng
+    точки      <16d 16B H долготы (NaN - нет точки), дома (0 - нет), маска ретроградности
+    куспиды    <12d
+    луна       <dBB       угол Солнце-Луна, фаза Луны, фаза Солнца
+    строки     <H + UTF-8 имя, город, страна, пояс, местное время, эмодзи, название фазы
+
+    python3 chart_payload.py decode <base64>
+"""
+
+import json
+import math
+import struct
+import sys
+
+from aspect_engine import NATAL_POINTS, SIGNS
+
+CHART_FORMAT = 1
+CHART_MAGIC = b"LNCH"
+
+HOUSE_NAMES = (
+    "First_House", "Second_House", "Third_House", "Fourth_House", "Fifth_House", "Sixth_House",
+    "Seventh_House", "Eighth_House", "Ninth_House", "Tenth_House", "Eleventh_House", "Twelfth_House",
+)
+HOUSE_NUMBERS = {name: number for number, name in enumerate(HOUSE_NAMES, start=1)}
+
+HEADER = struct.Struct("<4sBccddd")
+POINTS = struct.Struct(f"<{len(NATAL_POINTS)}d{len(NATAL_POINTS)}BH")
+CUSPS = struct.Struct(f"<{len(HOUSE_NAMES)}d")
+LUNAR = struct.Struct("<dBB")
+STRING_LENGTH = struct.Struct("<H")
+STRING_FIELDS = ("name", "city", "nation", "tz", "local_datetime")
+
+
+def build_chart_payload(subject):
+    """Структура "chart" из AstrologicalSubject или его модели"""
+    lon, sign, house, retro = [], [], [], []
+    for point_name in NATAL_POINTS:
+        point = getattr(subject, point_name.lower(), None)
+        if point is None:
+            lon.append(None)
+            sign.append(None)
+            house.append(None)
+            retro.append(None)
+            continue
+        lon.append(point.abs_pos)
+        sign.append(point.sign_num)
+        house.append(HOUSE_NUMBERS.get(point.house))
+        retro.append(1 if point.retrograde else 0)
+
+    lunar_phase = subject.lunar_phase
+    return {
+        "format": CHART_FORMAT,
+        "name": subject.name,
+        "city": subject.city,
+        "nation": subject.nation,
+        "tz": subject.tz_str,
+        "local_datetime": subject.iso_formatted_local_datetime,
+        "jd": subject.julian_day,
+        "lat": subject.lat,
+        "lng": subject.lng,
+        "zodiac": subject.zodiac_type,
+        "houses_system": subject.houses_system_identifier,
+        "lon": lon,
+        "sign": sign,
+        "house": house,
+        "retro": retro,
+        "cusps": [getattr(subject, name.lower()).abs_pos for name in HOUSE_NAMES],
+        "lunar": [lunar_phase.degrees_between_s_m, lunar_phase.moon_phase, lunar_phase.sun_phase,
+                  lunar_phase.moon_emoji, lunar_phase.moon_phase_name],
+    }
+
+
+def encode_chart_binary(payload):
+    """Двоичная форма "chart" в base64"""
+    import base64
+    retro_mask = 0
+    for index, flag in enumerate(payload["retro"]):
+        if flag:
+            retro_mask |= 1 << index
+    lunar = payload["lunar"]
+    parts = [
+        HEADER.pack(CHART_MAGIC, CHART_FORMAT, payload["zodiac"][:1].encode("ascii"),
+                    payload["houses_system"].encode("ascii"), payload["jd"], payload["lat"], payload["lng"]),
+        POINTS.pack(*[math.nan if value is None else value for value in payload["lon"]],
+                    *[house or 0 for house in payload["house"]], retro_mask),
+        CUSPS.pack(*payload["cusps"]),
+        LUNAR.pack(lunar[0], lunar[1], lunar[2]),
+    ]
+    for text in [payload[field] for field in STRING_FIELDS] + [lunar[3], lunar[4]]:
+        data = str(text).encode("utf-8")
+        parts.append(STRING_LENGTH.pack(len(data)))
+        parts.append(data)
+    return base64.b64encode(b"".join(parts)).decode("ascii")
+
+
+def decode_chart_binary(text):
+    """Структура "chart" из base64 двоичной формы"""
+    import base64
+    import binascii
+    try:
+        data = base64.b64decode(text, validate=True)
+        magic, chart_format, zodiac, houses_system, jd, lat, lng = HEADER.unpack_from(data, 0)
+        if magic != CHART_MAGIC:
+            raise ValueError("Not a chart payload")
+        if chart_format != CHART_FORMAT:
+            raise ValueError(f"Unsupported chart format: {chart_format}")
+        offset = HEADER.size
+        points = POINTS.unpack_from(data, offset)
+        offset += POINTS.size
+        cusps = list(CUSPS.unpack_from(data, offset))
+        offset += CUSPS.size
+        lunar = list(LUNAR.unpack_from(data, offset))
+        offset += LUNAR.size
+        strings = []
+        for _ in range(len(STRING_FIELDS) + 2):
+            (length,) = STRING_LENGTH.unpack_from(data, offset)
+            offset += STRING_LENGTH.size
+            strings.append(data[offset:offset + length].decode("utf-8"))
+            offset += length
+    except (binascii.Error, struct.error, UnicodeDecodeError) as decode_error:
+        raise ValueError(f"Invalid binary chart: {decode_error}")
+
+    count = len(NATAL_POINTS)
+    lon = [None if math.isnan(value) else value for value in points[:count]]
+    houses = points[count:2 * count]
+    retro_mask = points[2 * count]
+    payload = {
+        "format": chart_format,
+        **dict(zip(STRING_FIELDS, strings)),
+        "jd": jd,
+        "lat": lat,
+        "lng": lng,
+        "zodiac": "Tropic" if zodiac == b"T" else "Sidereal",
+        "houses_system": houses_system.decode("ascii"),
+        "lon": lon,
+        "sign": [None if value is None else int(value // 30) for value in lon],
+        "house": [None if value is None else houses[index] for index, value in enumerate(lon)],
+        "retro": [None if value is None else (retro_mask >> index) & 1 for index, value in enumerate(lon)],
+        "cusps": cusps,
+        "lunar": lunar + strings[len(STRING_FIELDS):],
+    }
+    return payload
+
+
+def load_chart_payload(value):
+    """
+    "chart" из запроса: объект из ответа расчета или строка base64.
+    Проверяется формат и длины массивов; ValueError, если что-то не так.
+    """
+    payload = decode_chart_binary(value) if isinstance(value, str) else value
+    if not isinstance(payload, dict):
+        raise ValueError("Field 'chart' must be an object or a base64 string")
+    if payload.get("format") != CHART_FORMAT:
+        raise ValueError(f"Unsupported chart format: {payload.get('format')!r} (expected {CHART_FORMAT})")
+    for field, length in (("lon", len(NATAL_POINTS)), ("sign", len(NATAL_POINTS)), ("house", len(NATAL_POINTS)),
+                          ("retro", len(NATAL_POINTS)), ("cusps", len(HOUSE_NAMES)), ("lunar", 5)):
+        if not isinstance(payload.get(field), list) or len(payload[field]) != length:
+            raise ValueError(f"chart.{field} must be a list of {length} items")
+    return payload
+
+
+class _Point:
+    """Точка карты с теми же атрибутами, что KerykeionPointModel (для промта)"""
+
+    __slots__ = ("name", "abs_pos", "position", "sign", "sign_num", "house", "retrograde")
+
+    def __init__(self, name, abs_pos, sign_num, house=None, retrograde=False):
+        self.name = name
+        self.abs_pos = abs_pos
+        self.sign_num = sign_num
+        self.sign = SIGNS[sign_num]
+        self.position = abs_pos % 30
+        self.house = house
+        self.retrograde = retrograde
+
+
+class _LunarPhase:
+    __slots__ = ("degrees_between_s_m", "moon_phase", "sun_phase", "moon_emoji", "moon_phase_name")
+
+    def __init__(self, degrees_between_s_m, moon_phase, sun_phase, moon_emoji, moon_phase_name):
+        self.degrees_between_s_m = degrees_between_s_m
+        self.moon_phase = moon_phase
+        self.sun_phase = sun_phase
+        self.moon_emoji = moon_emoji
+        self.moon_phase_name = moon_phase_name
+
+
+class PayloadSubject:
+    """
+    Карта из "chart" с атрибутами как у AstrologicalSubject - в том объеме,
+    который читают translate_natal_chart и aspect_engine.subject_longitudes.
+    """
+
+    def __init__(self, payload):
+        self.name = payload["name"]
+        self.city = payload["city"]
+        self.nation = payload["nation"]
+        self.tz_str = payload["tz"]
+        self.iso_formatted_local_datetime = payload["local_datetime"]
+        self.julian_day = payload["jd"]
+        self.lat = payload["lat"]
+        self.lng = payload["lng"]
+        self.zodiac_type = payload["zodiac"]
+        self.houses_system_identifier = payload["houses_system"]
+        self.lunar_phase = _LunarPhase(*payload["lunar"])
+
+        for index, point_name in enumerate(NATAL_POINTS):
+            abs_pos = payload["lon"][index]
+            point = None
+            if abs_pos is not None:
+                house_number = payload["house"][index]
+                point = _Point(point_name, abs_pos, int(abs_pos // 30),
+                               HOUSE_NAMES[house_number - 1] if house_number else None,
+                               bool(payload["retro"][index]))
+            setattr(self, point_name.lower(), point)
+
+        for house_name, cusp in zip(HOUSE_NAMES, payload["cusps"]):
+            setattr(self, house_name.lower(), _Point(house_name, cusp, int(cusp // 30)))
+
+
+def main():
+    args = sys.argv[1:]
+    if len(args) != 2 or args[0] != "decode":
+        print(__doc__, file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(decode_chart_binary(args[1]), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
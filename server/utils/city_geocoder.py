@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Офлайн-геокодер городов для Lunaria AI
+
+Заменяет сетевой запрос к Geonames на поиск по локальному индексу.
+Индекс собирается один раз из дампа GeoNames (cities500.txt / cities15000.txt,
+https://download.geonames.org/export/dump/) и открывается через mmap, поэтому
+загрузка занимает миллисекунды, а страницы файла делятся между процессами.
+
+Поиск: точное совпадение нормализованного названия (кириллица и латиница,
+включая альтернативные названия), затем по префиксу, затем транслитерация
+и нечеткое совпадение (расстояние Левенштейна). Если в запросе есть код
+страны, рассматриваются только города этой страны: одноименный город в
+другой стране - промах, и калькулятор уходит в Geonames, а не строит карту
+по чужим координатам. Из нескольких совпадений выбирается самый населенный.
+
+    python3 city_geocoder.py build cities15000.txt [--output PATH] [--min-population N]
+    python3 city_geocoder.py lookup "Москва" [RU]
+"""
+
+import bisect
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import unicodedata
+from pathlib import Path
+
+DEFAULT_INDEX_PATH = Path(__file__).resolve().parent.parent.parent / 'cache' / 'geocoder_cities.idx'
+
+INDEX_MAGIC = b'LNGEO001'
+# magic, n_records, n_names, off_records, off_names, off_strings, off_tz, len_tz
+HEADER = struct.Struct('<8sIIIIIII')
+# lat, lng, population, name_offset, name_len, tz_index, country_code
+RECORD = struct.Struct('<ffIIHH2s2x')
+# key_offset, record_index, key_len
+NAME_ENTRY = struct.Struct('<IIH2x')
+
+PREFIX_SCAN_LIMIT = 5000
+FUZZY_SCAN_LIMIT = 20000
+
+# Служебные слова в названиях ("г. Москва", "город Казань", "city of ...")
+STOP_WORDS = {"г", "гор", "город", "пгт", "пос", "поселок", "с", "село", "дер", "деревня", "city", "of"}
+
+_NON_WORD_RE = re.compile(r'[\W_]+', re.UNICODE)
+
+CYRILLIC_TO_LATIN = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ж": "zh", "з": "z",
+    "и": "i", "й": "i", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p",
+    "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts", "ч": "ch",
+    "ш": "sh", "щ": "shch", "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+    "і": "i", "ї": "yi", "є": "ye", "ґ": "g", "ў": "u",
+}
+
+
+def normalize_name(name):
+    """Приводит название города к ключу поиска: регистр, ё/й, диакритика, пунктуация"""
+    text = name.casefold().replace("ё", "е").replace("й", "и")
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    words = [word for word in _NON_WORD_RE.sub(" ", text).split() if word not in STOP_WORDS]
+    return " ".join(words)
+
+
+def transliterate(key):
+    """Кириллица -> латиница для повторного поиска по английским названиям"""
+    return "".join(CYRILLIC_TO_LATIN.get(ch, ch) for ch in key)
+
+
+def _is_supported_script(name):
+    """В индекс попадают только названия на латинице и кириллице"""
+    for ch in name:
+        if ch.isalpha():
+            script = unicodedata.name(ch, "").split(" ")[0]
+            if script not in ("LATIN", "CYRILLIC"):
+                return False
+    return True
+
+
+def _levenshtein(a, b, limit):
+    """Расстояние Левенштейна с ранним выходом, если оно заведомо больше limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def build_index(source_paths, output_path=None, min_population=0):
+    """
+    Собирает бинарный индекс из дампов GeoNames (формат geoname, TSV).
+    Возвращает число городов и названий в индексе.
+    """
+    output_path = Path(output_path or DEFAULT_INDEX_PATH)
+    records = []
+    names = {}
+    tz_names = {}
+    strings = bytearray()
+
+    for source_path in source_paths:
+        with open(source_path, encoding="utf-8") as source:
+            for line in source:
+                columns = line.rstrip("\n").split("\t")
+                if len(columns) < 18:
+                    continue
+                population = int(columns[14] or 0)
+                if population < min_population or not columns[17]:
+                    continue
+
+                record_index = len(records)
+                display_name = columns[1].encode("utf-8")[:0xFFFF]
+                tz_index = tz_names.setdefault(columns[17], len(tz_names))
+                records.append((
+                    float(columns[4]), float(columns[5]), min(population, 0xFFFFFFFF),
+                    len(strings), len(display_name), tz_index,
+                    columns[8].upper().encode("ascii", "replace")[:2].ljust(2)
+                ))
+                strings += display_name
+
+                candidates = [columns[1], columns[2]] + columns[3].split(",")
+                for candidate in candidates:
+                    if not candidate or not _is_supported_script(candidate):
+                        continue
+                    key = normalize_name(candidate)
+                    if key:
+                        names.setdefault(key.encode("utf-8"), set()).add(record_index)
+
+    # Ключи храним один раз, а точки входа сортируем по байтам UTF-8
+    # (совпадает с порядком кодовых точек, поэтому работает бинарный поиск)
+    entries = []
+    for key in sorted(names):
+        key_offset = len(strings)
+        strings += key
+        for record_index in sorted(names[key], key=lambda i: -records[i][2]):
+            entries.append((key_offset, record_index, len(key)))
+
+    tz_blob = "\n".join(sorted(tz_names, key=tz_names.get)).encode("utf-8")
+    off_records = HEADER.size
+    off_names = off_records + RECORD.size * len(records)
+    off_strings = off_names + NAME_ENTRY.size * len(entries)
+    off_tz = off_strings + len(strings)
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_suffix(output_path.suffix + ".tmp")
+    with open(tmp_path, "wb") as out:
+        out.write(HEADER.pack(INDEX_MAGIC, len(records), len(entries), off_records,
+                              off_names, off_strings, off_tz, len(tz_blob)))
+        for record in records:
+            out.write(RECORD.pack(*record))
+        for entry in entries:
+            out.write(NAME_ENTRY.pack(*entry))
+        out.write(strings)
+        out.write(tz_blob)
+    os.replace(tmp_path, output_path)
+
+    return {"cities": len(records), "names": len(entries), "timezones": len(tz_names),
+            "size_bytes": output_path.stat().st_size, "path": str(output_path)}
+
+
+class CityGeocoder:
+    """Поиск по memory-mapped индексу городов"""
+
+    def __init__(self, path=None):
+        self.path = Path(path or os.environ.get("NATAL_CHART_GEOCODER_PATH") or DEFAULT_INDEX_PATH)
+        with open(self.path, "rb") as index_file:
+            self._mm = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.n_records, self.n_names, self._off_records, self._off_names,
+         self._off_strings, off_tz, len_tz) = HEADER.unpack_from(self._mm, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"Not a geocoder index: {self.path}")
+        self._tz_names = self._mm[off_tz:off_tz + len_tz].decode("utf-8").split("\n")
+        # Ленивый "список" ключей для bisect без копирования индекса в память
+        self._keys = _KeyView(self)
+
+    def _entry(self, position):
+        return NAME_ENTRY.unpack_from(self._mm, self._off_names + position * NAME_ENTRY.size)
+
+    def _key_at(self, position):
+        key_offset, _, key_len = self._entry(position)
+        start = self._off_strings + key_offset
+        return self._mm[start:start + key_len]
+
+    def _record(self, record_index):
+        lat, lng, population, name_offset, name_len, tz_index, country = RECORD.unpack_from(
+            self._mm, self._off_records + record_index * RECORD.size)
+        start = self._off_strings + name_offset
+        return {
+            "name": self._mm[start:start + name_len].decode("utf-8"),
+            "lat": round(lat, 5),
+            "lng": round(lng, 5),
+            "tz": self._tz_names[tz_index],
+            "country_code": country.decode("ascii").strip(),
+            "population": population,
+        }
+
+    def _best(self, positions, country_code):
+        """
+        Самый населенный город среди найденных точек входа; с country_code -
+        только из этой страны (None, если там такого нет)
+        """
+        best = None
+        for position in positions:
+            record = self._record(self._entry(position)[1])
+            if country_code and record["country_code"] != country_code:
+                continue
+            if best is None or record["population"] > best["population"]:
+                best = record
+        return best
+
+    def _exact(self, key):
+        key_bytes = key.encode("utf-8")
+        start = bisect.bisect_left(self._keys, key_bytes)
+        end = start
+        while end < self.n_names and self._key_at(end) == key_bytes:
+            end += 1
+        return range(start, end)
+
+    def _prefix(self, key, limit=PREFIX_SCAN_LIMIT):
+        key_bytes = key.encode("utf-8")
+        start = bisect.bisect_left(self._keys, key_bytes)
+        end = start
+        while end < self.n_names and end - start < limit and self._key_at(end).startswith(key_bytes):
+            end += 1
+        return range(start, end)
+
+    def _fuzzy(self, key, country_code):
+        """Кандидаты с теми же первыми двумя буквами и расстоянием правки <= 1-2 (из страны запроса)"""
+        max_distance = 1 if len(key) <= 6 else 2
+        best_distance = max_distance + 1
+        matches = []
+        for position in self._prefix(key[:2], limit=FUZZY_SCAN_LIMIT):
+            candidate = self._key_at(position).decode("utf-8")
+            distance = _levenshtein(key, candidate, max_distance)
+            if distance > max_distance or distance > best_distance:
+                continue
+            if country_code and self._record(self._entry(position)[1])["country_code"] != country_code:
+                continue
+            if distance < best_distance:
+                best_distance, matches = distance, [position]
+            elif distance == best_distance:
+                matches.append(position)
+        return self._best(matches, country_code)
+
+    def lookup(self, city, country_code=None):
+        """
+        Возвращает {"name", "lat", "lng", "tz", "country_code", "population", "match"}
+        или None. С country_code город ищется только в этой стране.
+        """
+        if not city:
+            return None
+        country_code = (country_code or "").upper()
+
+        keys = []
+        for variant in (city, city.split(",")[0]):
+            key = normalize_name(variant)
+            if key and key not in keys:
+                keys.append(key)
+        keys += [transliterate(key) for key in keys if transliterate(key) not in keys]
+
+        for match_type, search in (("exact", self._exact), ("prefix", self._prefix)):
+            for key in keys:
+                if match_type == "prefix" and len(key) < 3:
+                    continue
+                result = self._best(search(key), country_code)
+                if result:
+                    result["match"] = match_type
+                    return result
+
+        for key in keys:
+            if len(key) >= 4:
+                result = self._fuzzy(key, country_code)
+                if result:
+                    result["match"] = "fuzzy"
+                    return result
+        return None
+
+
+class _KeyView:
+    """Последовательность ключей индекса для bisect (чтение прямо из mmap)"""
+
+    def __init__(self, geocoder):
+        self._geocoder = geocoder
+
+    def __len__(self):
+        return self._geocoder.n_names
+
+    def __getitem__(self, position):
+        return self._geocoder._key_at(position)
+
+
+_geocoder = None
+
+
+def get_geocoder():
+    """Общий экземпляр геокодера на процесс; None, если индекс не собран"""
+    global _geocoder
+    if _geocoder is None:
+        try:
+            _geocoder = CityGeocoder()
+        except (OSError, ValueError) as e:
+            from instrumentation import log
+            log("warning", "geocoder_index_unavailable", error=str(e))
+            _geocoder = False
+    return _geocoder or None
+
+
+def geocode(city, country_code=None):
+    """Офлайн-геокодирование города; None, если индекса нет или город не найден"""
+    geocoder = get_geocoder()
+    return geocoder.lookup(city, country_code) if geocoder else None
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] not in ("build", "lookup"):
+        print(__doc__, file=sys.stderr)
+        sys.exit(1)
+
+    if args[0] == "build":
+        output = None
+        min_population = 0
+        sources = []
+        rest = iter(args[1:])
+        for arg in rest:
+            if arg == "--output":
+                output = next(rest)
+            elif arg == "--min-population":
+                min_population = int(next(rest))
+            else:
+                sources.append(arg)
+        if not sources:
+            print("❌ No GeoNames source files given", file=sys.stderr)
+            sys.exit(1)
+        stats = build_index(sources, output, min_population)
+        print(f"✅ Geocoder index built: {stats['cities']} cities, {stats['names']} names", file=sys.stderr)
+        print(json.dumps(stats, ensure_ascii=False))
+    else:
+        result = geocode(args[1], args[2] if len(args) > 2 else None)
+        print(json.dumps(result, ensure_ascii=False))
+        if result is None:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
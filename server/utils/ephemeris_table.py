@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Предрасчитанная таблица эфемерид медленных тел для Lunaria AI
+
+Юпитер, Сатурн, Уран, Нептун, Плутон, Хирон, узлы и Лилит движутся
+медленно, поэтому вместо вызова swisseph достаточно суточных отсчетов
+долготы и скорости с кубической интерполяцией Эрмита: ошибка на всем
+диапазоне - сотые и десятые доли угловой секунды (проверка: verify).
+Отсчеты считаются теми же вызовами swisseph и с теми же флагами, что у
+kerykeion, поэтому таблица совпадает с расчетом карты.
+
+Файл (cache/ephemeris_slow.bin, ~10 МБ на 1900-2100) открывается через
+mmap только для чтения: воркеры пула делят одни и те же страницы кэша ОС.
+Читает его aspect_engine.body_positions_many - транзиты, в том числе за
+период ("days"): медленные тела на все дни одной выборкой positions_many.
+Замер против swisseph - benchmarks/bench_ephemeris.py.
+
+    python3 ephemeris_table.py build [--output PATH] [--start-year 1900] [--end-year 2100] [--step-days 1]
+    python3 ephemeris_table.py verify [--samples N]
+    python3 ephemeris_table.py lookup YYYY-MM-DD [HH:MM]
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from pathlib import Path
+
+DEFAULT_TABLE_PATH = Path(__file__).resolve().parent.parent.parent / 'cache' / 'ephemeris_slow.bin'
+DEFAULT_START_YEAR = 1900
+DEFAULT_END_YEAR = 2100
+DEFAULT_STEP_DAYS = 1.0
+
+TABLE_MAGIC = b'LNEPH001'
+# magic, start_jd, step_days, n_samples, n_bodies, off_bodies, off_data
+HEADER = struct.Struct('<8sddIIII')
+BODY_ID = struct.Struct('<I')
+# Отсчет одного тела: долгота (град), скорость (град/сутки)
+SAMPLE = struct.Struct('<dd')
+
+# (имя, номер тела swisseph) - имена как в kerykeion
+SLOW_BODIES = (
+    ("Jupiter", 5), ("Saturn", 6), ("Uranus", 7), ("Neptune", 8), ("Pluto", 9),
+    ("Mean_Node", 10), ("True_Node", 11), ("Mean_Lilith", 12), ("Chiron", 15),
+)
+
+
+def _swisseph():
+    from aspect_engine import get_swisseph
+    return get_swisseph()
+
+
+def build_table(output_path=None, start_year=DEFAULT_START_YEAR, end_year=DEFAULT_END_YEAR,
+                step_days=DEFAULT_STEP_DAYS, bodies=SLOW_BODIES):
+    """Считает отсчеты через swisseph и атомарно записывает таблицу"""
+    import numpy as np
+    swe = _swisseph()
+    flags = swe.FLG_SWIEPH | swe.FLG_SPEED
+    output_path = Path(output_path or os.environ.get("NATAL_CHART_EPHEMERIS_PATH") or DEFAULT_TABLE_PATH)
+
+    start_jd = swe.julday(start_year, 1, 1, 0.0)
+    end_jd = swe.julday(end_year + 1, 1, 1, 0.0)
+    # +1 отсчет после конца, чтобы интерполировать до последнего дня включительно
+    n_samples = int(round((end_jd - start_jd) / step_days)) + 2
+
+    data = np.empty((n_samples, len(bodies), 2), dtype='<f8')
+    for sample in range(n_samples):
+        jd = start_jd + sample * step_days
+        for column, (_, body_id) in enumerate(bodies):
+            position = swe.calc_ut(jd, body_id, flags)[0]
+            data[sample, column, 0] = position[0]
+            data[sample, column, 1] = position[3]
+
+    off_bodies = HEADER.size
+    off_data = off_bodies + BODY_ID.size * len(bodies)
+    off_data += -off_data % 8
+    header = HEADER.pack(TABLE_MAGIC, start_jd, step_days, n_samples, len(bodies), off_bodies, off_data)
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as out:
+        out.write(header)
+        for _, body_id in bodies:
+            out.write(BODY_ID.pack(body_id))
+        out.write(b"\0" * (off_data - off_bodies - BODY_ID.size * len(bodies)))
+        out.write(data.tobytes())
+    os.replace(tmp_path, output_path)
+
+    return {
+        "path": str(output_path),
+        "bodies": [name for name, _ in bodies],
+        "start_jd": start_jd,
+        "end_jd": start_jd + (n_samples - 2) * step_days,
+        "step_days": step_days,
+        "samples": n_samples,
+        "size_bytes": output_path.stat().st_size,
+    }
+
+
+def _hermite(t, p0, m0, p1, m1):
+    """Кубический Эрмит на [0, 1]: значение и производная по t"""
+    t2 = t * t
+    t3 = t2 * t
+    value = (2 * t3 - 3 * t2 + 1) * p0 + (t3 - 2 * t2 + t) * m0 + (-2 * t3 + 3 * t2) * p1 + (t3 - t2) * m1
+    derivative = (6 * t2 - 6 * t) * p0 + (3 * t2 - 4 * t + 1) * m0 + (-6 * t2 + 6 * t) * p1 + (3 * t2 - 2 * t) * m1
+    return value, derivative
+
+
+class EphemerisTable:
+    """Поиск положений медленных тел по memory-mapped таблице"""
+
+    def __init__(self, path=None):
+        self.path = Path(path or os.environ.get("NATAL_CHART_EPHEMERIS_PATH") or DEFAULT_TABLE_PATH)
+        with open(self.path, "rb") as table_file:
+            self._mm = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.start_jd, self.step_days, self.n_samples, n_bodies,
+         off_bodies, self._off_data) = HEADER.unpack_from(self._mm, 0)
+        if magic != TABLE_MAGIC:
+            raise ValueError(f"Not an ephemeris table: {self.path}")
+        self.body_ids = [BODY_ID.unpack_from(self._mm, off_bodies + BODY_ID.size * i)[0] for i in range(n_bodies)]
+        self._columns = {body_id: column for column, body_id in enumerate(self.body_ids)}
+        self._stride = SAMPLE.size * n_bodies
+        # Последний отсчет нужен только как правая точка интерполяции
+        self.end_jd = self.start_jd + (self.n_samples - 2) * self.step_days
+
+    def covers(self, jd, body_id):
+        return body_id in self._columns and self.start_jd <= jd <= self.end_jd
+
+    def position(self, jd, body_id):
+        """(долгота, скорость) тела на момент jd; None, если вне таблицы"""
+        if not self.covers(jd, body_id):
+            return None
+        offset = (jd - self.start_jd) / self.step_days
+        index = int(offset)
+        t = offset - index
+        base = self._off_data + index * self._stride + self._columns[body_id] * SAMPLE.size
+        lon0, speed0 = SAMPLE.unpack_from(self._mm, base)
+        lon1, speed1 = SAMPLE.unpack_from(self._mm, base + self._stride)
+        # Долгота непрерывна внутри шага: переход через 0/360 разворачиваем
+        lon1 = lon0 + (lon1 - lon0 + 180.0) % 360.0 - 180.0
+        value, derivative = _hermite(t, lon0, speed0 * self.step_days, lon1, speed1 * self.step_days)
+        return value % 360.0, derivative / self.step_days
+
+    def positions_many(self, jds, body_ids=None):
+        """
+        Векторный поиск: массивы (долготы, скорости) формы (len(jds), len(body_ids)).
+        Моменты вне таблицы дают NaN.
+        """
+        import numpy as np
+        body_ids = self.body_ids if body_ids is None else list(body_ids)
+        columns = np.array([self._columns[body_id] for body_id in body_ids])
+        data = np.frombuffer(self._mm, dtype='<f8', count=self.n_samples * len(self.body_ids) * 2,
+                             offset=self._off_data).reshape(self.n_samples, len(self.body_ids), 2)
+
+        jds = np.asarray(jds, dtype=np.float64)
+        inside = (jds >= self.start_jd) & (jds <= self.end_jd)
+        offset = np.where(inside, (jds - self.start_jd) / self.step_days, 0.0)
+        index = np.minimum(offset.astype(np.int64), self.n_samples - 2)
+        t = (offset - index)[:, None]
+
+        lon0 = data[index[:, None], columns[None, :], 0]
+        lon1 = data[index[:, None] + 1, columns[None, :], 0]
+        speed0 = data[index[:, None], columns[None, :], 1] * self.step_days
+        speed1 = data[index[:, None] + 1, columns[None, :], 1] * self.step_days
+        lon1 = lon0 + np.mod(lon1 - lon0 + 180.0, 360.0) - 180.0
+        value, derivative = _hermite(t, lon0, speed0, lon1, speed1)
+
+        longitudes = np.where(inside[:, None], np.mod(value, 360.0), np.nan)
+        speeds = np.where(inside[:, None], derivative / self.step_days, np.nan)
+        return longitudes, speeds
+
+
+_table = None
+
+
+def get_ephemeris_table():
+    """Общий экземпляр таблицы на процесс; None, если таблица не собрана"""
+    global _table
+    if _table is None:
+        try:
+            _table = EphemerisTable()
+        except (OSError, ValueError) as e:
+            from instrumentation import log
+            log("warning", "ephemeris_table_unavailable", error=str(e))
+            _table = False
+    return _table or None
+
+
+def verify(table, samples=20000, seed=0):
+    """
+    Сравнивает таблицу со swisseph в случайные моменты диапазона.
+    Ошибки долготы - в угловых секундах, скорости - в град/сутки.
+
+    Без файлов sepl_*.se1 swisseph (как и kerykeion) считает планеты по
+    Moshier, а у него в отдельные моменты бывают скачки на несколько
+    секунд (например, Нептун 1920-08-04 около 0h UT). Таблица там гладкая,
+    поэтому max - это редкие выбросы самого эталона; p99.9 - типичная точность.
+    """
+    import numpy as np
+    swe = _swisseph()
+    flags = swe.FLG_SWIEPH | swe.FLG_SPEED
+    rng = np.random.default_rng(seed)
+    jds = rng.uniform(table.start_jd, table.end_jd, samples)
+    longitudes, speeds = table.positions_many(jds)
+
+    names = {body_id: name for name, body_id in SLOW_BODIES}
+    report = {}
+    for column, body_id in enumerate(table.body_ids):
+        reference = np.array([swe.calc_ut(jd, body_id, flags)[0] for jd in jds])
+        lon_error = np.abs(np.mod(longitudes[:, column] - reference[:, 0] + 180.0, 360.0) - 180.0) * 3600
+        speed_error = np.abs(speeds[:, column] - reference[:, 3])
+        report[names.get(body_id, str(body_id))] = {
+            "max_arcsec": round(float(lon_error.max()), 4),
+            "p99_arcsec": round(float(np.percentile(lon_error, 99)), 4),
+            "p999_arcsec": round(float(np.percentile(lon_error, 99.9)), 4),
+            "mean_arcsec": round(float(lon_error.mean()), 5),
+            "max_speed_error": float(f"{speed_error.max():.3g}"),
+        }
+    return report
+
+
+def _get_option(args, name, default, cast):
+    if name not in args:
+        return default
+    return cast(args[args.index(name) + 1])
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] not in ("build", "verify", "lookup"):
+        print(__doc__, file=sys.stderr)
+        sys.exit(1)
+
+    if args[0] == "build":
+        stats = build_table(
+            _get_option(args, "--output", None, str),
+            _get_option(args, "--start-year", DEFAULT_START_YEAR, int),
+            _get_option(args, "--end-year", DEFAULT_END_YEAR, int),
+            _get_option(args, "--step-days", DEFAULT_STEP_DAYS, float),
+        )
+        print(f"✅ Ephemeris table built: {stats['samples']} samples x {len(stats['bodies'])} bodies", file=sys.stderr)
+        print(json.dumps(stats))
+        return
+
+    table = get_ephemeris_table()
+    if table is None:
+        sys.exit(1)
+
+    if args[0] == "verify":
+        report = verify(table, _get_option(args, "--samples", 20000, int))
+        worst = max(body["p999_arcsec"] for body in report.values())
+        print(f"✅ Ephemeris table p99.9 error: {worst} arcsec", file=sys.stderr)
+        print(json.dumps(report, indent=2))
+    else:
+        from aspect_engine import julian_day
+        jd, moment = julian_day(args[1], args[2] if len(args) > 2 else "12:00")
+        names = {body_id: name for name, body_id in SLOW_BODIES}
+        print(json.dumps({
+            "moment": moment,
+            "positions": {names.get(body_id, str(body_id)): [round(value, 6) for value in table.position(jd, body_id)]
+                          for body_id in table.body_ids},
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Структурированная телеметрия калькулятора натальных карт для Lunaria AI
+
+Этапы запроса замеряются спанами: with stage("subject"): ... - время
+(wall и CPU, мс), число вызовов и RSS процесса после этапа. События пишутся
+через log(level, event, **поля) одной JSON-строкой в stderr - вместо
+print с эмодзи, которые Node построчно пересылает в console.log.
+
+Уровень - NATAL_CHART_LOG_LEVEL или поле "log_level" запроса:
+    quiet    ничего (по умолчанию - для продакшена)
+    error    только ошибки
+    warning  ошибки и предупреждения
+    info     плюс одна строка "request" на запрос: команда, итог, этапы, пиковый RSS
+    debug    плюс все промежуточные события
+Поле "metrics": true возвращает ту же сводку в ответе (поле "metrics"),
+предупреждения запроса попадают в нее при любом уровне.
+
+Этапы: parse, import, geocode, subject, chart, translate, prompt, svg,
+svg_lookup, record, cache. Модуль - только стандартная библиотека: он загружается
+до проверки входа и не должен замедлять холодный старт.
+"""
+
+import json
+import os
+import sys
+import time
+
+LOG_LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40, "quiet": 100}
+DEFAULT_LOG_LEVEL = "quiet"
+# Предупреждений в сводке запроса не больше этого - сводка идет в ответ
+MAX_WARNINGS = 20
+
+_default_level = None
+_current = None
+_page_kb = None
+
+
+def default_log_level():
+    """Уровень из NATAL_CHART_LOG_LEVEL (неизвестное значение - quiet)"""
+    global _default_level
+    if _default_level is None:
+        name = os.environ.get("NATAL_CHART_LOG_LEVEL", DEFAULT_LOG_LEVEL)
+        _default_level = LOG_LEVELS.get(name, LOG_LEVELS[DEFAULT_LOG_LEVEL])
+    return _default_level
+
+
+def rss_kb():
+    """Текущий RSS процесса в КБ (/proc/self/statm; вне Linux - пиковый)"""
+    global _page_kb
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+        if _page_kb is None:
+            _page_kb = os.sysconf("SC_PAGE_SIZE") // 1024
+        return resident_pages * _page_kb
+    except (OSError, ValueError, IndexError, AttributeError):
+        return peak_rss_kb()
+
+
+def peak_rss_kb():
+    """Пиковый RSS процесса в КБ (у воркера пула - за все время жизни)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS отдает байты, Linux - килобайты
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _write(record):
+    try:
+        sys.stderr.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    except (OSError, ValueError):
+        pass
+
+
+class RequestMetrics:
+    """Замеры одного запроса: этапы, предупреждения, уровень логирования"""
+
+    def __init__(self, level=None):
+        self.level = LOG_LEVELS.get(level, default_log_level())
+        self.stages = {}
+        self.warnings = []
+        self._started = time.perf_counter()
+        self._started_cpu = time.process_time()
+
+    def add_stage(self, name, wall, cpu):
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = {"ms": 0.0, "cpu_ms": 0.0, "calls": 0}
+        entry["ms"] += wall * 1000
+        entry["cpu_ms"] += cpu * 1000
+        entry["calls"] += 1
+        entry["rss_kb"] = rss_kb()
+
+    def summary(self, **fields):
+        stages = {}
+        for name, entry in self.stages.items():
+            stage_summary = {"ms": round(entry["ms"], 3), "cpu_ms": round(entry["cpu_ms"], 3),
+                             "rss_kb": entry["rss_kb"]}
+            if entry["calls"] > 1:
+                stage_summary["calls"] = entry["calls"]
+            stages[name] = stage_summary
+        result = dict(fields)
+        result.update({
+            "total_ms": round((time.perf_counter() - self._started) * 1000, 3),
+            "cpu_ms": round((time.process_time() - self._started_cpu) * 1000, 3),
+            "stages": stages,
+            # ru_maxrss обновляется ядром не сразу - не меньше замеров этапов
+            "peak_rss_kb": max([peak_rss_kb() or 0] + [entry["rss_kb"] or 0 for entry in self.stages.values()]),
+        })
+        if self.warnings:
+            result["warnings"] = self.warnings
+        return result
+
+
+class _Stage:
+    __slots__ = ("name", "metrics", "started", "started_cpu")
+
+    def __init__(self, name, metrics):
+        self.name = name
+        self.metrics = metrics
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.started_cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.add_stage(self.name, time.perf_counter() - self.started,
+                               time.process_time() - self.started_cpu)
+        return False
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name):
+    """Спан этапа текущего запроса; вне запроса (бенчмарки, CLI) ничего не замеряет"""
+    if _current is None:
+        return _NO_STAGE
+    return _Stage(name, _current)
+
+
+def start_request(level=None):
+    """Начинает замеры нового запроса (один запрос на процесс в каждый момент)"""
+    global _current
+    _current = RequestMetrics(level)
+    return _current
+
+
+def set_request_log_level(level):
+    """Уровень из поля "log_level" - известен только после разбора входа"""
+    if _current is not None and level in LOG_LEVELS:
+        _current.level = LOG_LEVELS[level]
+
+
+def finish_request(**fields):
+    """Сводка запроса; на уровне info и ниже - одна JSON-строка "request" в stderr"""
+    global _current
+    metrics, _current = _current, None
+    if metrics is None:
+        return None
+    summary = metrics.summary(**fields)
+    if metrics.level <= LOG_LEVELS["info"]:
+        _write({"level": "info", "event": "request", **summary})
+    return summary
+
+
+def log(level, event, **fields):
+    """
+    Событие: JSON-строка {"level", "event", ...} в stderr, если уровень
+    достаточный. Предупреждения и ошибки запроса копятся и в его сводке.
+    """
+    level_value = LOG_LEVELS[level]
+    if _current is not None and level_value >= LOG_LEVELS["warning"] and len(_current.warnings) < MAX_WARNINGS:
+        _current.warnings.append({"level": level, "event": event, **fields})
+    threshold = _current.level if _current is not None else default_log_level()
+    if level_value >= threshold:
+        _write({"level": level, "event": event, **fields})
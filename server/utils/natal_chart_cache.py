@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Кэш результатов расчета натальных карт для Lunaria AI
+
+Результат calculate_natal_chart (ai_prompt + имя SVG) хранится в SQLite
+рядом с кэшем geonames в папке cache/. Ключ - хэш нормализованных входных
+данных рождения плюс версия kerykeion, система домов, язык и тема.
+Записи вытесняются по возрасту и по общему числу (LRU по last_access).
+
+В той же базе - записи карт (таблица records): компактная карта под
+chart_key ответа для transits/synastry и данные для отложенного SVG
+(render-svg). Они вытесняются по тем же правилам, что и результаты,
+поэтому данные рождения не копятся бессрочно; для устаревшего chart_key
+вызывающий передает долготы или "chart" из ответа расчета.
+
+Запуск как скрипта выводит статистику кэша:
+    python3 natal_chart_cache.py [stats|clear]
+"""
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+# Версия формата записи: увеличить, если меняется содержимое ai_prompt/результата
+CACHE_FORMAT_VERSION = 6
+
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parent.parent.parent / 'cache' / 'natal_chart_cache.sqlite'
+DEFAULT_MAX_ENTRIES = 50000
+DEFAULT_MAX_AGE_DAYS = 180
+
+# Поля, которые влияют на результат расчета
+INT_FIELDS = ['birth_year', 'birth_month', 'birth_day', 'birth_hour', 'birth_minute']
+TEXT_FIELDS = ['user_name', 'birth_city', 'birth_country_code', 'birth_tz']
+COORD_FIELDS = ['birth_lat', 'birth_lng']
+
+
+_kerykeion_version = None
+
+
+def _find_dist_info_version(package):
+    """Версия из имени папки <package>-<version>.dist-info в sys.path"""
+    prefix = f"{package}-"
+    for entry in sys.path:
+        try:
+            names = os.listdir(entry or ".")
+        except OSError:
+            continue
+        for name in names:
+            if name.startswith(prefix) and name.endswith(".dist-info"):
+                return name[len(prefix):-len(".dist-info")]
+    return None
+
+
+def get_kerykeion_version():
+    """
+    Версия kerykeion без импорта самой библиотеки.
+    Сначала по имени .dist-info (importlib.metadata стоит ~15 мс на холодном старте),
+    затем через importlib.metadata. Результат запоминается на процесс.
+    """
+    global _kerykeion_version
+    if _kerykeion_version is None:
+        version = _find_dist_info_version("kerykeion")
+        if version is None:
+            try:
+                from importlib.metadata import version as metadata_version
+                version = metadata_version("kerykeion")
+            except Exception:
+                version = "unknown"
+        _kerykeion_version = version
+    return _kerykeion_version
+
+
+def normalize_input(input_data, house_system="P", language="RU", theme="dark", variants=None, prompt=None):
+    """
+    Приводит входные данные к каноническому виду для вычисления ключа.
+    variants - ключи вариантов вывода ("RU:dark:P"), если запрос просит несколько;
+    prompt - формат и бюджет промта ("compact:600"), если не по умолчанию.
+    """
+    normalized = {
+        "format": CACHE_FORMAT_VERSION,
+        "kerykeion": get_kerykeion_version(),
+        "house_system": house_system,
+        "language": language,
+        "theme": theme,
+    }
+    if variants:
+        normalized["variants"] = list(variants)
+    if prompt:
+        normalized["prompt"] = prompt
+    for field in INT_FIELDS:
+        normalized[field] = int(input_data[field])
+    for field in TEXT_FIELDS:
+        value = input_data.get(field)
+        normalized[field] = None if value is None else str(value)
+    for field in COORD_FIELDS:
+        value = input_data.get(field)
+        # ~11 см точности достаточно, а "55.75" и 55.750000001 дают один ключ
+        normalized[field] = None if value is None else round(float(value), 6)
+    return normalized
+
+
+def make_cache_key(input_data, **context):
+    """SHA-256 от нормализованных входных данных"""
+    import hashlib
+    normalized = normalize_input(input_data, **context)
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class NatalChartCache:
+    """SQLite-кэш результатов с вытеснением по возрасту и размеру"""
+
+    def __init__(self, path=None, max_entries=None, max_age_days=None):
+        # sqlite3 импортируется здесь: модуль нужен и быстрому пути --version калькулятора
+        import sqlite3
+        self.path = Path(path or os.environ.get("NATAL_CHART_CACHE_PATH") or DEFAULT_CACHE_PATH)
+        self.max_entries = int(max_entries or os.environ.get("NATAL_CHART_CACHE_MAX_ENTRIES") or DEFAULT_MAX_ENTRIES)
+        max_age_days = max_age_days or os.environ.get("NATAL_CHART_CACHE_MAX_AGE_DAYS") or DEFAULT_MAX_AGE_DAYS
+        self.max_age_seconds = float(max_age_days) * 86400
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=5.0, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY,"
+            " result TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results(last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_created_at ON results(created_at)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            " key TEXT PRIMARY KEY,"
+            " record TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS records_last_access ON records(last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS records_created_at ON records(created_at)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def close(self):
+        self._conn.close()
+
+    def _bump(self, name, amount=1):
+        self._conn.execute(
+            "INSERT INTO stats(name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount)
+        )
+
+    def get(self, key, is_valid=None):
+        """
+        Возвращает сохраненный результат или None.
+        is_valid(result) позволяет отбросить запись, например если SVG-файл удален.
+        """
+        now = time.time()
+        row = self._conn.execute(
+            "SELECT result, created_at FROM results WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is not None and now - row[1] <= self.max_age_seconds:
+            result = json.loads(row[0])
+            if is_valid is None or is_valid(result):
+                self._conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+                self._bump("hits")
+                return result
+
+        if row is not None:
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            self._bump("evictions")
+        self._bump("misses")
+        return None
+
+    def put(self, key, result):
+        """Сохраняет результат и вытесняет устаревшие/лишние записи"""
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO results(key, result, created_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(result, ensure_ascii=False), now, now)
+        )
+        self.evict(now)
+
+    def update(self, key, changes):
+        """
+        Дополняет сохраненный результат (например, когда дорисован отложенный SVG):
+        changes - словарь полей верхнего уровня или функция, меняющая результат на месте.
+        """
+        row = self._conn.execute("SELECT result FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return False
+        result = json.loads(row[0])
+        if callable(changes):
+            changes(result)
+        else:
+            result.update(changes)
+        self._conn.execute(
+            "UPDATE results SET result = ? WHERE key = ?",
+            (json.dumps(result, ensure_ascii=False), key)
+        )
+        return True
+
+    def get_record(self, key):
+        """Запись карты по chart_key или None (устаревшая удаляется)"""
+        now = time.time()
+        row = self._conn.execute("SELECT record, created_at FROM records WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > self.max_age_seconds:
+            self._conn.execute("DELETE FROM records WHERE key = ?", (key,))
+            self._bump("evictions")
+            return None
+        self._conn.execute("UPDATE records SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put_record(self, key, record):
+        """Сохраняет запись карты (повторная запись не продлевает ее возраст) и вытесняет лишние"""
+        now = time.time()
+        self._conn.execute(
+            "INSERT INTO records(key, record, created_at, last_access) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET record = excluded.record, last_access = excluded.last_access",
+            (key, json.dumps(record, ensure_ascii=False), now, now)
+        )
+        self.evict(now)
+
+    def evict(self, now=None):
+        """
+        Удаляет результаты и записи карт старше max_age и самые давно
+        использованные сверх max_entries (в каждой таблице)
+        """
+        now = now or time.time()
+        removed = 0
+        for table in ("results", "records"):
+            removed += self._conn.execute(
+                f"DELETE FROM {table} WHERE created_at < ?", (now - self.max_age_seconds,)
+            ).rowcount
+            count = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            if count > self.max_entries:
+                removed += self._conn.execute(
+                    f"DELETE FROM {table} WHERE key IN ("
+                    f" SELECT key FROM {table} ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                ).rowcount
+        if removed:
+            self._bump("evictions", removed)
+        return removed
+
+    def clear(self):
+        self._conn.execute("DELETE FROM results")
+        self._conn.execute("DELETE FROM records")
+        self._conn.execute("DELETE FROM stats")
+
+    def stats(self):
+        """Счетчики попаданий/промахов и размер кэша"""
+        counters = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        lookups = hits + misses
+        return {
+            "path": str(self.path),
+            "entries": self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0],
+            "records": self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0],
+            "max_entries": self.max_entries,
+            "max_age_days": self.max_age_seconds / 86400,
+            "hits": hits,
+            "misses": misses,
+            "evictions": counters.get("evictions", 0),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "size_bytes": self.path.stat().st_size if self.path.exists() else 0,
+        }
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    cache = NatalChartCache()
+    if command == "clear":
+        cache.clear()
+        print("🧹 Natal chart cache cleared", file=sys.stderr)
+    elif command != "stats":
+        print(f"❌ Unknown command: {command}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(cache.stats(), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2042 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Интегрированный калькулятор натальных карт для Lunaria AI
+Версия для kerykeion 4.23.0 (последняя версия)
+Принимает JSON на stdin, возвращает JSON на stdout
+
+Режим воркера (--serve [--workers N]): процесс остается запущенным,
+читает NDJSON-запросы со stdin и пишет NDJSON-ответы в stdout по мере
+готовности (порядок ответов не гарантирован, связь по request_id).
+
+Пакетный режим (--batch [--workers N]): на stdin JSON-массив или NDJSON
+с входными объектами, расчет раздается по пулу процессов, на каждый вход
+в stdout выводится одна строка результата по мере готовности.
+
+Отложенный SVG ("svg_mode": "deferred"): ответ с ai_prompt возвращается
+сразу со "svg_status": "pending" и "chart_key", а карта рисуется потом -
+фоном в режиме воркера (--serve, придет отдельная строка с "event":
+"svg_ready") или по команде {"command": "render-svg", "chart_key": ...}
+при первом запросе картинки. Разовый процесс завершается сразу после
+ответа и SVG не рисует: Node (server/routes.ts) ждет закрытия процесса.
+Карта рисуется svg_chart_renderer.py: статичные части шаблона готовятся
+один раз на (тему, язык), на карту - только планеты, дома и аспекты.
+С "svg_output": "inline" SVG возвращается текстом в поле "svg" ответа,
+без записи файла в хранилище.
+
+Несколько вариантов из одного расчета ("variants": {"languages": ["RU", "EN"],
+"themes": ["dark", "light"], "house_systems": ["P", "W"]}): эфемериды
+считаются один раз, для другой системы домов - только куспиды, а на каждый
+вариант - перевод, промт и SVG. Ответ - словарь "variants" с ключами
+"язык:тема:система домов", верхний уровень ответа - первый вариант.
+
+Компактная карта: в ответе расчета "chart" - долготы, знаки, дома,
+ретроградность, куспиды и лунная фаза массивами фиксированного порядка
+(chart_payload.py), с "chart_binary": true еще и "chart_b64" - то же в
+двоичном виде. Ее можно передать в transits/synastry вместо данных
+рождения и в {"command": "prompt", "chart": ..., "language": "EN"} -
+промт заново без kerykeion.
+
+Формат промта ("prompt_format"): "full" - прежний подробный текст,
+"compact" - сжатые инструкции и таблица положений, "split" - инструкции
+отдельно в "ai_system_prompt" (общий для всех system-промт), в "ai_prompt"
+только данные. "prompt_token_budget": N убирает второстепенные части
+(лунная фаза, узлы, Лилит, Хирон, дома, высшие планеты) до укладки в
+бюджет, а если не уложились и без них - "prompt_over_budget": true. В ответе - оценка "prompt_tokens" (prompt_tokens.py, без сети),
+с "prompt_token_report": true - оценка для каждого формата.
+
+Транзиты ({"command": "transits", ...}): положения планет на день
+считаются один раз, аспекты к натальным долготам всех пользователей
+(natal_longitudes или chart из ответа расчета, chart_key) - одной
+операцией numpy в aspect_engine.py; с "days": N - на N дней подряд,
+медленные тела для всех дней - из таблицы эфемерид (ephemeris_table.py),
+если она собрана. Запись карты (в кэше результатов,
+вытесняется вместе с ним) сохраняется при каждом успешном расчете под
+chart_key из ответа.
+
+Синастрия ({"command": "synastry", "subject": ..., "partners": [...]}):
+матрица аспектов одного пользователя со всеми друзьями за один вызов и
+числовая оценка совместимости без обращения к LLM.
+
+Дедлайн ("deadline_ms": N - бюджет запроса в мс, request_deadline.py):
+этапы сверяются с остатком - SVG откладывается или пропускается, Geonames
+берется только из кэша ответов, а при разовом запуске по истечении срока
+сторож отдает уже готовый промт без SVG (или ошибку) и завершает процесс.
+Что деградировало - в списке "degraded" ответа.
+
+Пояс рождения: birth_tz из входа, иначе офлайн-индекс поясов по
+координатам (timezone_index.py), офлайн-геокодер или Geonames. Откуда он
+взят - в "tz_source" ответа; "fallback" значит, что индекса нет и взят
+прежний Europe/Moscow - вызывающему стоит передать birth_tz.
+
+Телеметрия (instrumentation.py): этапы запроса - спаны с временем и RSS,
+события - JSON-строки в stderr по уровню NATAL_CHART_LOG_LEVEL или
+"log_level" (по умолчанию quiet - stderr пуст); "metrics": true
+возвращает сводку этапов в ответе.
+
+Быстрый старт: на уровне модуля импортируется только json/sys/os,
+instrumentation и request_deadline (стандартная библиотека), а kerykeion
+и соседние модули - лишь после проверки входа. Поэтому
+невалидный запрос и служебные команды не платят за импорт kerykeion:
+    --version   версии kerykeion (без импорта), Python и формата кэша
+    --check     разбирает и проверяет вход, ничего не рассчитывая
+Замер холодного старта и разбивка времени импорта по модулям:
+benchmarks/bench_cold_start.py.
+"""
+
+import json
+import sys
+import os
+
+# Соседние модули (кэш и т.п.) лежат рядом со скриптом
+UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+if UTILS_DIR not in sys.path:
+    sys.path.insert(0, UTILS_DIR)
+
+# Телеметрия нужна с первого этапа (разбор входа); модуль - только стандартная библиотека
+from instrumentation import finish_request, log, set_request_log_level, stage, start_request
+from request_deadline import clear_deadline, current_deadline, deadline_option, start_deadline
+
+
+def get_svg_store():
+    """Хранилище SVG-карт в server/public/natal-charts (имена по SHA-256 содержимого)"""
+    from svg_artifact_store import SvgArtifactStore
+    return SvgArtifactStore()
+
+SVG_MODES = ("sync", "deferred", "none")
+# "file" - SVG в хранилище, в ответе svg_name; "inline" - текст SVG в поле "svg"
+SVG_OUTPUTS = ("file", "inline")
+
+# Варианты вывода из одного расчета: "variants": {"languages", "themes", "house_systems"}
+VARIANT_LANGUAGES = ("RU", "EN")
+VARIANT_THEMES = ("dark", "light", "dark-high-contrast", "classic")
+# HousesSystemIdentifier kerykeion - списком, чтобы --check не импортировал kerykeion
+HOUSE_SYSTEMS = ("A", "B", "C", "D", "F", "H", "I", "i", "K", "L", "M", "N", "O",
+                 "P", "Q", "R", "S", "T", "U", "V", "W", "X", "Y")
+# (язык, тема, система домов) ответа без поля "variants"
+DEFAULT_VARIANT = ("RU", "dark", "P")
+MAX_VARIANTS = 32
+# Транзиты за период ("days") - не больше года за запрос
+MAX_TRANSIT_DAYS = 366
+
+# Geonames: та же учетная запись, что раньше передавалась в kerykeion; сеть - не дольше таймаута
+GEONAMES_USERNAME = "deathdaycome"
+GEONAMES_TIMEOUT_S = 10.0
+# Дедлайн ("deadline_ms"): запас под этапы после текущего, мс
+DEADLINE_SVG_RESERVE_MS = 30
+DEADLINE_SUBJECT_RESERVE_MS = 50
+# Меньше этого на сеть - Geonames только из кэша ответов
+DEADLINE_GEONAMES_MIN_MS = 250
+HEX_DIGITS = "0123456789abcdef"
+
+
+def validate_chart_key(chart_key):
+    # Ключ - SHA-256 в hex; проверка без re, чтобы --check не тянул лишнего
+    if not isinstance(chart_key, str) or len(chart_key) != 64 or chart_key.strip(HEX_DIGITS):
+        raise ValueError(f"Invalid chart_key: {chart_key!r}")
+
+
+def load_chart_record(chart_key, cache=None):
+    """
+    Запись карты: {"chart": ..., "svg_name": ...[, "subject": модель AstrologicalSubject]} или None.
+    Записи лежат в кэше результатов (natal_chart_cache.py) и вытесняются вместе с ним;
+    cache - уже открытый NatalChartCache, чтобы не открывать базу на каждую карту.
+    """
+    validate_chart_key(chart_key)
+    if cache is not None:
+        return cache.get_record(chart_key)
+    from natal_chart_cache import NatalChartCache
+    cache = NatalChartCache()
+    try:
+        return cache.get_record(chart_key)
+    finally:
+        cache.close()
+
+
+def save_chart_record(chart_key, record):
+    """Сохраняет запись карты в кэше результатов"""
+    validate_chart_key(chart_key)
+    from natal_chart_cache import NatalChartCache
+    cache = NatalChartCache()
+    try:
+        cache.put_record(chart_key, record)
+    finally:
+        cache.close()
+
+
+def render_chart_svg_text(subject, theme="dark", language="RU"):
+    """
+    SVG-карта (по умолчанию темная тема, RU) строкой. Быстрый рендерер с кэшем
+    шаблона; если он не справился (например, другой шаблон в новой версии
+    kerykeion) - полная отрисовка через KerykeionChartSVG.makeTemplate() с тем же результатом.
+    """
+    try:
+        from svg_chart_renderer import render_natal_svg
+        return render_natal_svg(subject, theme=theme, language=language)
+    except Exception as render_error:
+        log("warning", "svg_renderer_fallback", error=str(render_error))
+
+    from kerykeion import KerykeionChartSVG
+    natal_chart = KerykeionChartSVG(
+        subject,
+        theme=theme,
+        chart_language=language
+    )
+    # makeTemplate возвращает строку без записи файла - имя знаем сразу, без поиска в папке
+    return natal_chart.makeTemplate()
+
+
+def render_chart_svg(subject, theme="dark", language="RU"):
+    """Рисует SVG-карту и кладет в хранилище; возвращает имя файла"""
+    return get_svg_store().put(render_chart_svg_text(subject, theme, language))
+
+
+def read_stored_svg(svg_name):
+    """Текст SVG из хранилища (для "svg_output": "inline" при попадании в кэш)"""
+    with open(get_svg_store().path_for(svg_name), encoding="utf-8") as svg_file:
+        return svg_file.read()
+
+
+def render_pending_svg(chart_key):
+    """
+    Дорисовывает SVG для карты, рассчитанной в режиме "deferred".
+    Повторный вызов для уже нарисованной карты просто возвращает имя файла.
+    """
+    record = load_chart_record(chart_key)
+    if record is None:
+        return {"success": False, "error": f"Unknown chart_key: {chart_key}",
+                "chart_key": chart_key, "svg_name": None, "svg_status": "failed"}
+
+    svg_store = get_svg_store()
+    if record.get("svg_name") and svg_store.touch(record["svg_name"]):
+        return {"success": True, "chart_key": chart_key, "svg_name": record["svg_name"], "svg_status": "ready"}
+    if "subject" not in record:
+        # Карта считалась без отложенного SVG - рисовать не из чего
+        return {"success": False, "error": f"No deferred SVG for chart_key: {chart_key}",
+                "chart_key": chart_key, "svg_name": None, "svg_status": "failed"}
+
+    try:
+        from kerykeion.kr_types.kr_models import AstrologicalSubjectModel
+        subject = AstrologicalSubjectModel.model_validate(record["subject"])
+        with stage("svg"):
+            svg_name = render_chart_svg(subject)
+    except Exception as svg_error:
+        log("warning", "svg_deferred_failed", chart_key=chart_key, error=str(svg_error))
+        return {"success": False, "error": f"SVG generation failed: {svg_error}",
+                "chart_key": chart_key, "svg_name": None, "svg_status": "failed"}
+
+    record["svg_name"] = svg_name
+    save_chart_record(chart_key, record)
+
+    # Обновляем кэш результатов, чтобы следующие запросы сразу получили готовый SVG
+    try:
+        from natal_chart_cache import NatalChartCache
+        cache = NatalChartCache()
+        try:
+            cache.update(chart_key, lambda result: mark_pending_svg(result, svg_name, "ready"))
+        finally:
+            cache.close()
+    except Exception as cache_error:
+        log("warning", "cache_update_failed", chart_key=chart_key, error=str(cache_error))
+
+    log("debug", "svg_deferred_stored", svg_name=svg_name)
+    return {"success": True, "chart_key": chart_key, "svg_name": svg_name, "svg_status": "ready"}
+
+
+def resolve_timezone(lat, lng):
+    """
+    IANA-пояс по координатам из офлайн-индекса (cache/timezone_grid.idx):
+    (пояс, "timezone_index"). Без индекса остается прежнее поведение -
+    ("Europe/Moscow", "fallback"); источник попадает в "tz_source" ответа.
+    """
+    try:
+        from timezone_index import lookup_timezone
+        tz_str = lookup_timezone(lat, lng)
+        if tz_str:
+            log("debug", "timezone_resolved", tz=tz_str)
+            return tz_str, "timezone_index"
+    except Exception as tz_error:
+        log("warning", "timezone_index_error", error=str(tz_error))
+    log("warning", "timezone_fallback", tz="Europe/Moscow")
+    return "Europe/Moscow", "fallback"
+
+def clean_unicode_data(data):
+    """Очищает данные от проблемных Unicode символов и несериализуемых объектов"""
+    import re
+    if data is None:
+        return None
+    elif isinstance(data, str):
+        # Удаляем суррогатные пары и проблемные символы
+        cleaned = re.sub(r'[\udc00-\udfff]', '', data)
+        cleaned = re.sub(r'[\ud800-\udbff]', '', cleaned) 
+        return cleaned
+    elif isinstance(data, os.PathLike):
+        # Конвертируем Path объекты в строки
+        return str(data)
+    elif isinstance(data, dict):
+        try:
+            return {str(key): clean_unicode_data(value) for key, value in data.items()}
+        except Exception as e:
+            log("warning", "clean_unicode_failed", type="dict", error=str(e))
+            return str(data)
+    elif isinstance(data, (list, tuple)):
+        try:
+            return [clean_unicode_data(item) for item in data]
+        except Exception as e:
+            log("warning", "clean_unicode_failed", type="list", error=str(e))
+            return str(data)
+    elif isinstance(data, (int, float, bool)):
+        return data
+    elif hasattr(data, '__dict__'):
+        # Для объектов с атрибутами - конвертируем в словарь
+        try:
+            obj_dict = {}
+            for attr_name in dir(data):
+                if not attr_name.startswith('_'):  # Пропускаем приватные атрибуты
+                    try:
+                        attr_value = getattr(data, attr_name)
+                        if not callable(attr_value):  # Пропускаем методы
+                            obj_dict[attr_name] = clean_unicode_data(attr_value)
+                    except Exception:
+                        continue
+            return obj_dict
+        except Exception as e:
+            log("warning", "clean_unicode_failed", type="object", error=str(e))
+            return str(data)
+    else:
+        # Для всех остальных типов - конвертируем в строку
+        try:
+            return str(data)
+        except Exception:
+            return "non-serializable-object"
+
+# Управляющие символы C0/C1, которые вырезаются из входа перед json.loads
+_CONTROL_CHARS = dict.fromkeys([*range(0x00, 0x20), *range(0x7f, 0xa0)])
+
+
+def safe_json_parse(input_text):
+    """Устойчивый парсер JSON"""
+    if not input_text or not input_text.strip():
+        raise ValueError("Empty input")
+    
+    # Удаляем все возможные проблемные символы
+    cleaned = input_text.strip()
+    cleaned = cleaned.lstrip('\ufeff\ufffe\x00')
+    cleaned = cleaned.translate(_CONTROL_CHARS)
+    
+    try:
+        return json.loads(cleaned)
+    except json.JSONDecodeError as e:
+        log("debug", "json_parse_failed", error=str(e), head=cleaned[:150])
+        raise ValueError(f"Could not parse JSON: {cleaned[:100]}")
+
+# Словари для перевода (точно как в версии заказчиков) - строятся один раз при импорте
+SIGN_TRANSLATION = {
+    "Ari": "Овен", "Tau": "Телец", "Gem": "Близнецы", "Can": "Рак",
+    "Leo": "Лев", "Vir": "Дева", "Lib": "Весы", "Sco": "Скорпион",
+    "Sag": "Стрелец", "Cap": "Козерог", "Aqu": "Водолей", "Pis": "Рыбы"
+}
+
+HOUSE_TRANSLATION = {
+    "First_House": "Первый дом",
+    "Second_House": "Второй дом",
+    "Third_House": "Третий дом",
+    "Fourth_House": "Четвертый дом",
+    "Fifth_House": "Пятый дом",
+    "Sixth_House": "Шестой дом",
+    "Seventh_House": "Седьмой дом",
+    "Eighth_House": "Восьмой дом",
+    "Ninth_House": "Девятый дом",
+    "Tenth_House": "Десятый дом",
+    "Eleventh_House": "Одиннадцатый дом",
+    "Twelfth_House": "Двенадцатый дом"
+}
+
+PLANET_TRANSLATION = {
+    "Sun": "Солнце", "Moon": "Луна", "Mercury": "Меркурий",
+    "Venus": "Венера", "Mars": "Марс", "Jupiter": "Юпитер",
+    "Saturn": "Сатурн", "Uranus": "Уран", "Neptune": "Нептун",
+    "Pluto": "Плутон", "Chiron": "Хирон", "Mean_Lilith": "Черная Луна (Лилит)",
+    "Ascendant": "Асцендент", "Descendant": "Десцендент",
+    "Medium_Coeli": "Середина неба", "Imum_Coeli": "Глубина неба",
+    "Mean_Node": "Восходящий узел (Раху)", "True_Node": "Восходящий узел (истинный)",
+    "Mean_South_Node": "Нисходящий узел (Кету)", "True_South_Node": "Нисходящий узел (истинный)"
+}
+
+MOON_PHASE_TRANSLATION = {
+    "Waxing Crescent": "Растущий серп", "First Quarter": "Первая четверть",
+    "Waxing Gibbous": "Растущая луна", "Full Moon": "Полнолуние",
+    "Waning Gibbous": "Убывающая луна", "Last Quarter": "Последняя четверть",
+    "Waning Crescent": "Убывающий серп", "New Moon": "Новолуние"
+}
+
+PROMPT_PLANET_KEYS = (
+    'sun', 'moon', 'mercury', 'venus', 'mars', 'jupiter',
+    'saturn', 'uranus', 'neptune', 'pluto', 'chiron', 'mean_lilith',
+    'mean_node', 'true_node'
+)
+
+PROMPT_HOUSE_KEYS = (
+    'first_house', 'second_house', 'third_house', 'fourth_house',
+    'fifth_house', 'sixth_house', 'seventh_house', 'eighth_house',
+    'ninth_house', 'tenth_house', 'eleventh_house', 'twelfth_house'
+)
+
+PROMPT_HOUSE_NUMBERS = {house: number for number, house in enumerate(HOUSE_TRANSLATION, start=1)}
+
+# "prompt_format": "full" - подробный текст (по умолчанию); "compact" - сжатые инструкции и
+# таблица положений; "split" - те же инструкции отдельно в "ai_system_prompt" (одинаковы для
+# всех карт - годятся для кэша промтов у провайдера), а в "ai_prompt" только данные карты
+PROMPT_FORMATS = ("full", "compact", "split")
+# Что убирается из данных при превышении "prompt_token_budget" - по порядку
+PROMPT_DROP_ORDER = ("lunar_phase", "true_node", "mean_lilith", "chiron", "houses", "pluto", "neptune", "uranus")
+
+PROMPT_INTRO = (
+    'Представь, что ты опытный астролог, специализирующийся на составлении и анализе натальных карт.\n'
+    'Ты помогаешь пользователям понять, как положение планет в момент их рождения влияет на их характер, \n'
+    'внутренние возможности и жизненные события. Ты способствуешь осознанию того, какие черты и тенденции \n'
+    'они могут развивать, и как их природные дары могут быть использованы для достижения целей. \n'
+    'Сделай подробный анализ по всем аспектам. Данные пользователя:  \n'
+)
+
+PROMPT_PLANETS_HEADER = (
+    'Проведи подробный анализ сначала положения планеты, а затем нахождение планеты в доме. '
+    'Приведи минимум 5 пунктов для положения планеты и минимум 5 пунктов для дома планеты: \n'
+)
+
+PROMPT_HOUSES_HEADER = '\nПроведи подробный анализ домов. Опиши минимум в 8 предложениях каждый дом:\n'
+
+PROMPT_CONCLUSION = (
+    '\nСделай вывод и дай рекомендации по результатам составленной натальной карты и проведенного анализа. '
+    'Не задавай вопросов. Учти следующие особенности:\n'
+    '- Анализируй ретроградность планет там, где она присутствует\n'
+    '- Учитывай стихии (огонь, земля, воздух, вода) и качества (кардинальный, фиксированный, мутабельный)\n'
+    '- Проанализируй взаимодействие домов и планет\n'
+    '- Укажи на сильные и слабые позиции в карте\n'
+    '- Дай практические рекомендации по использованию выявленных потенциалов'
+)
+
+# Английский промт - для вариантов с "languages": ["EN"] (см. requested_variants)
+EN_SIGN_TRANSLATION = {
+    "Ari": "Aries", "Tau": "Taurus", "Gem": "Gemini", "Can": "Cancer",
+    "Leo": "Leo", "Vir": "Virgo", "Lib": "Libra", "Sco": "Scorpio",
+    "Sag": "Sagittarius", "Cap": "Capricorn", "Aqu": "Aquarius", "Pis": "Pisces"
+}
+
+EN_HOUSE_TRANSLATION = {house: house.replace("_", " ") for house in HOUSE_TRANSLATION}
+
+EN_PLANET_TRANSLATION = {
+    "Mean_Lilith": "Black Moon Lilith", "Medium_Coeli": "Midheaven", "Imum_Coeli": "Imum Coeli",
+    "Mean_Node": "North Node (mean)", "True_Node": "North Node (true)",
+    "Mean_South_Node": "South Node (mean)", "True_South_Node": "South Node (true)"
+}
+
+PROMPT_LANGUAGES = {
+    "RU": {
+        "signs": SIGN_TRANSLATION,
+        "houses": HOUSE_TRANSLATION,
+        "planets": PLANET_TRANSLATION,
+        "moon_phases": MOON_PHASE_TRANSLATION,
+        "intro": PROMPT_INTRO,
+        "name": "Имя",
+        "birth_place": "Место рождения",
+        "birth_datetime": "Дата и время рождения",
+        "sun_sign": "Знак зодиака",
+        "ascendant_header": 'Проведи подробный анализ асцендента: \n',
+        "ascendant": "Асцендент",
+        "medium_coeli_header": 'Проведи подробный анализ середины неба (MC):\n',
+        "medium_coeli": "Середина неба (MC)",
+        "planets_header": PROMPT_PLANETS_HEADER,
+        "in_house": "в",
+        "houses_header": PROMPT_HOUSES_HEADER,
+        "lunar_phase": "Лунная фаза",
+        "conclusion": PROMPT_CONCLUSION,
+        # Сжатые инструкции для "compact"/"split": вступление и пункты (тег PROMPT_DROP_ORDER
+        # или None, строка) - пункт про убранную часть данных выпадает, номера идут по оставшимся
+        "compact_intro": 'Ты опытный астролог. Сделай подробный анализ натальной карты пользователя, не задавая вопросов:\n',
+        "compact_instructions": (
+            (None, 'Асцендент и середина неба (MC).\n'),
+            (None, 'Каждая планета: минимум 5 пунктов о знаке и 5 пунктов о доме; R - ретроградная.\n'),
+            ("houses", 'Каждый дом: минимум 8 предложений.\n'),
+            (None, 'Вывод и практические рекомендации: стихии и качества, взаимодействие домов и планет, '
+                   'сильные и слабые позиции.\n'),
+        ),
+        "planets_table": "Планета | Знак | Градус | Дом",
+        "houses_table": "Дом | Знак | Градус",
+    },
+    "EN": {
+        "signs": EN_SIGN_TRANSLATION,
+        "houses": EN_HOUSE_TRANSLATION,
+        "planets": EN_PLANET_TRANSLATION,
+        "moon_phases": {},
+        "intro": (
+            'Imagine you are an experienced astrologer who specializes in drawing up and analyzing natal charts.\n'
+            'You help users understand how the positions of the planets at the moment of their birth shape their character, \n'
+            'inner potential and life events. You help them see which traits and tendencies \n'
+            'they can develop and how their natural gifts can be used to reach their goals. \n'
+            'Give a detailed analysis of every aspect. User data:  \n'
+        ),
+        "name": "Name",
+        "birth_place": "Place of birth",
+        "birth_datetime": "Date and time of birth",
+        "sun_sign": "Zodiac sign",
+        "ascendant_header": 'Give a detailed analysis of the ascendant: \n',
+        "ascendant": "Ascendant",
+        "medium_coeli_header": 'Give a detailed analysis of the Midheaven (MC):\n',
+        "medium_coeli": "Midheaven (MC)",
+        "planets_header": (
+            'Give a detailed analysis of each planet\'s sign position first, and then of the planet\'s house. '
+            'List at least 5 points for the planet\'s position and at least 5 points for the planet\'s house: \n'
+        ),
+        "in_house": "in the",
+        "houses_header": '\nGive a detailed analysis of the houses. Describe each house in at least 8 sentences:\n',
+        "lunar_phase": "Lunar phase",
+        "conclusion": (
+            '\nDraw conclusions and give recommendations based on the natal chart and the analysis. '
+            'Do not ask questions. Take the following into account:\n'
+            '- Analyze planetary retrogrades where present\n'
+            '- Consider the elements (fire, earth, air, water) and modalities (cardinal, fixed, mutable)\n'
+            '- Analyze how the houses and planets interact\n'
+            '- Point out the strong and weak positions in the chart\n'
+            '- Give practical recommendations on using the potential revealed'
+        ),
+        "compact_intro": ('You are an experienced astrologer. Give a detailed analysis of the user\'s natal chart '
+                          'without asking questions:\n'),
+        "compact_instructions": (
+            (None, 'Ascendant and Midheaven (MC).\n'),
+            (None, 'Each planet: at least 5 points on its sign and 5 points on its house; R - retrograde.\n'),
+            ("houses", 'Each house: at least 8 sentences.\n'),
+            (None, 'Conclusion and practical recommendations: elements and modalities, how houses and planets '
+                   'interact, strong and weak positions.\n'),
+        ),
+        "planets_table": "Planet | Sign | Degree | House",
+        "houses_table": "House | Sign | Degree",
+    },
+}
+
+# Суррогаты могут прийти только из пользовательских строк (имя, город) - чистим их, а не весь промт
+_surrogates_re = None
+
+
+def _clean_text(value):
+    global _surrogates_re
+    if _surrogates_re is None:
+        import re
+        _surrogates_re = re.compile(r'[\ud800-\udfff]')
+    return _surrogates_re.sub('', str(value))
+
+
+def format_dms(decimal_deg):
+    """Градусы в формате 15° 22' 43''"""
+    degrees = int(decimal_deg)
+    minutes_full = (decimal_deg - degrees) * 60
+    minutes = int(minutes_full)
+    seconds = round((minutes_full - minutes) * 60)
+    return f"{degrees}° {minutes}' {seconds}''"
+
+
+def format_dm(decimal_deg):
+    """Градусы в формате 15°23' (для таблиц компактного промта)"""
+    minutes = int(round(decimal_deg * 60))
+    return f"{minutes // 60}°{minutes % 60:02d}'"
+
+
+def translate_natal_chart(subject, language="RU"):
+    """
+    Переводит натальную карту на язык промта (по умолчанию русский).
+    Читает атрибуты точек прямо из subject (AstrologicalSubject или его модели)
+    и возвращает только то, что нужно промту. Планеты - кортежи
+    (ключ, название, знак, градус в знаке, дом, номер дома, ретроградность).
+    """
+    tables = PROMPT_LANGUAGES[language]
+    sign_names = tables["signs"]
+    house_names = tables["houses"]
+    planet_names = tables["planets"]
+
+    def sign(point):
+        return sign_names.get(point.sign, point.sign)
+
+    planets = []
+    for key in PROMPT_PLANET_KEYS:
+        point = getattr(subject, key, None)
+        if point:
+            planets.append((key, planet_names.get(point.name, point.name), sign(point), point.position,
+                            house_names.get(point.house, point.house), PROMPT_HOUSE_NUMBERS.get(point.house),
+                            bool(point.retrograde)))
+
+    houses = []
+    for key in PROMPT_HOUSE_KEYS:
+        point = getattr(subject, key, None)
+        if point:
+            houses.append((house_names.get(point.name, point.name), sign(point), point.position))
+
+    lunar_phase = getattr(subject, 'lunar_phase', None)
+    if lunar_phase:
+        phase_name = lunar_phase.moon_phase_name
+        lunar_phase = (tables["moon_phases"].get(phase_name, phase_name), lunar_phase.moon_emoji)
+
+    return {
+        "name": _clean_text(subject.name),
+        "city": _clean_text(subject.city),
+        "nation": _clean_text(subject.nation),
+        "datetime": subject.iso_formatted_local_datetime,
+        "sun_sign": sign(subject.sun),
+        "ascendant": (sign(subject.ascendant), subject.ascendant.position),
+        "medium_coeli": (sign(subject.medium_coeli), subject.medium_coeli.position),
+        "planets": planets,
+        "houses": houses,
+        "lunar_phase": lunar_phase,
+    }
+
+
+def _full_prompt_sections(translated_data, texts):
+    asc_sign, asc_position = translated_data['ascendant']
+    mc_sign, mc_position = translated_data['medium_coeli']
+
+    intro = "".join([
+        texts["intro"],
+        f"{texts['name']}: {translated_data['name']}\n",
+        f"{texts['birth_place']}: {translated_data['city']}, {translated_data['nation']}\n",
+        f"{texts['birth_datetime']}: {translated_data['datetime']}\n\n",
+        f"{texts['sun_sign']}: {translated_data['sun_sign']}\n\n",
+        texts["ascendant_header"],
+        f"{texts['ascendant']}: {asc_sign} ({format_dms(asc_position)})\n\n",
+        texts["medium_coeli_header"],
+        f"{texts['medium_coeli']}: {mc_sign} ({format_dms(mc_position)})\n\n",
+        texts["planets_header"],
+    ])
+    sections = [(None, intro)]
+    in_house = texts["in_house"]
+    for key, name, sign, position, house, _, _ in translated_data['planets']:
+        sections.append((key, f"{name}: {sign} ({format_dms(position)}) {in_house} {house}\n"))
+
+    sections.append(("houses", texts["houses_header"]))
+    for name, sign, position in translated_data['houses']:
+        sections.append(("houses", f"{name}: {sign} ({format_dms(position)})\n"))
+
+    if translated_data['lunar_phase']:
+        phase_name, phase_emoji = translated_data['lunar_phase']
+        sections.append(("lunar_phase", f"\n{texts['lunar_phase']}: {phase_name} {phase_emoji}\n"))
+
+    sections.append((None, texts["conclusion"]))
+    return sections
+
+
+def _compact_data_sections(translated_data, texts):
+    asc_sign, asc_position = translated_data['ascendant']
+    mc_sign, mc_position = translated_data['medium_coeli']
+
+    header = "".join([
+        f"{texts['name']}: {translated_data['name']}\n",
+        f"{texts['birth_place']}: {translated_data['city']}, {translated_data['nation']}\n",
+        f"{texts['birth_datetime']}: {translated_data['datetime']}\n",
+        f"{texts['sun_sign']}: {translated_data['sun_sign']}\n",
+        f"{texts['ascendant']}: {asc_sign} {format_dm(asc_position)}\n",
+        f"{texts['medium_coeli']}: {mc_sign} {format_dm(mc_position)}\n",
+        f"{texts['planets_table']}\n",
+    ])
+    sections = [(None, header)]
+    for key, name, sign, position, _, house_number, retrograde in translated_data['planets']:
+        sections.append((key, f"{name} | {sign} | {format_dm(position)}{'R' if retrograde else ''} | {house_number}\n"))
+
+    sections.append(("houses", f"{texts['houses_table']}\n"))
+    for number, (_, sign, position) in enumerate(translated_data['houses'], start=1):
+        sections.append(("houses", f"{number} | {sign} | {format_dm(position)}\n"))
+
+    if translated_data['lunar_phase']:
+        phase_name, phase_emoji = translated_data['lunar_phase']
+        sections.append(("lunar_phase", f"{texts['lunar_phase']}: {phase_name} {phase_emoji}\n"))
+    return sections
+
+
+def _compact_instructions(texts, dropped=()):
+    """Сжатые инструкции без пунктов про убранные части данных, с номерами по оставшимся"""
+    items = [line for tag, line in texts["compact_instructions"] if tag not in dropped]
+    return texts["compact_intro"] + "".join(f"{number}. {line}" for number, line in enumerate(items, start=1))
+
+
+def prompt_sections(translated_data, language="RU", prompt_format="full", dropped=()):
+    """
+    Промт по частям: (system-сообщение или None, [(тег, текст), ...]) без частей
+    с тегами dropped (из PROMPT_DROP_ORDER). Инструкции "compact"/"split" не
+    просят анализа убранных данных.
+    """
+    texts = PROMPT_LANGUAGES[language]
+    if prompt_format == "full":
+        sections = _full_prompt_sections(translated_data, texts)
+    else:
+        sections = _compact_data_sections(translated_data, texts)
+    if dropped:
+        sections = [section for section in sections if section[0] not in dropped]
+    if prompt_format == "full":
+        return None, sections
+    if prompt_format == "split":
+        # Для полных данных system-сообщение одинаково для всех карт
+        return _compact_instructions(texts, dropped), sections
+    return None, [(None, _compact_instructions(texts, dropped))] + sections
+
+
+def format_natal_chart_ai(translated_data, language="RU"):
+    """Форматирует переведенную натальную карту в текстовый вид для ИИ (один проход, join)"""
+    return "".join(text for _, text in prompt_sections(translated_data, language)[1])
+
+
+def format_prompt(translated_data, language="RU", prompt_format="full", token_budget=None):
+    """
+    Промт в выбранном формате с оценкой токенов (prompt_tokens.py):
+    {"ai_prompt", "prompt_tokens"[, "ai_system_prompt"][, "prompt_truncated"][, "prompt_over_budget"]}.
+    Если оценка больше token_budget, части убираются по PROMPT_DROP_ORDER;
+    убранные теги - в "prompt_truncated". Если не уложились и без них -
+    "prompt_over_budget": true (оценка - в "prompt_tokens").
+    """
+    from prompt_tokens import estimate_tokens
+
+    def build(dropped):
+        system_prompt, sections = prompt_sections(translated_data, language, prompt_format, dropped)
+        prompt = "".join(text for _, text in sections)
+        tokens = (estimate_tokens(system_prompt) if system_prompt else 0) + estimate_tokens(prompt)
+        return system_prompt, sections, prompt, tokens
+
+    dropped = []
+    system_prompt, sections, prompt, tokens = build(dropped)
+    if token_budget is not None:
+        for tag in PROMPT_DROP_ORDER:
+            if tokens <= token_budget:
+                break
+            if not any(section_tag == tag for section_tag, _ in sections):
+                continue
+            dropped.append(tag)
+            system_prompt, sections, prompt, tokens = build(dropped)
+
+    result = {"ai_prompt": prompt, "prompt_tokens": tokens}
+    if system_prompt:
+        result["ai_system_prompt"] = system_prompt
+    if dropped:
+        result["prompt_truncated"] = dropped
+    if token_budget is not None and tokens > token_budget:
+        log("warning", "prompt_over_budget", prompt_format=prompt_format, tokens=tokens, budget=token_budget)
+        result["prompt_over_budget"] = True
+    return result
+
+
+def prompt_options(input_data):
+    """("prompt_format", "prompt_token_budget") запроса с проверкой"""
+    prompt_format = input_data.get("prompt_format", "full")
+    if prompt_format not in PROMPT_FORMATS:
+        raise ValueError(f"Unknown prompt_format: {prompt_format}. Expected one of {list(PROMPT_FORMATS)}")
+    token_budget = input_data.get("prompt_token_budget")
+    if token_budget is not None and (isinstance(token_budget, bool) or not isinstance(token_budget, int)
+                                     or token_budget <= 0):
+        raise ValueError("Field 'prompt_token_budget' must be a positive integer")
+    return prompt_format, token_budget
+
+
+def prompt_cache_context(input_data):
+    """Формат промта для ключа кэша: запросы по умолчанию сохраняют прежний ключ"""
+    prompt_format, token_budget = prompt_options(input_data)
+    if (prompt_format, token_budget) == ("full", None):
+        return {}
+    return {"prompt": f"{prompt_format}:{token_budget}"}
+
+
+def prompt_token_report(subject, language="RU"):
+    """Оценка токенов промта для каждого формата (system + user) - чтобы выбрать самый дешевый"""
+    translated_data = translate_natal_chart(subject, language)
+    return {prompt_format: format_prompt(translated_data, language, prompt_format)["prompt_tokens"]
+            for prompt_format in PROMPT_FORMATS}
+
+
+def build_ai_prompt(subject, language="RU"):
+    """Промт для ИИ из рассчитанного subject"""
+    return format_natal_chart_ai(translate_natal_chart(subject, language), language)
+
+
+def fetch_geonames_location(city, nation, timeout=GEONAMES_TIMEOUT_S):
+    """
+    Координаты и пояс города из Geonames: те же запросы, что FetchGeonames в
+    kerykeion, и тот же кэш ответов (cache/kerykeion_geonames_cache.sqlite),
+    но сеть - не дольше timeout секунд на оба запроса. timeout=None - без
+    сети, только кэш, включая просроченные ответы (город не переезжает).
+    Возвращает {"lat", "lng", "tz", "nation"} или None.
+    """
+    import time
+    from datetime import timedelta
+    from requests import Request
+    from requests_cache import CachedSession
+
+    session = CachedSession(cache_name="cache/kerykeion_geonames_cache", backend="sqlite",
+                            expire_after=timedelta(days=30))
+    expires_at = None if timeout is None else time.monotonic() + timeout
+
+    def get_json(url, params):
+        request = Request("GET", url, params=params).prepare()
+        if expires_at is None:
+            cached = session.cache.get_response(session.cache.create_key(request))
+            return cached.json() if cached is not None else None
+        remaining = expires_at - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Geonames timeout ({timeout:.2f}s)")
+        return session.send(request, timeout=remaining).json()
+
+    found = get_json("http://api.geonames.org/searchJSON", {
+        "q": city, "country": nation, "username": GEONAMES_USERNAME,
+        "maxRows": 1, "style": "SHORT", "featureClass": ["A", "P"],
+    })
+    if not found or not found.get("geonames"):
+        return None
+    place = found["geonames"][0]
+    timezone = get_json("http://api.geonames.org/timezoneJSON",
+                        {"lat": place["lat"], "lng": place["lng"], "username": GEONAMES_USERNAME})
+    if not timezone or "timezoneId" not in timezone:
+        return None
+    return {"lat": float(place["lat"]), "lng": float(place["lng"]),
+            "tz": timezone["timezoneId"], "nation": place["countryCode"]}
+
+
+def create_subject(input_data):
+    """
+    AstrologicalSubject из входных данных рождения: по переданным координатам,
+    иначе через офлайн-геокодер, а при его промахе - через Geonames.
+    Откуда взят пояс - в subject.tz_source: "input" (birth_tz), "timezone_index",
+    "fallback" (Europe/Moscow без индекса), "geocoder", "geonames" или "geonames_cache".
+    """
+    from kerykeion import AstrologicalSubject
+
+    # Проверяем есть ли координаты в входных данных
+    if "birth_lat" in input_data and "birth_lng" in input_data:
+        # Используем переданные координаты; пояс без birth_tz - из офлайн-индекса
+        with stage("geocode"):
+            if input_data.get("birth_tz"):
+                birth_tz, tz_source = input_data["birth_tz"], "input"
+            else:
+                birth_tz, tz_source = resolve_timezone(input_data["birth_lat"], input_data["birth_lng"])
+        with stage("subject"):
+            subject = AstrologicalSubject(
+                input_data["user_name"],
+                input_data["birth_year"],
+                input_data["birth_month"],
+                input_data["birth_day"],
+                input_data["birth_hour"],
+                input_data["birth_minute"],
+                input_data["birth_city"],
+                input_data["birth_country_code"],
+                lat=input_data["birth_lat"],
+                lng=input_data["birth_lng"],
+                tz_str=birth_tz
+            )
+        log("debug", "coordinates", source="input", lat=input_data["birth_lat"], lng=input_data["birth_lng"])
+    else:
+        # Сначала офлайн-геокодер (cache/geocoder_cities.idx), Geonames - только при промахе
+        offline_location = None
+        with stage("geocode"):
+            try:
+                from city_geocoder import geocode
+                offline_location = geocode(input_data["birth_city"], input_data["birth_country_code"])
+            except Exception as geo_error:
+                log("warning", "geocoder_error", error=str(geo_error))
+
+        if offline_location:
+            with stage("subject"):
+                subject = AstrologicalSubject(
+                    input_data["user_name"],
+                    input_data["birth_year"],
+                    input_data["birth_month"],
+                    input_data["birth_day"],
+                    input_data["birth_hour"],
+                    input_data["birth_minute"],
+                    input_data["birth_city"],
+                    input_data["birth_country_code"],
+                    lat=offline_location["lat"],
+                    lng=offline_location["lng"],
+                    tz_str=offline_location["tz"],
+                    online=False
+                )
+            tz_source = "geocoder"
+            log("debug", "coordinates", source="offline_geocoder", city=offline_location["name"],
+                match=offline_location["match"], lat=offline_location["lat"], lng=offline_location["lng"])
+        else:
+            # Используем Geonames - с таймаутом, а при нехватке времени до дедлайна только кэш ответов
+            timeout = GEONAMES_TIMEOUT_S
+            deadline = current_deadline()
+            if deadline is not None:
+                network_ms = deadline.remaining_ms() - DEADLINE_SUBJECT_RESERVE_MS
+                if network_ms < DEADLINE_GEONAMES_MIN_MS:
+                    timeout = None
+                    deadline.degrade("geonames_cache")
+                else:
+                    timeout = min(timeout, network_ms / 1000)
+            with stage("geocode"):
+                try:
+                    location = fetch_geonames_location(input_data["birth_city"], input_data["birth_country_code"], timeout)
+                except (OSError, ValueError) as network_error:
+                    # Сеть недоступна или не уложилась в таймаут - ответ из кэша, даже просроченный
+                    log("warning", "geonames_unavailable", error=str(network_error))
+                    timeout = None
+                    if deadline is not None:
+                        deadline.degrade("geonames_cache")
+                    location = fetch_geonames_location(input_data["birth_city"], input_data["birth_country_code"], None)
+            if location is None:
+                raise ValueError("No data found for this city" + (" in Geonames cache" if timeout is None else ""))
+
+            with stage("subject"):
+                subject = AstrologicalSubject(
+                    input_data["user_name"],
+                    input_data["birth_year"],
+                    input_data["birth_month"],
+                    input_data["birth_day"],
+                    input_data["birth_hour"],
+                    input_data["birth_minute"],
+                    input_data["birth_city"],
+                    location["nation"],
+                    lat=location["lat"],
+                    lng=location["lng"],
+                    tz_str=location["tz"],
+                    online=False
+                )
+            tz_source = "geonames" if timeout else "geonames_cache"
+            log("debug", "coordinates", source=tz_source, lat=location["lat"], lng=location["lng"])
+
+    subject.tz_source = tz_source
+    return subject
+
+
+def with_house_system(subject, house_system):
+    """
+    Та же карта в другой системе домов. Положения планет не пересчитываются:
+    заново считаются только куспиды (swe.houses, как в kerykeion) и дома точек.
+    Возвращает AstrologicalSubjectModel.
+    """
+    if subject.houses_system_identifier == house_system:
+        return subject
+
+    import swisseph as swe
+    from kerykeion.utilities import get_kerykeion_point_from_degree, get_planet_house
+
+    model = subject.model() if hasattr(subject, "model") else subject
+    hsys = house_system.encode("ascii")
+    if model.zodiac_type == "Sidereal":
+        cusps, _ = swe.houses_ex(tjdut=model.julian_day, lat=model.lat, lon=model.lng, hsys=hsys, flags=swe.FLG_SIDEREAL)
+    else:
+        cusps, _ = swe.houses(tjdut=model.julian_day, lat=model.lat, lon=model.lng, hsys=hsys)
+
+    update = {"houses_system_identifier": house_system, "houses_system_name": swe.house_name(hsys)}
+    for house_name, cusp in zip(model.houses_names_list, cusps):
+        update[house_name.lower()] = get_kerykeion_point_from_degree(cusp, house_name, point_type="House")
+    for point_name in model.planets_names_list + model.axial_cusps_names_list:
+        point = getattr(model, point_name.lower(), None)
+        if point is not None:
+            update[point_name.lower()] = point.model_copy(update={"house": get_planet_house(point.abs_pos, cusps)})
+    return model.model_copy(update=update)
+
+
+def requested_variants(input_data):
+    """
+    Варианты вывода [(язык, тема, система домов), ...] из поля "variants":
+    {"languages": ["RU", "EN"], "themes": ["dark", "light"], "house_systems": ["P", "W"]}
+    - все сочетания, пропущенная ось берется из DEFAULT_VARIANT. Без поля - один
+    вариант по умолчанию.
+    """
+    spec = input_data.get("variants")
+    if spec is None:
+        return [DEFAULT_VARIANT]
+    if not isinstance(spec, dict):
+        raise ValueError("Field 'variants' must be an object with languages/themes/house_systems")
+
+    axes = []
+    for field, allowed, default in (("languages", VARIANT_LANGUAGES, DEFAULT_VARIANT[0]),
+                                    ("themes", VARIANT_THEMES, DEFAULT_VARIANT[1]),
+                                    ("house_systems", HOUSE_SYSTEMS, DEFAULT_VARIANT[2])):
+        values = spec.get(field, [default])
+        if isinstance(values, str):
+            values = [values]
+        if not isinstance(values, list) or not values:
+            raise ValueError(f"Field 'variants.{field}' must be a non-empty list")
+        unknown = [value for value in values if value not in allowed]
+        if unknown:
+            raise ValueError(f"Unknown variants.{field}: {unknown}. Expected one of {list(allowed)}")
+        axes.append(list(dict.fromkeys(values)))
+
+    from itertools import product
+    variants = list(product(*axes))
+    if len(variants) > MAX_VARIANTS:
+        raise ValueError(f"Too many variants: {len(variants)} (max {MAX_VARIANTS})")
+    if input_data.get("svg_mode", "sync") == "deferred" and variants != [DEFAULT_VARIANT]:
+        # Отложенная отрисовка (render-svg) знает только вариант по умолчанию
+        raise ValueError("svg_mode 'deferred' supports only the default variant")
+    return variants
+
+
+def variant_key(variant):
+    """Ключ варианта в ответе: "RU:dark:P" """
+    return ":".join(variant)
+
+
+def render_variant_svg(subject, theme, language, svg_mode, svg_output):
+    """SVG одного варианта по svg_mode/svg_output: {"svg_name", "svg_status"[, "svg"]}"""
+    if svg_mode == "deferred":
+        # Рассчитанный subject сохранит calculate_natal_chart в записи карты - для render-svg
+        log("debug", "svg_deferred", language=language, theme=theme)
+        return {"svg_name": None, "svg_status": "pending"}
+    if svg_mode != "sync":
+        return {"svg_name": None, "svg_status": "skipped"}
+
+    try:
+        with stage("svg"):
+            if svg_output == "inline":
+                svg_text = render_chart_svg_text(subject, theme, language)
+                log("debug", "svg_inline", language=language, theme=theme, chars=len(svg_text))
+                return {"svg_name": None, "svg_status": "ready", "svg": svg_text}
+            svg_name = render_chart_svg(subject, theme, language)
+            log("debug", "svg_stored", language=language, theme=theme, svg_name=svg_name)
+            return {"svg_name": svg_name, "svg_status": "ready"}
+    except Exception as svg_error:
+        log("warning", "svg_failed", language=language, theme=theme, error=str(svg_error))
+        return {"svg_name": None, "svg_status": "failed"}
+
+
+def request_chart_key(input_data):
+    """
+    Ключ запроса - один для chart_key ответа, записи карты и кэша результатов
+    (render-svg обновляет запись и кэш по нему же). Набор вариантов - часть
+    ключа, если запрос его перечисляет; ключ запроса без вариантов не меняется.
+    """
+    from natal_chart_cache import make_cache_key
+    context = prompt_cache_context(input_data)
+    if "variants" in input_data:
+        context["variants"] = [variant_key(variant) for variant in requested_variants(input_data)]
+    return make_cache_key(input_data, **context)
+
+
+def save_natal_record(chart_key, chart, subject, variant_results):
+    """
+    Запись карты под возвращаемым chart_key - для каждого успешного расчета:
+    "chart" читают transits/synastry ("chart_key" вместо данных рождения),
+    "svg_name" - SVG варианта по умолчанию. Полный subject нужен только
+    render-svg и сохраняется, если какой-то SVG отложен.
+    """
+    record = {"chart": chart, "svg_name": variant_results.get(variant_key(DEFAULT_VARIANT), {}).get("svg_name")}
+    deferred = any(entry["svg_status"] == "pending" for entry in variant_results.values())
+    if deferred:
+        record["subject"] = subject.model().model_dump(mode="json")
+    try:
+        with stage("record"):
+            save_chart_record(chart_key, record)
+    except Exception as record_error:
+        # Без записи отложенный SVG не дорисовать; для прочих расчетов это не ошибка
+        if deferred:
+            raise
+        log("warning", "chart_record_failed", chart_key=chart_key, error=str(record_error))
+
+
+def calculate_natal_chart(input_data):
+    """
+    Основная функция расчета натальной карты для kerykeion 4.23.0
+    """
+    log("debug", "natal_start", user_name=input_data.get("user_name"))
+
+    # "sync" - SVG рисуется сразу, "deferred" - позже (render-svg), "none" - без SVG
+    svg_mode = input_data.get("svg_mode", "sync")
+    if svg_mode not in SVG_MODES:
+        return {
+            "error": f"Unknown svg_mode: {svg_mode}. Expected one of {list(SVG_MODES)}",
+            "svg_name": None,
+            "ai_prompt": None,
+            "success": False
+        }
+
+    svg_output = input_data.get("svg_output", "file")
+    if svg_output not in SVG_OUTPUTS:
+        return {
+            "error": f"Unknown svg_output: {svg_output}. Expected one of {list(SVG_OUTPUTS)}",
+            "svg_name": None,
+            "ai_prompt": None,
+            "success": False
+        }
+
+    try:
+        variants = requested_variants(input_data)
+        prompt_format, token_budget = prompt_options(input_data)
+    except ValueError as e:
+        return {"error": str(e), "svg_name": None, "ai_prompt": None, "success": False}
+
+    try:
+        # Импорт для kerykeion 4.23.0 (последняя версия)
+        with stage("import"):
+            from kerykeion import AstrologicalSubject  # noqa: F401
+    except ImportError as e:
+        log("error", "kerykeion_missing", error=str(e))
+        return {
+            "error": "Библиотека kerykeion не установлена. Установите: pip install kerykeion",
+            "svg_name": None,
+            "ai_prompt": None,
+            "success": False
+        }
+
+    chart_key = request_chart_key(input_data)
+
+    try:
+        dark_theme_subject = create_subject(input_data)
+
+        # Эфемериды посчитаны один раз; варианты - только дома, перевод, промт и SVG
+        subjects = {dark_theme_subject.houses_system_identifier: dark_theme_subject}
+        prompts = {}
+        variant_results = {}
+        deadline = current_deadline()
+        for language, theme, house_system in variants:
+            if house_system not in subjects:
+                subjects[house_system] = with_house_system(dark_theme_subject, house_system)
+            subject = subjects[house_system]
+            if (language, house_system) not in prompts:
+                with stage("translate"):
+                    translated_data = translate_natal_chart(subject, language)
+                with stage("prompt"):
+                    prompts[(language, house_system)] = format_prompt(translated_data, language,
+                                                                      prompt_format, token_budget)
+            variant_result = dict(prompts[(language, house_system)])
+
+            variant_svg_mode = svg_mode
+            if deadline is not None:
+                if deadline.partial is None:
+                    # Промт готов: если дальше что-то зависнет, сторож отдаст хотя бы его
+                    deadline.partial = {"svg_name": None, "success": True, "svg_status": "skipped",
+                                        "chart_key": chart_key, **variant_result}
+                if svg_mode == "sync" and deadline.remaining_ms() < DEADLINE_SVG_RESERVE_MS:
+                    # Не успеваем нарисовать: вариант по умолчанию - отложенно (render-svg), прочие - без SVG
+                    deferrable = variants == [DEFAULT_VARIANT] and svg_output == "file"
+                    variant_svg_mode = "deferred" if deferrable else "none"
+                    deadline.degrade("svg")
+            variant_result.update(render_variant_svg(subject, theme, language, variant_svg_mode, svg_output))
+            variant_results[variant_key((language, theme, house_system))] = variant_result
+
+        with stage("chart"):
+            # Долготы натальных точек - Node хранит их для транзитов (порядок aspect_engine.NATAL_POINTS)
+            from aspect_engine import subject_longitudes
+            natal_longitudes = [None if lon is None else round(lon, 6) for lon in subject_longitudes(dark_theme_subject)]
+            # Компактная карта для transits/synastry/prompt без повторного расчета (chart_payload.py)
+            from chart_payload import build_chart_payload
+            chart = build_chart_payload(dark_theme_subject)
+
+        save_natal_record(chart_key, chart, dark_theme_subject, variant_results)
+
+        # Возвращаем результат (точно как в версии заказчиков + статус SVG);
+        # верхний уровень - первый вариант, все варианты - в "variants"
+        first_variant = variant_results[variant_key(variants[0])]
+        result = {
+            "svg_name": first_variant["svg_name"],
+            "ai_prompt": first_variant["ai_prompt"],
+            "success": True,
+            "svg_status": first_variant["svg_status"],
+            "chart_key": chart_key,
+            "natal_longitudes": natal_longitudes,
+            "chart": chart,
+            "tz_source": dark_theme_subject.tz_source,
+            "prompt_tokens": first_variant["prompt_tokens"]
+        }
+        for field in ("ai_system_prompt", "prompt_truncated", "prompt_over_budget", "svg"):
+            if field in first_variant:
+                result[field] = first_variant[field]
+        if "variants" in input_data:
+            result["variants"] = variant_results
+        if deadline is not None and deadline.degraded:
+            result["degraded"] = list(deadline.degraded)
+        return result
+
+    except Exception as e:
+        log("error", "natal_failed", error=str(e))
+        result = {
+            "error": f"Ошибка при расчете натальной карты: {str(e)}",
+            "svg_name": None,
+            "ai_prompt": None,
+            "success": False
+        }
+        deadline = current_deadline()
+        if deadline is not None and deadline.degraded:
+            result["degraded"] = list(deadline.degraded)
+        return result
+
+def result_svg_entries(result):
+    """Части результата со своим SVG: верхний уровень и каждый вариант"""
+    return [result] + list(result.get("variants", {}).values())
+
+
+def mark_pending_svg(result, svg_name, svg_status):
+    """
+    Итог отложенной отрисовки в результате: отложен бывает только SVG
+    варианта по умолчанию, поэтому меняются все части со статусом "pending".
+    """
+    for entry in result_svg_entries(result):
+        if entry.get("svg_status") == "pending":
+            entry["svg_name"] = svg_name
+            entry["svg_status"] = svg_status
+
+
+def calculate_natal_chart_cached(input_data):
+    """
+    calculate_natal_chart с дисковым кэшем результатов (cache/natal_chart_cache.sqlite).
+    Кэш можно отключить полем "use_cache": false. Любая ошибка кэша не ломает расчет.
+    """
+    if input_data.get("use_cache", True) is False:
+        return calculate_natal_chart(input_data)
+
+    cache = None
+    try:
+        with stage("cache"):
+            from natal_chart_cache import NatalChartCache
+            cache = NatalChartCache()
+            cache_key = request_chart_key(input_data)
+            svg_store = get_svg_store()
+
+            def svg_files_exist(result):
+                # Попадание в кэш обновляет mtime SVG (LRU для GC); удаленный GC файл любого варианта = промах
+                with stage("svg_lookup"):
+                    return all(not entry.get("svg_name") or svg_store.touch(entry["svg_name"])
+                               for entry in result_svg_entries(result))
+
+            cached = cache.get(cache_key, is_valid=svg_files_exist)
+    except Exception as e:
+        log("warning", "cache_unavailable", error=str(e))
+        if cache is not None:
+            cache.close()
+        return calculate_natal_chart(input_data)
+
+    try:
+        if cached is not None:
+            log("debug", "cache_hit", cache_key=cache_key)
+            if cached.get("svg_status") == "pending" and input_data.get("svg_mode", "sync") == "sync":
+                # В кэше карта без SVG, а вызывающему SVG нужен сейчас - если до дедлайна успеваем
+                deadline = current_deadline()
+                if deadline is not None and deadline.remaining_ms() < DEADLINE_SVG_RESERVE_MS:
+                    deadline.degrade("svg")
+                    cached["degraded"] = list(deadline.degraded)
+                else:
+                    rendered = render_pending_svg(cache_key)
+                    mark_pending_svg(cached, rendered["svg_name"], rendered["svg_status"])
+            if input_data.get("svg_mode", "sync") == "sync" and input_data.get("svg_output") == "inline":
+                with stage("svg_lookup"):
+                    for entry in result_svg_entries(cached):
+                        if entry.get("svg_name"):
+                            entry["svg"] = read_stored_svg(entry["svg_name"])
+            cached["cache"] = "hit"
+            return cached
+
+        result = calculate_natal_chart(input_data)
+        # Карты без SVG ("skipped"/"failed") не кэшируем: следующему вызову SVG может понадобиться.
+        # Inline-SVG тоже: файла нет, а текст SVG в кэше результатов только раздул бы базу
+        if (result.get("success") and input_data.get("svg_output") != "inline"
+                and all(entry.get("svg_status") in ("ready", "pending") for entry in result_svg_entries(result))):
+            try:
+                with stage("cache"):
+                    # "degraded" относится к этому вызову: попадание в кэш без дедлайна его не наследует
+                    cache.put(cache_key, {field: value for field, value in result.items() if field != "degraded"})
+            except Exception as e:
+                log("warning", "cache_store_failed", error=str(e))
+        result["cache"] = "miss"
+        return result
+    finally:
+        cache.close()
+
+
+REQUIRED_FIELDS = ['user_name', 'birth_year', 'birth_month', 'birth_day',
+                   'birth_hour', 'birth_minute', 'birth_city', 'birth_country_code']
+
+
+def parse_input_text(input_text):
+    """Очищает сырой ввод от BOM/нулевых байтов и парсит JSON"""
+    # Удаляем BOM если есть
+    if input_text.startswith('\ufeff'):
+        input_text = input_text[1:]
+
+    input_text = input_text.lstrip('\x00\ufeff\ufffe')
+
+    if not input_text.strip():
+        raise ValueError("No input data received")
+
+    return safe_json_parse(input_text)
+
+
+def validate_input_data(input_data):
+    """Проверяет, что во входных данных есть все обязательные поля"""
+    if not isinstance(input_data, dict):
+        raise ValueError("Input must be a JSON object")
+
+    missing_fields = [field for field in REQUIRED_FIELDS if field not in input_data]
+    if missing_fields:
+        raise ValueError(f"Missing required fields: {missing_fields}")
+
+    svg_mode = input_data.get("svg_mode", "sync")
+    if svg_mode not in SVG_MODES:
+        raise ValueError(f"Unknown svg_mode: {svg_mode}. Expected one of {list(SVG_MODES)}")
+
+    svg_output = input_data.get("svg_output", "file")
+    if svg_output not in SVG_OUTPUTS:
+        raise ValueError(f"Unknown svg_output: {svg_output}. Expected one of {list(SVG_OUTPUTS)}")
+
+    requested_variants(input_data)
+    prompt_options(input_data)
+
+
+def validate_timezones_input(input_data):
+    """Проверяет вход команды timezones: пары [lat, lng] из конечных чисел в допустимых пределах"""
+    from timezone_index import validate_coordinates
+    validate_coordinates(input_data.get("coordinates"))
+
+
+def validate_render_svg_input(input_data):
+    """Проверяет вход команды render-svg"""
+    validate_chart_key(input_data.get("chart_key"))
+
+
+def validate_transits_input(input_data):
+    """Проверяет вход команды transits (сами долготы проверяются по каждому пользователю)"""
+    users = input_data.get("users")
+    if not isinstance(users, list) or not users:
+        raise ValueError("Field 'users' must be a non-empty list")
+    for user in users:
+        if not isinstance(user, dict) or not any(field in user for field in ("longitudes", "chart", "chart_key")):
+            raise ValueError("Each user must be an object with 'longitudes', 'chart' or 'chart_key'")
+    for field in ("date", "time"):
+        if field in input_data and not isinstance(input_data[field], str):
+            raise ValueError(f"Field '{field}' must be a string")
+    if "orbs" in input_data and not isinstance(input_data["orbs"], dict):
+        raise ValueError("Field 'orbs' must be an object")
+    days = input_data.get("days", 1)
+    if not isinstance(days, int) or isinstance(days, bool) or not 1 <= days <= MAX_TRANSIT_DAYS:
+        raise ValueError(f"Field 'days' must be an integer from 1 to {MAX_TRANSIT_DAYS}")
+
+
+def _validate_chart_spec(spec, label):
+    """Карта задается долготами, "chart", chart_key или данными рождения (как для natal)"""
+    if not isinstance(spec, dict):
+        raise ValueError(f"Field '{label}' must be an object")
+    if "longitudes" in spec or "chart" in spec or "chart_key" in spec:
+        return
+    missing_fields = [field for field in REQUIRED_FIELDS if field not in spec]
+    if missing_fields:
+        raise ValueError(f"{label}: missing required fields: {missing_fields}")
+
+
+def validate_synastry_input(input_data):
+    """Проверяет вход команды synastry"""
+    _validate_chart_spec(input_data.get("subject"), "subject")
+    partners = input_data.get("partners")
+    if not isinstance(partners, list) or not partners:
+        raise ValueError("Field 'partners' must be a non-empty list")
+    for partner in partners:
+        _validate_chart_spec(partner, "partners[]")
+    if "orbs" in input_data and not isinstance(input_data["orbs"], dict):
+        raise ValueError("Field 'orbs' must be an object")
+
+
+def validate_prompt_input(input_data):
+    """Проверяет вход команды prompt (разбор "chart" - только struct/base64)"""
+    from chart_payload import load_chart_payload
+    if "chart" not in input_data:
+        raise ValueError("Missing required field: 'chart'")
+    load_chart_payload(input_data["chart"])
+    language = input_data.get("language", "RU")
+    if language not in VARIANT_LANGUAGES:
+        raise ValueError(f"Unknown language: {language}. Expected one of {list(VARIANT_LANGUAGES)}")
+    prompt_options(input_data)
+
+
+def error_result(message):
+    """Ответ об ошибке в том же формате, что и calculate_natal_chart"""
+    return {
+        "success": False,
+        "error": message,
+        "svg_name": None,
+        "ai_prompt": None
+    }
+
+
+def command_natal(input_data):
+    """Команда по умолчанию: расчет натальной карты"""
+    validate_input_data(input_data)
+    result = calculate_natal_chart_cached(input_data)
+    if input_data.get("chart_binary") and result.get("chart"):
+        # Двоичная форма не кэшируется: она однозначно получается из "chart"
+        from chart_payload import encode_chart_binary
+        result["chart_b64"] = encode_chart_binary(result["chart"])
+    if input_data.get("prompt_token_report") and result.get("chart"):
+        from chart_payload import PayloadSubject
+        result["prompt_tokens_by_format"] = prompt_token_report(PayloadSubject(result["chart"]))
+    return result
+
+
+def command_timezones(input_data):
+    """
+    Пакетное определение поясов: {"command": "timezones", "coordinates": [[lat, lng], ...]}
+    Для бэкфиллов - тысячи пользователей за один вызов, без kerykeion и сети.
+    """
+    validate_timezones_input(input_data)
+
+    from timezone_index import lookup_timezones
+    timezones = lookup_timezones(input_data["coordinates"])
+    if timezones is None:
+        return {"success": False, "error": "Timezone index is not built", "timezones": None}
+    return {"success": True, "timezones": timezones}
+
+
+def command_render_svg(input_data):
+    """Отрисовка отложенного SVG: {"command": "render-svg", "chart_key": ...}"""
+    validate_render_svg_input(input_data)
+    return render_pending_svg(input_data["chart_key"])
+
+
+def command_prompt(input_data):
+    """
+    Промт заново из сохраненной карты: {"command": "prompt", "chart": {...} | "base64", "language": "EN",
+    "prompt_format": "compact", "prompt_token_budget": 600, "prompt_token_report": true}
+    Без kerykeion и эфемерид - только перевод и форматирование.
+    """
+    validate_prompt_input(input_data)
+
+    from chart_payload import PayloadSubject, load_chart_payload
+    subject = PayloadSubject(load_chart_payload(input_data["chart"]))
+    language = input_data.get("language", "RU")
+    prompt_format, token_budget = prompt_options(input_data)
+    with stage("translate"):
+        translated_data = translate_natal_chart(subject, language)
+    result = {"success": True}
+    with stage("prompt"):
+        result.update(format_prompt(translated_data, language, prompt_format, token_budget))
+    if input_data.get("prompt_token_report"):
+        result["prompt_tokens_by_format"] = prompt_token_report(subject, language)
+    return result
+
+
+# Поля, определяющие натальные долготы (имя на расчет не влияет)
+BIRTH_FIELDS = REQUIRED_FIELDS[1:] + ['birth_lat', 'birth_lng', 'birth_tz']
+
+
+def _open_chart_records(specs):
+    """
+    Один открытый NatalChartCache на запрос, если какая-то карта задана chart_key;
+    None - не нужен или недоступен (тогда запись читается отдельным подключением)
+    """
+    if not any(isinstance(spec, dict) and "chart_key" in spec for spec in specs):
+        return None
+    try:
+        from natal_chart_cache import NatalChartCache
+        return NatalChartCache()
+    except Exception as cache_error:
+        log("warning", "cache_unavailable", error=str(cache_error))
+        return None
+
+
+def _user_natal_row(user, computed=None, records=None):
+    """
+    Натальные долготы: переданные явно, из "chart", из записи карты по chart_key или
+    рассчитанные по данным рождения. computed - кэш расчетов на запрос,
+    чтобы одинаковые данные рождения считались один раз; records - открытый
+    NatalChartCache для записей карт.
+    """
+    from aspect_engine import longitudes_row, subject_longitudes
+    if "longitudes" in user:
+        return longitudes_row(user["longitudes"])
+    if "chart" in user:
+        from chart_payload import load_chart_payload
+        return longitudes_row(load_chart_payload(user["chart"])["lon"])
+    if "chart_key" in user:
+        record = load_chart_record(user["chart_key"], records)
+        if record is None:
+            raise ValueError(f"Unknown chart_key: {user['chart_key']}")
+        if "chart" in record:
+            return longitudes_row(record["chart"]["lon"])
+        return subject_longitudes(record["subject"])
+
+    birth_key = tuple(user.get(field) for field in BIRTH_FIELDS)
+    if computed is None or birth_key not in computed:
+        longitudes = subject_longitudes(create_subject(user))
+        if computed is None:
+            return longitudes
+        computed[birth_key] = longitudes
+    return computed[birth_key]
+
+
+def command_transits(input_data):
+    """
+    Транзиты к натальным картам для гороскопов на день:
+    {"command": "transits", "date": "YYYY-MM-DD", "time": "HH:MM" (UTC),
+     "users": [{"id": ..., "longitudes": [...] | {"Sun": ...} | "chart": ... | "chart_key": ...}],
+     "orbs": {"square": 2}, "max_aspects": 10, "days": 1}
+
+    Положения планет дня считаются один раз, аспекты ко всем картам - одной
+    операцией numpy. У каждого пользователя - список аспектов по точности:
+    [транзитная планета, аспект, натальная точка, орбис, сходящийся].
+    С "days": N > 1 (гороскоп на неделю, месяц) - то же на N дней подряд с
+    "date" в списке "days" ответа; натальные карты читаются один раз, а
+    положения на все дни берутся сразу (body_positions_many).
+    """
+    validate_transits_input(input_data)
+
+    from aspect_engine import (NATAL_POINTS, TRANSIT_ORBS, body_positions_many, julian_day, natal_matrix,
+                               resolve_orbs)
+
+    users = input_data["users"]
+    max_aspects = int(input_data.get("max_aspects", 10))
+    orbs = resolve_orbs(input_data.get("orbs"), TRANSIT_ORBS)
+    days = int(input_data.get("days", 1))
+    jd, moment = julian_day(input_data.get("date"), input_data.get("time", "12:00"))
+    jds = [jd + day for day in range(days)]
+    transit_longitudes, transit_speeds = body_positions_many(jds)
+
+    rows = []
+    user_errors = {}
+    records = _open_chart_records(users)
+    try:
+        for index, user in enumerate(users):
+            try:
+                rows.append(_user_natal_row(user, records=records))
+            except (ValueError, OSError) as user_error:
+                user_errors[index] = str(user_error)
+                rows.append([None] * len(NATAL_POINTS))
+    finally:
+        if records is not None:
+            records.close()
+    natal = natal_matrix(rows)
+
+    if days == 1:
+        return {"success": True, **_transits_day(natal, users, user_errors, moment, transit_longitudes[0],
+                                                  transit_speeds[0], orbs, max_aspects)}
+
+    import datetime
+    first_day = datetime.date.fromisoformat(moment[:10])
+    return {
+        "success": True,
+        "aspect_fields": ["planet", "aspect", "natal", "orb", "applying"],
+        "days": [
+            _transits_day(natal, users, user_errors,
+                          f"{(first_day + datetime.timedelta(days=day)).isoformat()}{moment[10:]}",
+                          transit_longitudes[day], transit_speeds[day], orbs, max_aspects)
+            for day in range(days)
+        ],
+    }
+
+
+def _transits_day(natal, users, user_errors, moment, transit_longitudes, transit_speeds, orbs, max_aspects):
+    """Ответ transits на один момент: положения тел и аспекты каждого пользователя"""
+    from aspect_engine import ASPECTS, NATAL_POINTS, TRANSIT_BODIES, group_by_row, sign_of, transit_aspects
+
+    hit_rows, hit_points, hit_bodies, hit_aspects, hit_orbs, hit_applying = transit_aspects(
+        natal, transit_longitudes, transit_speeds, orbs
+    )
+    groups = group_by_row(hit_rows, hit_orbs, len(users))
+
+    results = []
+    for index, user in enumerate(users):
+        entry = {"id": user.get("id")}
+        if index in user_errors:
+            entry["error"] = user_errors[index]
+        else:
+            entry["aspects"] = [
+                [TRANSIT_BODIES[hit_bodies[hit]][0], ASPECTS[hit_aspects[hit]][0],
+                 NATAL_POINTS[hit_points[hit]], round(float(hit_orbs[hit]), 2), bool(hit_applying[hit])]
+                for hit in groups[index][:max_aspects]
+            ]
+        results.append(entry)
+
+    log("debug", "transits", charts=len(users), aspects=len(hit_rows), moment=moment)
+    return {
+        "moment": moment,
+        "positions": {
+            name: [round(float(lon), 4), round(float(speed), 4), sign_of(lon)]
+            for (name, _), lon, speed in zip(TRANSIT_BODIES, transit_longitudes, transit_speeds)
+        },
+        "aspect_fields": ["planet", "aspect", "natal", "orb", "applying"],
+        "users": results,
+    }
+
+
+def command_synastry(input_data):
+    """
+    Синастрия одного пользователя со многими:
+    {"command": "synastry", "subject": {...}, "partners": [{"id": ..., ...}],
+     "include_aspects": false, "orbs": {...}}
+
+    Карта - данные рождения (как для natal), "longitudes", "chart" или "chart_key".
+    Каждая карта рассчитывается один раз, матрица аспектов subject x все
+    partners - одной операцией numpy. Для каждого партнера - очки по методу
+    Discepolo (те же, что у RelationshipScoreFactory в kerykeion), их описание и
+    процент для списков друзей; с include_aspects - сами аспекты
+    [точка subject, аспект, точка партнера, орбис] по точности.
+    """
+    validate_synastry_input(input_data)
+
+    from aspect_engine import (ASPECTS, NATAL_POINTS, group_by_row, natal_matrix, relationship_description,
+                               relationship_percent, relationship_scores, resolve_orbs, synastry_aspects)
+
+    partners = input_data["partners"]
+    include_aspects = bool(input_data.get("include_aspects", False))
+    orbs = resolve_orbs(input_data.get("orbs"))
+    computed = {}
+
+    subject = input_data["subject"]
+    records = _open_chart_records([subject] + partners)
+    try:
+        try:
+            first = natal_matrix([_user_natal_row(subject, computed, records)])[0]
+        except Exception as subject_error:
+            # Без карты subject сравнивать не с чем - ошибка всего запроса, но с понятной причиной
+            log("warning", "synastry_subject_failed", id=subject.get("id"), error=str(subject_error))
+            return {"success": False, "error": f"subject: {subject_error}", "subject": {"id": subject.get("id")},
+                    "partners": None}
+
+        rows = []
+        partner_errors = {}
+        for index, partner in enumerate(partners):
+            try:
+                rows.append(_user_natal_row(partner, computed, records))
+            except Exception as partner_error:
+                log("warning", "synastry_partner_failed", id=partner.get("id"), error=str(partner_error))
+                partner_errors[index] = str(partner_error)
+                rows.append([None] * len(NATAL_POINTS))
+    finally:
+        if records is not None:
+            records.close()
+
+    others = natal_matrix(rows)
+    scores, destiny_sign = relationship_scores(first, others)
+    if include_aspects:
+        hits = synastry_aspects(first, others, orbs)
+        groups = group_by_row(hits[0], hits[4], len(partners))
+
+    results = []
+    for index, partner in enumerate(partners):
+        entry = {"id": partner.get("id")}
+        if index in partner_errors:
+            entry["error"] = partner_errors[index]
+            results.append(entry)
+            continue
+        score = int(scores[index])
+        entry.update({
+            "score": score,
+            "description": relationship_description(score),
+            "percent": relationship_percent(score),
+            "destiny_sign": bool(destiny_sign[index]),
+        })
+        if include_aspects:
+            _, first_points, other_points, aspect_index, orb = hits
+            entry["aspects"] = [
+                [NATAL_POINTS[first_points[hit]], ASPECTS[aspect_index[hit]][0],
+                 NATAL_POINTS[other_points[hit]], round(float(orb[hit]), 2)]
+                for hit in groups[index]
+            ]
+        results.append(entry)
+
+    log("debug", "synastry", partners=len(partners), charts_calculated=len(computed))
+    response = {"success": True, "subject": {"id": subject.get("id")}, "partners": results}
+    if include_aspects:
+        response["aspect_fields"] = ["point", "aspect", "partner_point", "orb"]
+    return response
+
+
+COMMANDS = {
+    "natal": command_natal,
+    "timezones": command_timezones,
+    "render-svg": command_render_svg,
+    "transits": command_transits,
+    "synastry": command_synastry,
+    "prompt": command_prompt,
+}
+
+# Проверки входа без расчета (для --check): ни одна не импортирует kerykeion
+COMMAND_VALIDATORS = {
+    "natal": validate_input_data,
+    "timezones": validate_timezones_input,
+    "render-svg": validate_render_svg_input,
+    "transits": validate_transits_input,
+    "synastry": validate_synastry_input,
+    "prompt": validate_prompt_input,
+}
+
+
+def get_command_handler(input_data):
+    """Выбирает обработчик по полю "command" (по умолчанию - натальная карта)"""
+    if not isinstance(input_data, dict):
+        raise ValueError("Input must be a JSON object")
+    command = input_data.get("command", "natal")
+    handler = COMMANDS.get(command)
+    if handler is None:
+        raise ValueError(f"Unknown command: {command}")
+    return handler
+
+
+def execute_request(input_data, request_id=None):
+    """
+    Выполняет разобранный запрос в рамках начатых замеров (start_request):
+    сводка этапов - одной строкой лога, а с "metrics": true - и в ответе.
+    """
+    try:
+        if isinstance(input_data, dict):
+            set_request_log_level(input_data.get("log_level"))
+        result = get_command_handler(input_data)(input_data)
+    except Exception as e:
+        log("error", "request_failed", error=str(e))
+        result = error_result(str(e))
+    return finish_request_metrics(input_data, result, request_id)
+
+
+def finish_request_metrics(input_data, result, request_id=None):
+    """Закрывает замеры запроса; с "metrics": true сводка добавляется в ответ"""
+    fields = {"command": input_data.get("command", "natal") if isinstance(input_data, dict) else None,
+              "success": bool(result.get("success"))}
+    if request_id is not None:
+        fields["request_id"] = request_id
+    if result.get("cache"):
+        fields["cache"] = result["cache"]
+    summary = finish_request(**fields)
+    if isinstance(input_data, dict) and input_data.get("metrics"):
+        result["metrics"] = summary
+    return result
+
+
+def process_request(input_data, request_id=None):
+    """
+    Выполняет один запрос любой команды (используется воркерами).
+    Дедлайн проверяют этапы, сторож в воркере не запускается.
+    """
+    start_request()
+    try:
+        deadline_ms = deadline_option(input_data)
+    except ValueError as e:
+        return finish_request_metrics(input_data, error_result(str(e)), request_id)
+    if deadline_ms is not None:
+        start_deadline(deadline_ms)
+    try:
+        return execute_request(input_data, request_id)
+    finally:
+        clear_deadline()
+
+
+def _init_worker():
+    """Инициализация процесса-воркера: kerykeion загружается один раз на процесс"""
+    # Любой случайный print в воркере не должен попасть в NDJSON-поток родителя
+    sys.stdout = sys.stderr
+    try:
+        import kerykeion  # noqa: F401
+    except ImportError as e:
+        log("error", "kerykeion_missing", error=str(e))
+
+
+def _get_int_option(args, name, default=None):
+    """Достает целочисленную опцию вида --name N из списка аргументов"""
+    if name not in args:
+        return default
+    index = args.index(name)
+    if index + 1 >= len(args):
+        raise ValueError(f"Option {name} requires a value")
+    return int(args[index + 1])
+
+
+def _make_response_writer(output_stream):
+    """Потокобезопасная запись NDJSON-ответов (колбэки пула приходят из других потоков)"""
+    import threading
+    write_lock = threading.Lock()
+
+    def write_response(response):
+        line = json.dumps(response, ensure_ascii=False)
+        with write_lock:
+            output_stream.write(line + "\n")
+            output_stream.flush()
+
+    return write_response
+
+
+def _create_worker_pool(workers):
+    """Пул процессов с заранее загруженным kerykeion"""
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+
+
+def serve(workers=None, input_stream=None, output_stream=None):
+    """
+    Долгоживущий режим воркера: NDJSON-запросы на входе, NDJSON-ответы на выходе.
+
+    Каждая строка входа - тот же JSON-объект, что принимает main(), плюс
+    необязательный "request_id". Ответ содержит тот же "request_id" и пишется,
+    как только расчет готов, поэтому ответы могут приходить не по порядку.
+    Для "svg_mode": "deferred" SVG рисуется фоном в том же пуле, и когда он
+    готов, приходит вторая строка с тем же "request_id" и "event": "svg_ready".
+    """
+    import threading
+
+    input_stream = input_stream or sys.stdin
+    write_response = _make_response_writer(output_stream or sys.stdout)
+    workers = workers or os.cpu_count() or 1
+    # Все незавершенные задачи, включая фоновые SVG - ждем их перед выходом
+    outstanding = set()
+    outstanding_changed = threading.Condition()
+
+    def track(future, callback):
+        with outstanding_changed:
+            outstanding.add(future)
+        future.add_done_callback(callback)
+
+    def finish(future):
+        with outstanding_changed:
+            outstanding.discard(future)
+            outstanding_changed.notify_all()
+
+    def on_svg_done(request_id, future):
+        try:
+            response = future.result()
+        except Exception as e:
+            log("error", "background_svg_failed", request_id=request_id, error=str(e))
+            response = {"success": False, "error": f"Worker failed: {e}", "svg_name": None, "svg_status": "failed"}
+        response["request_id"] = request_id
+        response["event"] = "svg_ready"
+        write_response(response)
+        finish(future)
+
+    def on_done(request_id, future):
+        try:
+            response = future.result()
+        except Exception as e:
+            log("error", "worker_failed", request_id=request_id, error=str(e))
+            response = error_result(f"Worker failed: {e}")
+        response["request_id"] = request_id
+        write_response(response)
+
+        if response.get("svg_status") == "pending" and response.get("chart_key"):
+            try:
+                svg_future = executor.submit(process_request, {"command": "render-svg", "chart_key": response["chart_key"]},
+                                             request_id)
+                track(svg_future, lambda f, rid=request_id: on_svg_done(rid, f))
+            except RuntimeError as e:
+                log("warning", "background_svg_not_scheduled", request_id=request_id, error=str(e))
+        finish(future)
+
+    log("info", "worker_started", workers=workers)
+
+    with _create_worker_pool(workers) as executor:
+        for line in input_stream:
+            if not line.strip():
+                continue
+
+            request_id = None
+            try:
+                input_data = parse_input_text(line)
+                if isinstance(input_data, dict):
+                    request_id = input_data.pop("request_id", None)
+                get_command_handler(input_data)
+            except Exception as e:
+                log("error", "invalid_request", request_id=request_id, error=str(e))
+                response = error_result(str(e))
+                response["request_id"] = request_id
+                write_response(response)
+                continue
+
+            future = executor.submit(process_request, input_data, request_id)
+            track(future, lambda f, rid=request_id: on_done(rid, f))
+
+        with outstanding_changed:
+            outstanding_changed.wait_for(lambda: not outstanding)
+
+    log("info", "worker_stopped")
+
+
+def _iter_batch_items(input_stream):
+    """
+    Читает пакет входных объектов: JSON-массив целиком или NDJSON построчно.
+    Выдает пары (item, parse_error) - битая строка не должна ронять весь пакет.
+    """
+    import itertools
+
+    first_line = ""
+    for line in input_stream:
+        if line.strip():
+            first_line = line
+            break
+
+    if first_line.lstrip('\x00\ufeff\ufffe \t').startswith('['):
+        items = parse_input_text(first_line + input_stream.read())
+        if not isinstance(items, list):
+            raise ValueError("Batch input must be a JSON array or NDJSON")
+        for item in items:
+            yield item, None
+        return
+
+    if not first_line:
+        return
+
+    for line in itertools.chain([first_line], input_stream):
+        if not line.strip():
+            continue
+        try:
+            yield parse_input_text(line), None
+        except Exception as e:
+            yield None, str(e)
+
+
+def run_batch(workers=None, input_stream=None, output_stream=None):
+    """
+    Пакетный пересчет карт на всех ядрах.
+
+    На каждый входной объект пишется ровно одна строка результата по мере
+    готовности; "index" - позиция объекта во входе, "request_id" (если был)
+    возвращается как есть. Ошибка одного элемента не прерывает пакет.
+    """
+    from concurrent.futures import wait, FIRST_COMPLETED, ALL_COMPLETED
+
+    input_stream = input_stream or sys.stdin
+    write_response = _make_response_writer(output_stream or sys.stdout)
+    workers = workers or os.cpu_count() or 1
+    # Ограничиваем число задач в полете, чтобы не держать в памяти весь пакет
+    max_in_flight = workers * 4
+    pending = {}
+    total = 0
+    failed = 0
+
+    def flush_done(return_when):
+        nonlocal failed
+        done, _ = wait(pending, return_when=return_when)
+        for future in done:
+            index, request_id = pending.pop(future)
+            try:
+                response = future.result()
+            except Exception as e:
+                response = error_result(f"Worker failed: {e}")
+            if not response.get("success"):
+                failed += 1
+            response["index"] = index
+            if request_id is not None:
+                response["request_id"] = request_id
+            write_response(response)
+
+    log("info", "batch_started", workers=workers)
+
+    with _create_worker_pool(workers) as executor:
+        for index, (item, parse_error) in enumerate(_iter_batch_items(input_stream)):
+            total += 1
+            request_id = item.pop("request_id", None) if isinstance(item, dict) else None
+            try:
+                if parse_error:
+                    raise ValueError(parse_error)
+                get_command_handler(item)
+            except Exception as e:
+                failed += 1
+                response = error_result(str(e))
+                response["index"] = index
+                if request_id is not None:
+                    response["request_id"] = request_id
+                write_response(response)
+                continue
+
+            pending[executor.submit(process_request, item, request_id)] = (index, request_id)
+            if len(pending) >= max_in_flight:
+                flush_done(FIRST_COMPLETED)
+
+        if pending:
+            flush_done(ALL_COMPLETED)
+
+    log("info", "batch_finished", items=total, failed=failed)
+
+
+def read_input_text(args):
+    """Вход запроса: первый аргумент командной строки или stdin"""
+    if args:
+        return args[0]
+    return sys.stdin.read().strip()
+
+
+def version_info():
+    """Версии для --version (kerykeion не импортируется)"""
+    from natal_chart_cache import CACHE_FORMAT_VERSION, get_kerykeion_version
+    return {
+        "success": True,
+        "kerykeion": get_kerykeion_version(),
+        "python": sys.version.split()[0],
+        "cache_format": CACHE_FORMAT_VERSION,
+        "commands": sorted(COMMANDS),
+    }
+
+
+def check_request(input_text):
+    """
+    --check: разбирает и проверяет запрос так же, как обычный запуск,
+    но ничего не рассчитывает. Годится как health check спавна Python.
+    """
+    input_data = parse_input_text(input_text)
+    if not isinstance(input_data, dict):
+        raise ValueError("Input must be a JSON object")
+    get_command_handler(input_data)
+    deadline_option(input_data)
+    command = input_data.get("command", "natal")
+    COMMAND_VALIDATORS[command](input_data)
+    return {"success": True, "command": command, "valid": True}
+
+
+def _print_response(response):
+    print(json.dumps(response, ensure_ascii=False))
+    sys.stdout.flush()
+
+
+def main():
+    """Основная функция для запуска из командной строки"""
+    args = sys.argv[1:]
+    if args and args[0] == "--serve":
+        serve(workers=_get_int_option(args, "--workers"))
+        return
+    if args and args[0] == "--batch":
+        run_batch(workers=_get_int_option(args, "--workers"))
+        return
+    if args and args[0] == "--version":
+        print(json.dumps(version_info(), ensure_ascii=False))
+        return
+    if args and args[0] == "--check":
+        try:
+            print(json.dumps(check_request(read_input_text(args[1:])), ensure_ascii=False))
+        except Exception as e:
+            log("error", "invalid_request", error=str(e))
+            print(json.dumps(error_result(str(e)), ensure_ascii=False))
+            sys.exit(1)
+        return
+
+    import time
+    # Дедлайн отсчитывается от начала обработки, включая чтение и разбор входа
+    started = time.perf_counter()
+    start_request()
+    deadline = None
+    try:
+        # Читаем входные данные
+        input_text = read_input_text(args)
+
+        # Парсим JSON
+        with stage("parse"):
+            input_data = parse_input_text(input_text)
+        if isinstance(input_data, dict):
+            set_request_log_level(input_data.get("log_level"))
+
+        # Выбираем команду (натальная карта по умолчанию, обязательные поля проверяет она же)
+        handler = get_command_handler(input_data)
+
+        deadline_ms = deadline_option(input_data)
+        if deadline_ms is not None:
+            deadline = start_deadline(deadline_ms, started)
+            deadline.start_watchdog(_print_response, error_result("Deadline exceeded"))
+
+        # Выполняем расчет (с кэшем результатов)
+        result = finish_request_metrics(input_data, handler(input_data))
+
+        # Возвращаем результат (если сторож еще не ответил за нас)
+        if deadline is None:
+            _print_response(result)
+        elif not deadline.respond_once(lambda: _print_response(result)):
+            return
+        clear_deadline()
+        # Отложенный SVG разовый процесс не рисует: Node ждет 'close' процесса, и отрисовка
+        # перед выходом задержала бы ответ. Его дорисуют render-svg или воркер --serve
+
+    except Exception as e:
+        log("error", "request_failed", error=str(e))
+        finish_request(success=False)
+        response = error_result(str(e))
+        if deadline is None:
+            _print_response(response)
+        elif not deadline.respond_once(lambda: _print_response(response)):
+            return
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
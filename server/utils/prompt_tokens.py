@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Оценка числа токенов промта для Lunaria AI без обращения к API
+
+По умолчанию - эвристика по классам символов, близкая к токенизатору
+o200k_base (gpt-4o / gpt-4o-mini): латиница ~4 символа на токен,
+кириллица ~3, цифры - группами по 3, остальные знаки - по токену.
+Для точного подсчета: NATAL_CHART_TOKENIZER=o200k_base и установленный
+tiktoken (словарь кодировки должен уже лежать в TIKTOKEN_CACHE_DIR -
+сеть при расчете карты не используется).
+
+    python3 prompt_tokens.py < prompt.txt
+"""
+
+import os
+import sys
+
+LATIN_CHARS_PER_TOKEN = 4
+CYRILLIC_CHARS_PER_TOKEN = 3
+DIGITS_PER_TOKEN = 3
+
+_token_re = None
+_tokenizer = None
+
+
+def get_tokenizer():
+    """Кодировка tiktoken из NATAL_CHART_TOKENIZER; None - оценка эвристикой"""
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = False
+        encoding_name = os.environ.get("NATAL_CHART_TOKENIZER")
+        if encoding_name:
+            try:
+                import tiktoken
+                _tokenizer = tiktoken.get_encoding(encoding_name)
+            except Exception as e:
+                from instrumentation import log
+                log("warning", "tokenizer_unavailable", tokenizer=encoding_name, error=str(e))
+    return _tokenizer or None
+
+
+def tokenizer_name():
+    tokenizer = get_tokenizer()
+    return tokenizer.name if tokenizer else "estimate"
+
+
+def _ceil_div(length, per_token):
+    return -(-length // per_token)
+
+
+def estimate_tokens(text):
+    """Число токенов text: tiktoken, если настроен, иначе эвристика"""
+    tokenizer = get_tokenizer()
+    if tokenizer:
+        return len(tokenizer.encode(text))
+
+    global _token_re
+    if _token_re is None:
+        import re
+        _token_re = re.compile(r"([A-Za-z]+)|([Ѐ-ӿ]+)|(\d+)|(\n+)|(\S)")
+    count = 0
+    for latin, cyrillic, digits, _newlines, _other in _token_re.findall(text):
+        if latin:
+            count += _ceil_div(len(latin), LATIN_CHARS_PER_TOKEN)
+        elif cyrillic:
+            count += _ceil_div(len(cyrillic), CYRILLIC_CHARS_PER_TOKEN)
+        elif digits:
+            count += _ceil_div(len(digits), DIGITS_PER_TOKEN)
+        else:
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    print(estimate_tokens(sys.stdin.read()))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Дедлайн запроса калькулятора натальных карт для Lunaria AI
+
+"deadline_ms" во входе - сколько миллисекунд есть у запроса с момента, когда
+калькулятор начал его обрабатывать. Этапы сверяются с остатком и деградируют
+по порядку (см. natal_chart_calculator.calculate_natal_chart):
+    svg            SVG откладывается (render-svg) или пропускается
+    geonames_cache координаты Geonames - только из кэша ответов, без сети
+    deadline       время вышло: ответ - то, что уже готово (промт без SVG),
+                   или ошибка; выставляет сторож
+Что деградировало - список "degraded" в ответе.
+
+Сторож (start_watchdog) нужен при разовом запуске: Node ждет закрытия
+процесса, поэтому по истечении дедлайна ответ пишется в stdout и процесс
+завершается, даже если этап завис. Воркеры пула (--serve/--batch) сторожа
+не запускают - у них этапы проверяют остаток, а сеть ограничена таймаутом.
+"""
+
+import os
+import time
+
+_current = None
+
+
+def deadline_option(input_data):
+    """"deadline_ms" запроса с проверкой; None - без дедлайна"""
+    if not isinstance(input_data, dict) or input_data.get("deadline_ms") is None:
+        return None
+    deadline_ms = input_data["deadline_ms"]
+    if isinstance(deadline_ms, bool) or not isinstance(deadline_ms, (int, float)) or deadline_ms <= 0:
+        raise ValueError("Field 'deadline_ms' must be a positive number")
+    return float(deadline_ms)
+
+
+class Deadline:
+    """Остаток времени запроса, список деградаций и частичный результат для сторожа"""
+
+    def __init__(self, deadline_ms, started=None):
+        import threading
+        self.deadline_ms = deadline_ms
+        self.expires_at = (time.perf_counter() if started is None else started) + deadline_ms / 1000
+        self.degraded = []
+        # Частичный ответ, который сторож отдаст, если полный не успеет
+        self.partial = None
+        self._lock = threading.Lock()
+        self._responded = False
+        self._timer = None
+
+    def remaining_ms(self):
+        return (self.expires_at - time.perf_counter()) * 1000
+
+    def degrade(self, step):
+        if step not in self.degraded:
+            self.degraded.append(step)
+
+    def respond_once(self, write):
+        """Пишет ответ, если ни основной поток, ни сторож еще не ответили"""
+        with self._lock:
+            if self._responded:
+                return False
+            self._responded = True
+            write()
+            return True
+
+    def start_watchdog(self, write_response, fallback):
+        """
+        По истечении дедлайна отдает частичный результат (или fallback) с
+        "degraded" и завершает процесс: зависший этап не держит вызывающего.
+        """
+        import threading
+
+        def on_expired():
+            response = dict(self.partial) if self.partial is not None else dict(fallback)
+            response["degraded"] = self.degraded + ["deadline"]
+            if self.respond_once(lambda: write_response(response)):
+                os._exit(0 if response.get("success") else 1)
+
+        self._timer = threading.Timer(max(self.remaining_ms(), 0) / 1000, on_expired)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def cancel(self):
+        if self._timer is not None:
+            self._timer.cancel()
+
+
+def start_deadline(deadline_ms, started=None):
+    """Дедлайн текущего запроса (один запрос на процесс в каждый момент)"""
+    global _current
+    _current = Deadline(deadline_ms, started)
+    return _current
+
+
+def current_deadline():
+    """Дедлайн текущего запроса или None"""
+    return _current
+
+
+def clear_deadline():
+    global _current
+    if _current is not None:
+        _current.cancel()
+    _current = None
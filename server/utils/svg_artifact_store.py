@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Хранилище SVG-карт с адресацией по содержимому для Lunaria AI
+
+Файл называется SHA-256 от своего содержимого и лежит в двухуровневой
+шардированной папке: natal-charts/ab/cd/abcd....svg. Поэтому одинаковые
+имена пользователей не перезаписывают чужие карты, а вызывающий код
+получает ровно тот файл, который записал (без поиска "самого нового").
+Запись атомарная (tmp + os.replace). По желанию рядом кладутся сжатые
+копии .svg.gz / .svg.br для раздачи статикой без сжатия на лету
+(NATAL_CHART_SVG_PRECOMPRESS=gzip,br; br - если установлен пакет brotli).
+
+Рост папки ограничивает сборка мусора: удаление файлов старше N дней и
+самых давно использованных, пока общий размер больше лимита. Повторная
+запись или попадание в кэш обновляет mtime файла, это и есть "использование".
+
+    python3 svg_artifact_store.py stats
+    python3 svg_artifact_store.py gc [--max-age-days N] [--max-size-mb M] [--dry-run]
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+DEFAULT_ROOT = Path(__file__).resolve().parent.parent / 'public' / 'natal-charts'
+DEFAULT_GC_MAX_AGE_DAYS = 90
+DEFAULT_GC_MAX_SIZE_MB = 2048
+# Незавершенные временные файлы старше этого возраста считаются мусором
+STALE_TMP_SECONDS = 3600
+
+COMPRESSED_SUFFIXES = (".gz", ".br")
+
+
+def _compress_brotli(data):
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli.compress(data, quality=11)
+
+
+class SvgArtifactStore:
+    """Шардированное хранилище SVG с именами по SHA-256"""
+
+    def __init__(self, root=None, precompress=None):
+        self.root = Path(root or os.environ.get("NATAL_CHART_SVG_DIR") or DEFAULT_ROOT)
+        if precompress is None:
+            precompress = os.environ.get("NATAL_CHART_SVG_PRECOMPRESS", "")
+        if isinstance(precompress, str):
+            precompress = [item.strip() for item in precompress.split(",") if item.strip()]
+        self.precompress = set(precompress)
+
+    @staticmethod
+    def name_for_digest(digest):
+        """Относительное имя файла (оно же путь под /natal-charts/)"""
+        return f"{digest[:2]}/{digest[2:4]}/{digest}.svg"
+
+    def path_for(self, name):
+        return self.root / name
+
+    def put(self, svg_text):
+        """Сохраняет SVG и возвращает его относительное имя"""
+        data = svg_text.encode("utf-8") if isinstance(svg_text, str) else svg_text
+        digest = hashlib.sha256(data).hexdigest()
+        name = self.name_for_digest(digest)
+        path = self.path_for(name)
+
+        if path.exists():
+            # Такой же файл уже есть - только отмечаем использование для GC
+            os.utime(path)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._write_atomic(path, data)
+
+        if "gzip" in self.precompress:
+            gz_path = path.with_name(path.name + ".gz")
+            if not gz_path.exists():
+                self._write_atomic(gz_path, gzip.compress(data, compresslevel=9, mtime=0))
+        if "br" in self.precompress:
+            br_path = path.with_name(path.name + ".br")
+            if not br_path.exists():
+                compressed = _compress_brotli(data)
+                if compressed is not None:
+                    self._write_atomic(br_path, compressed)
+
+        return name
+
+    @staticmethod
+    def _write_atomic(path, data):
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as out:
+            out.write(data)
+        os.replace(tmp_path, path)
+
+    def touch(self, name):
+        """Отмечает использование файла; False, если его уже нет (удален GC)"""
+        try:
+            os.utime(self.path_for(name))
+            return True
+        except OSError:
+            return False
+
+    def _iter_artifacts(self):
+        """Все SVG под корнем (включая старые плоские "Имя - Natal Chart.svg")"""
+        if not self.root.exists():
+            return
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = Path(dirpath) / filename
+                if filename.endswith(".tmp"):
+                    yield path, "tmp"
+                elif filename.endswith(".svg"):
+                    yield path, "svg"
+
+    def _remove(self, path):
+        """Удаляет SVG вместе со сжатыми копиями; возвращает освобожденные байты"""
+        freed = 0
+        for candidate in [path] + [path.with_name(path.name + suffix) for suffix in COMPRESSED_SUFFIXES]:
+            try:
+                size = candidate.stat().st_size
+                candidate.unlink()
+                freed += size
+            except FileNotFoundError:
+                continue
+        return freed
+
+    def _artifact_size(self, path):
+        size = 0
+        for candidate in [path] + [path.with_name(path.name + suffix) for suffix in COMPRESSED_SUFFIXES]:
+            try:
+                size += candidate.stat().st_size
+            except FileNotFoundError:
+                continue
+        return size
+
+    def stats(self):
+        files = 0
+        total = 0
+        for path, kind in self._iter_artifacts():
+            if kind == "svg":
+                files += 1
+                total += self._artifact_size(path)
+        return {"root": str(self.root), "files": files, "size_bytes": total}
+
+    def gc(self, max_age_days=DEFAULT_GC_MAX_AGE_DAYS, max_size_mb=DEFAULT_GC_MAX_SIZE_MB, dry_run=False):
+        """
+        Сборка мусора: сначала по возрасту (mtime), затем LRU до лимита размера.
+        Возвращает статистику удаленного.
+        """
+        now = time.time()
+        artifacts = []
+        removed = 0
+        freed = 0
+
+        for path, kind in self._iter_artifacts():
+            try:
+                mtime = path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if kind == "tmp":
+                if now - mtime > STALE_TMP_SECONDS:
+                    freed += path.stat().st_size if dry_run else self._remove(path)
+                continue
+            size = self._artifact_size(path)
+            if max_age_days is not None and now - mtime > max_age_days * 86400:
+                removed += 1
+                freed += size if dry_run else self._remove(path)
+            else:
+                artifacts.append((mtime, size, path))
+
+        total = sum(size for _, size, _ in artifacts)
+        kept = len(artifacts)
+        if max_size_mb is not None:
+            limit = max_size_mb * 1024 * 1024
+            artifacts.sort()
+            for _, size, path in artifacts:
+                if total <= limit:
+                    break
+                total -= size
+                kept -= 1
+                removed += 1
+                freed += size if dry_run else self._remove(path)
+
+        if not dry_run:
+            self._remove_empty_shards()
+
+        return {"removed": removed, "freed_bytes": freed, "kept": kept,
+                "kept_bytes": total, "dry_run": dry_run}
+
+    def _remove_empty_shards(self):
+        for dirpath, _, _ in os.walk(self.root, topdown=False):
+            if Path(dirpath) != self.root and not os.listdir(dirpath):
+                try:
+                    os.rmdir(dirpath)
+                except OSError:
+                    pass
+
+
+def main():
+    args = sys.argv[1:]
+    command = args[0] if args else "stats"
+    store = SvgArtifactStore()
+
+    if command == "stats":
+        print(json.dumps(store.stats(), ensure_ascii=False))
+    elif command == "gc":
+        options = {"max_age_days": DEFAULT_GC_MAX_AGE_DAYS, "max_size_mb": DEFAULT_GC_MAX_SIZE_MB, "dry_run": False}
+        rest = iter(args[1:])
+        for arg in rest:
+            if arg == "--max-age-days":
+                options["max_age_days"] = float(next(rest))
+            elif arg == "--max-size-mb":
+                options["max_size_mb"] = float(next(rest))
+            elif arg == "--dry-run":
+                options["dry_run"] = True
+            else:
+                print(f"❌ Unknown option: {arg}", file=sys.stderr)
+                sys.exit(1)
+        result = store.gc(**options)
+        print(f"🧹 SVG GC: removed {result['removed']} file(s), freed {result['freed_bytes']} bytes", file=sys.stderr)
+        print(json.dumps(result, ensure_ascii=False))
+    else:
+        print(__doc__, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
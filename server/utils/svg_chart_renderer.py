@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Быстрая отрисовка SVG натальной карты для Lunaria AI
+
+KerykeionChartSVG(...).makeTemplate() на каждую карту заново читает
+настройки и CSS темы, подставляет в chart.xml определения глифов, цвета
+и круги колеса, а словарь шаблона строит дважды. Здесь все, что зависит
+только от (темы, языка), готовится один раз на процесс:
+    - настройки kerykeion, CSS темы, строки языка;
+    - chart.xml, разобранный на литералы и имена подстановок, со всеми
+      статичными значениями (цвета, круги, defs глифов) уже внутри;
+    - сетка аспектов (клетки и глифы планет), без символов аспектов.
+На каждую карту рисуются только планеты, куспиды домов, линии и символы
+аспектов, подписи и кольца знаков и градусов (они повернуты по Асценденту
+карты, поэтому статичными быть не могут). Аспекты считаются теми же
+правилами, что у NatalAspects, но без моделей pydantic.
+
+Результат побайтно совпадает с makeTemplate() (проверка и замер времени и
+размера: benchmarks/bench_svg_render.py).
+"""
+
+import sys
+from string import Template
+
+DEFAULT_THEME = "dark"
+DEFAULT_LANGUAGE = "RU"
+
+# Всегда в оппозиции друг к другу - kerykeion такие пары не рисует
+OPPOSITE_PAIRS = {
+    ("Ascendant", "Descendant"), ("Descendant", "Ascendant"),
+    ("Medium_Coeli", "Imum_Coeli"), ("Imum_Coeli", "Medium_Coeli"),
+    ("True_Node", "True_South_Node"), ("True_South_Node", "True_Node"),
+    ("Mean_Node", "Mean_South_Node"), ("Mean_South_Node", "Mean_Node"),
+}
+ASPECT_GRID_BOX_SIZE = 14
+
+
+class ChartTemplate:
+    """Статичные части натальной карты для одной пары (тема, язык)"""
+
+    def __init__(self, theme=DEFAULT_THEME, language=DEFAULT_LANGUAGE):
+        from pathlib import Path
+        from kerykeion import KerykeionChartSVG
+        from kerykeion.aspects.natal_aspects import AXES_LIST
+        from kerykeion.charts.charts_utils import draw_first_circle, draw_second_circle, draw_third_circle
+        from kerykeion.settings.config_constants import DEFAULT_ACTIVE_ASPECTS, DEFAULT_ACTIVE_POINTS
+        from kerykeion.settings.kerykeion_settings import get_settings
+
+        self.theme = theme
+        self.language = language
+        settings = get_settings()
+        self.language_settings = settings["language_settings"][language]
+        self.colors = settings["chart_colors"]
+        self.planets_settings = settings["celestial_points"]
+        self.axes_list = set(AXES_LIST)
+        self.axes_orbit = settings.general_settings.axes_orbit
+
+        # Активные точки - в порядке настроек, как у KerykeionChartSVG и NatalAspects
+        self.active_planets = [body for body in self.planets_settings if body["name"] in DEFAULT_ACTIVE_POINTS]
+        for body in self.active_planets:
+            body["is_active"] = True
+        self.point_names = [body["name"] for body in self.active_planets]
+        self.point_ids = [body["id"] for body in self.active_planets]
+
+        # Аспекты: порядок из настроек, орбы из DEFAULT_ACTIVE_ASPECTS (первый подходящий выигрывает)
+        active_orbs = {aspect["name"]: aspect["orb"] for aspect in DEFAULT_ACTIVE_ASPECTS}
+        self.aspect_rules = [(aspect["name"], aspect["degree"], active_orbs[aspect["name"]])
+                             for aspect in settings["aspects"] if aspect["name"] in active_orbs]
+        self.aspect_colors = {}
+        for aspect in settings["aspects"]:
+            self.aspect_colors.setdefault(aspect["name"], aspect["color"])
+
+        # Геометрия натальной карты - константы KerykeionChartSVG
+        self.main_radius = 240
+        self.first_circle_radius, self.second_circle_radius, self.third_circle_radius = 0, 36, 120
+        self.extra_points = KerykeionChartSVG._PLANET_IN_ZODIAC_EXTRA_POINTS
+        self.zodiac_styles = [f'fill:{self.colors[f"zodiac_bg_{i}"]}; fill-opacity: 0.5;' for i in range(12)]
+
+        charts_dir = Path(sys.modules[KerykeionChartSVG.__module__].__file__).parent
+        color_style_tag = (charts_dir / "themes" / f"{theme}.css").read_text() if theme else ""
+        r = self.main_radius
+        static_values = {
+            "color_style_tag": color_style_tag,
+            "chart_height": KerykeionChartSVG._DEFAULT_HEIGHT,
+            "chart_width": KerykeionChartSVG._DEFAULT_NATAL_WIDTH,
+            "viewbox": KerykeionChartSVG._BASIC_CHART_VIEWBOX,
+            "transitRing": "",
+            "first_circle": draw_first_circle(r, self.colors["zodiac_radix_ring_2"], "Natal", self.first_circle_radius),
+            "second_circle": draw_second_circle(r, self.colors["zodiac_radix_ring_1"], self.colors["paper_1"], "Natal", self.second_circle_radius),
+            "third_circle": draw_third_circle(r, self.colors["zodiac_radix_ring_0"], self.colors["paper_1"], "Natal", self.third_circle_radius),
+            "paper_color_0": self.colors["paper_0"],
+            "paper_color_1": self.colors["paper_1"],
+        }
+        for planet in self.planets_settings:
+            static_values[f"planets_color_{planet['id']}"] = planet["color"]
+        for i in range(12):
+            static_values[f"zodiac_color_{i}"] = self.colors[f"zodiac_icon_{i}"]
+        for aspect in settings["aspects"]:
+            static_values[f"orb_color_{aspect['degree']}"] = aspect["color"]
+
+        template_text = (charts_dir / "templates" / "chart.xml").read_text(encoding="utf-8", errors="ignore")
+        self.segments = self._compile(template_text, static_values)
+        self.aspect_grid = self._compile_aspect_grid()
+
+    @staticmethod
+    def _compile(template_text, static_values):
+        """
+        Разбирает шаблон на литералы (str) и имена подстановок ([name]).
+        Статичные значения подставляются сразу; makeTemplate заменяет " на ' во
+        всем документе - здесь это делается для литералов один раз.
+        """
+        segments = []
+        literal = []
+        position = 0
+        for match in Template.pattern.finditer(template_text):
+            literal.append(template_text[position:match.start()])
+            position = match.end()
+            name = match.group("named") or match.group("braced")
+            if match.group("escaped") is not None:
+                literal.append("$")
+            elif name in static_values:
+                literal.append(str(static_values[name]))
+            elif name is not None:
+                segments.append("".join(literal).replace('"', "'"))
+                segments.append([name])
+                literal = []
+            else:
+                raise ValueError(f"Invalid placeholder in chart template at {match.start()}")
+        literal.append(template_text[position:])
+        segments.append("".join(literal).replace('"', "'"))
+        return segments
+
+    def _compile_aspect_grid(self, x_start=380, y_start=468):
+        """
+        Сетка аспектов как у draw_aspect_grid: клетки и глифы планет - строки,
+        места под символ аспекта - (id_a, id_b, начало тега <use>)
+        """
+        box_size = ASPECT_GRID_BOX_SIZE
+        style = f"stroke:{self.colors['paper_0']}; stroke-width: 1px; stroke-width: 0.5px; fill:none"
+        items = []
+        reversed_planets = self.active_planets[::-1]
+        for index, planet_a in enumerate(reversed_planets):
+            items.append(f'<rect kr:node="AspectsGridRect" x="{x_start}" y="{y_start}" width="{box_size}" height="{box_size}" style="{style}"/>')
+            items.append(f'<use transform="scale(0.4)" x="{(x_start + 2) * 2.5}" y="{(y_start + 1) * 2.5}" xlink:href="#{planet_a["name"]}" />')
+            x_start += box_size
+            y_start -= box_size
+            x_aspect = x_start
+            y_aspect = y_start + box_size
+            for planet_b in reversed_planets[index + 1:]:
+                items.append(f'<rect kr:node="AspectsGridRect" x="{x_aspect}" y="{y_aspect}" width="{box_size}" height="{box_size}" style="{style}"/>')
+                x_aspect += box_size
+                items.append((planet_a["id"], planet_b["id"], f'<use  x="{x_aspect - box_size + 1}" y="{y_aspect + 1}" xlink:href="#orb'))
+        return items
+
+    def natal_aspects(self, points):
+        """
+        Аспекты между активными точками по правилам NatalAspects.relevant_aspects:
+        кортежи (имя1, долгота1, имя2, долгота2, аспект, градус аспекта, id1, id2)
+        """
+        from swisseph import difdeg2n
+        aspects = []
+        count = len(points)
+        for first in range(count):
+            name_1 = self.point_names[first]
+            pos_1 = points[first]["abs_pos"]
+            for second in range(first + 1, count):
+                name_2 = self.point_names[second]
+                if (name_1, name_2) in OPPOSITE_PAIRS:
+                    continue
+                pos_2 = points[second]["abs_pos"]
+                distance = abs(difdeg2n(pos_1, pos_2))
+                whole_degrees = int(distance)
+                for aspect_name, aspect_degree, orb in self.aspect_rules:
+                    if aspect_degree - orb <= whole_degrees <= aspect_degree + orb:
+                        break
+                else:
+                    continue
+                # Аспекты осей - только в пределах axes_orbit
+                if (name_1 in self.axes_list or name_2 in self.axes_list) and abs(distance - aspect_degree) >= self.axes_orbit:
+                    continue
+                aspects.append((name_1, pos_1, name_2, pos_2, aspect_name, aspect_degree,
+                                self.point_ids[first], self.point_ids[second]))
+        return aspects
+
+    def _draw_aspect_lines(self, aspects, seventh_house):
+        """Линии аспектов - как draw_aspect_line для натальной карты"""
+        from kerykeion.charts.charts_utils import sliceToX, sliceToY
+        r = self.main_radius
+        ar = self.main_radius - self.third_circle_radius
+        out = []
+        for name_1, pos_1, name_2, pos_2, aspect_name, _, _, _ in aspects:
+            color = self.aspect_colors.get(aspect_name)
+            if not color:
+                continue
+            first_offset = (int(seventh_house) / -1) + int(pos_1)
+            second_offset = (int(seventh_house) / -1) + int(pos_2)
+            x1 = sliceToX(0, ar, first_offset) + (r - ar)
+            y1 = sliceToY(0, ar, first_offset) + (r - ar)
+            x2 = sliceToX(0, ar, second_offset) + (r - ar)
+            y2 = sliceToY(0, ar, second_offset) + (r - ar)
+            out.append(
+                f'<g kr:node="Aspect" kr:aspectname="{aspect_name}" kr:to="{name_1}" kr:tooriginaldegrees="{pos_1}" kr:from="{name_2}" kr:fromoriginaldegrees="{pos_2}">'
+                f'<line class="aspect" x1="{x1}" y1="{y1}" x2="{x2}" y2="{y2}" style="stroke: {color}; stroke-width: 1; stroke-opacity: .9;"/>'
+                f"</g>"
+            )
+        return "".join(out)
+
+    def _draw_aspect_grid(self, aspects):
+        degrees_by_pair = {}
+        for *_, aspect_degree, id_1, id_2 in aspects:
+            degrees_by_pair[(id_1, id_2)] = aspect_degree
+            degrees_by_pair[(id_2, id_1)] = aspect_degree
+        out = []
+        for item in self.aspect_grid:
+            if isinstance(item, str):
+                out.append(item)
+                continue
+            aspect_degree = degrees_by_pair.get((item[0], item[1]))
+            if aspect_degree is not None:
+                out.append(f'{item[2]}{aspect_degree}" />')
+        return "".join(out)
+
+    def _element_strings(self, points):
+        """Проценты стихий - как KerykeionChartSVG._calculate_elements_points_from_planets"""
+        elements = ("fire", "earth", "air", "water")
+        totals = dict.fromkeys(elements, 0.0)
+        for body, point in zip(self.active_planets, points):
+            sign_num = point.sign_num
+            extra_points = 0
+            for related_sign in body["related_zodiac_signs"]:
+                if int(related_sign) == int(sign_num):
+                    extra_points = self.extra_points
+            totals[elements[sign_num % 4]] += body["element_points"] + extra_points
+        total = sum(totals.values())
+        return {f"{element}_string": f"{self.language_settings[element]} {int(round(100 * totals[element] / total))}%"
+                for element in elements}
+
+    def template_values(self, subject):
+        """Значения подстановок, которые зависят от карты"""
+        from datetime import datetime
+        from kerykeion.charts.charts_utils import (
+            calculate_moon_phase_chart_params, convert_latitude_coordinate_to_string,
+            convert_longitude_coordinate_to_string, draw_degree_ring, draw_house_grid,
+            draw_houses_cusps_and_text_number, draw_planet_grid, draw_zodiac_slice,
+        )
+        from kerykeion.charts.draw_planets import draw_planets
+        from kerykeion.kr_types import Sign
+        from kerykeion.utilities import get_houses_list
+        from typing import get_args
+
+        lang = self.language_settings
+        colors = self.colors
+        seventh_house = subject.seventh_house.abs_pos
+        points = [subject.get(name.lower()) for name in self.point_names]
+        aspects = self.natal_aspects(points)
+        houses = get_houses_list(subject)
+
+        if subject.zodiac_type == 'Tropic':
+            zodiac_info = f"{lang.get('zodiac', 'Zodiac')}: {lang.get('tropical', 'Tropical')}"
+        else:
+            import swisseph as swe
+            mode_name = swe.get_ayanamsa_name(getattr(swe, "SIDM_" + subject.sidereal_mode))
+            zodiac_info = f"{lang.get('ayanamsa', 'Ayanamsa')}: {mode_name}"
+
+        location = subject.city
+        if len(location) > 35:
+            split_location = location.split(",")
+            if len(split_location) > 1:
+                location = split_location[0] + ", " + split_location[-1]
+                if len(location) > 35:
+                    location = location[:35] + "..."
+            else:
+                location = location[:35] + "..."
+
+        moon_phase = calculate_moon_phase_chart_params(subject.lunar_phase["degrees_between_s_m"], subject.lat)
+        local_datetime = datetime.fromisoformat(subject.iso_formatted_local_datetime).strftime('%Y-%m-%d %H:%M [%z]')
+
+        values = {
+            "stringTitle": subject.name,
+            "top_left_0": f'{lang["info"]}:',
+            "top_left_1": location,
+            "top_left_2": local_datetime[:-3] + ':' + local_datetime[-3:],
+            "top_left_3": f"{lang['latitude']}: {convert_latitude_coordinate_to_string(subject.lat, lang['north'], lang['south'])}",
+            "top_left_4": f"{lang['longitude']}: {convert_longitude_coordinate_to_string(subject.lng, lang['east'], lang['west'])}",
+            "top_left_5": f"{lang['type']}: {lang.get('Natal', 'Natal')}",
+            "bottom_left_0": f"{lang.get('houses_system_' + subject.houses_system_identifier, subject.houses_system_name)} {lang.get('houses', 'Houses')}",
+            "bottom_left_1": zodiac_info,
+            "bottom_left_2": f'{lang.get("lunar_phase", "Lunar Phase")} {lang.get("day", "Day").lower()}: {subject.lunar_phase.get("moon_phase", "")}',
+            "bottom_left_3": f'{lang.get("lunar_phase", "Lunar Phase")}: {lang.get(subject.lunar_phase.moon_phase_name.lower().replace(" ", "_"), subject.lunar_phase.moon_phase_name)}',
+            "bottom_left_4": f'{lang.get(subject.perspective_type.lower().replace(" ", "_"), subject.perspective_type)}',
+            "lunar_phase_rotate": moon_phase["lunar_phase_rotate"],
+            "lunar_phase_circle_center_x": moon_phase["circle_center_x"],
+            "lunar_phase_circle_radius": moon_phase["circle_radius"],
+            "makeZodiac": "".join(
+                draw_zodiac_slice(c1=self.first_circle_radius, chart_type="Natal", seventh_house_degree_ut=seventh_house,
+                                  num=i, r=self.main_radius, style=self.zodiac_styles[i], type=sign)
+                for i, sign in enumerate(get_args(Sign))
+            ),
+            "degreeRing": draw_degree_ring(self.main_radius, self.first_circle_radius, seventh_house, colors["paper_0"]),
+            "makeAspects": self._draw_aspect_lines(aspects, seventh_house),
+            "makeAspectGrid": self._draw_aspect_grid(aspects),
+            "makeHousesGrid": draw_house_grid(
+                main_subject_houses_list=houses,
+                chart_type="Natal",
+                text_color=colors["paper_0"],
+                house_cusp_generale_name_label=lang["cusp"],
+            ),
+            "makeHouses": draw_houses_cusps_and_text_number(
+                r=self.main_radius,
+                first_subject_houses_list=houses,
+                standard_house_cusp_color=colors["houses_radix_line"],
+                first_house_color=self.planets_settings[12]["color"],
+                tenth_house_color=self.planets_settings[13]["color"],
+                seventh_house_color=self.planets_settings[14]["color"],
+                fourth_house_color=self.planets_settings[15]["color"],
+                c1=self.first_circle_radius,
+                c3=self.third_circle_radius,
+                chart_type="Natal",
+            ),
+            "makePlanets": draw_planets(
+                available_planets_setting=self.active_planets,
+                chart_type="Natal",
+                radius=self.main_radius,
+                available_kerykeion_celestial_points=points,
+                third_circle_radius=self.third_circle_radius,
+                main_subject_first_house_degree_ut=subject.first_house.abs_pos,
+                main_subject_seventh_house_degree_ut=seventh_house,
+            ),
+            "makePlanetGrid": draw_planet_grid(
+                planets_and_houses_grid_title=lang["planets_and_house"],
+                subject_name=subject.name,
+                available_kerykeion_celestial_points=points,
+                chart_type="Natal",
+                text_color=colors["paper_0"],
+                celestial_point_language=lang["celestial_points"],
+            ),
+        }
+        values.update(self._element_strings(points))
+        return values
+
+    def render(self, subject):
+        """SVG натальной карты (строка) для AstrologicalSubject или его модели"""
+        values = self.template_values(subject)
+        return "".join(
+            segment if isinstance(segment, str) else str(values[segment[0]]).replace('"', "'")
+            for segment in self.segments
+        )
+
+
+_templates = {}
+
+
+def get_chart_template(theme=DEFAULT_THEME, language=DEFAULT_LANGUAGE):
+    """Статичные части карты для (тема, язык) - строятся один раз на процесс"""
+    key = (theme, language)
+    template = _templates.get(key)
+    if template is None:
+        template = _templates[key] = ChartTemplate(theme, language)
+    return template
+
+
+def render_natal_svg(subject, theme=DEFAULT_THEME, language=DEFAULT_LANGUAGE):
+    """SVG натальной карты строкой - то же, что KerykeionChartSVG(...).makeTemplate()"""
+    return get_chart_template(theme, language).render(subject)
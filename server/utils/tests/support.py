@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+Общие помощники тестов калькулятора натальных карт
+
+Кэш результатов, SVG и записи карт на время тестов уводятся во временную
+папку (как в бенчмарках) - рабочие cache/ и public/ не трогаются. Корпус
+входных данных - тот же, что у бенчмарков: с координатами, без сети.
+
+    python3 -m pytest server/utils/tests
+"""
+
+import atexit
+import os
+import sys
+import tempfile
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARKS_DIR = os.path.join(os.path.dirname(TESTS_DIR), "benchmarks")
+if BENCHMARKS_DIR not in sys.path:
+    sys.path.insert(0, BENCHMARKS_DIR)
+
+from bench_common import isolated_environment, load_calculator, load_corpus, make_subject  # noqa: E402,F401
+
+_workdir = tempfile.TemporaryDirectory(prefix="natal-test-")
+atexit.register(_workdir.cleanup)
+os.environ.update(isolated_environment(_workdir.name))
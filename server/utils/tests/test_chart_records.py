@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""Записи карт в кэше результатов: вытесняются по тем же правилам"""
+
+import os
+import tempfile
+import time
+import unittest
+
+from tests.support import load_calculator, load_corpus
+
+from natal_chart_cache import NatalChartCache
+
+
+class ChartRecordsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory(prefix="natal-records-test-")
+        self.path = os.path.join(self.workdir.name, "natal_chart_cache.sqlite")
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def test_records_evicted_by_count(self):
+        cache = NatalChartCache(self.path, max_entries=2)
+        try:
+            for index in range(3):
+                cache.put_record(f"{index:064x}", {"chart": index})
+                time.sleep(0.01)
+            self.assertIsNone(cache.get_record(f"{0:064x}"))
+            self.assertEqual(cache.get_record(f"{2:064x}"), {"chart": 2})
+            self.assertEqual(cache.stats()["records"], 2)
+        finally:
+            cache.close()
+
+    def test_records_evicted_by_age(self):
+        cache = NatalChartCache(self.path, max_age_days=1)
+        try:
+            cache.put_record("a" * 64, {"chart": 1})
+            cache._conn.execute("UPDATE records SET created_at = created_at - 2 * 86400")
+            self.assertIsNone(cache.get_record("a" * 64))
+            self.assertEqual(cache.stats()["records"], 0)
+        finally:
+            cache.close()
+
+    def test_natal_record_stored_in_cache(self):
+        calculator = load_calculator()
+        natal = calculator.process_request(dict(load_corpus(10)[9], use_cache=False))
+        self.assertTrue(natal["success"], natal)
+        cache = NatalChartCache()
+        try:
+            self.assertEqual(cache.get_record(natal["chart_key"])["chart"], natal["chart"])
+        finally:
+            cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""Дедлайн запроса: деградации не попадают в кэш, отложенный SVG не держит процесс"""
+
+import json
+import subprocess
+import sys
+import unittest
+
+from tests.support import load_calculator, load_corpus
+
+from bench_common import CALCULATOR_PATH
+
+
+class DeadlineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calculator = load_calculator()
+
+    def test_degraded_result_cached_without_flag(self):
+        request = load_corpus(8)[7]
+        degraded = self.calculator.process_request(dict(request, deadline_ms=1))
+        self.assertTrue(degraded["success"], degraded)
+        self.assertEqual(degraded["svg_status"], "pending")
+        self.assertEqual(degraded["degraded"], ["svg"])
+
+        cached = self.calculator.process_request(request)
+        self.assertEqual(cached["cache"], "hit")
+        self.assertEqual(cached["svg_status"], "ready")
+        self.assertNotIn("degraded", cached)
+
+    def test_one_shot_exits_without_rendering_deferred_svg(self):
+        request = dict(load_corpus(9)[8], svg_mode="deferred", deadline_ms=60000)
+        process = subprocess.run([sys.executable, str(CALCULATOR_PATH)], input=json.dumps(request),
+                                 capture_output=True, text=True, timeout=60)
+        self.assertEqual(process.returncode, 0, process.stderr)
+        response = json.loads(process.stdout)
+        self.assertEqual(response["svg_status"], "pending")
+        # SVG дорисует render-svg, а не разовый процесс перед выходом
+        self.assertIsNone(self.calculator.load_chart_record(response["chart_key"]).get("svg_name"))
+        rendered = self.calculator.process_request({"command": "render-svg", "chart_key": response["chart_key"]})
+        self.assertEqual(rendered["svg_status"], "ready")
+
+
+if __name__ == "__main__":
+    unittest.main()
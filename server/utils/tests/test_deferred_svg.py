@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Отложенный SVG: запись карты, кэш результатов и render-svg под одним ключом"""
+
+import json
+import subprocess
+import sys
+import unittest
+
+from tests.support import load_calculator, load_corpus
+
+from bench_common import CALCULATOR_PATH
+
+
+class DeferredSvgTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calculator = load_calculator()
+
+    def assert_svg_ready(self, response):
+        self.assertTrue(response["success"], response)
+        self.assertEqual(response["svg_status"], "ready")
+        self.assertIsNotNone(response["svg_name"])
+        for entry in response.get("variants", {}).values():
+            self.assertEqual(entry["svg_status"], "ready")
+            self.assertEqual(entry["svg_name"], response["svg_name"])
+
+    def test_deferred_then_sync_with_variants(self):
+        request = dict(load_corpus(5)[4], variants={"languages": ["RU"]})
+        deferred = self.calculator.process_request(dict(request, svg_mode="deferred"))
+        self.assertEqual(deferred["svg_status"], "pending")
+        self.assertEqual(deferred["variants"]["RU:dark:P"]["svg_status"], "pending")
+
+        synced = self.calculator.process_request(request)
+        self.assertEqual(synced["chart_key"], deferred["chart_key"])
+        self.assert_svg_ready(synced)
+        # Кэш обновлен той же отрисовкой - повторный запрос сразу с SVG
+        self.assert_svg_ready(self.calculator.process_request(request))
+
+    def test_render_svg_updates_cached_variants(self):
+        request = dict(load_corpus(6)[5], variants={"languages": ["RU"]})
+        deferred = self.calculator.process_request(dict(request, svg_mode="deferred"))
+        rendered = self.calculator.process_request({"command": "render-svg", "chart_key": deferred["chart_key"]})
+        self.assertEqual(rendered["svg_status"], "ready")
+
+        cached = self.calculator.process_request(request)
+        self.assertEqual(cached["cache"], "hit")
+        self.assert_svg_ready(cached)
+        self.assertEqual(cached["svg_name"], rendered["svg_name"])
+
+    def test_one_shot_leaves_svg_to_render_svg(self):
+        request = dict(load_corpus(7)[6], svg_mode="deferred")
+        process = subprocess.run([sys.executable, str(CALCULATOR_PATH)], input=json.dumps(request),
+                                 capture_output=True, text=True, timeout=60)
+        self.assertEqual(process.returncode, 0, process.stderr)
+        response = json.loads(process.stdout)
+        self.assertEqual(response["svg_status"], "pending")
+        self.assertIsNone(self.calculator.load_chart_record(response["chart_key"]).get("svg_name"))
+
+        rendered = self.calculator.process_request({"command": "render-svg", "chart_key": response["chart_key"]})
+        self.assertEqual(rendered["svg_status"], "ready")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Таблица эфемерид медленных тел и транзиты за период"""
+
+import os
+import tempfile
+import unittest
+
+from tests.support import load_calculator, load_corpus
+
+import ephemeris_table
+from aspect_engine import TRANSIT_BODIES, body_positions_many, julian_day
+
+
+class EphemerisTableTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.workdir = tempfile.TemporaryDirectory(prefix="natal-ephemeris-test-")
+        path = os.path.join(cls.workdir.name, "ephemeris_slow.bin")
+        ephemeris_table.build_table(path, 2024, 2024)
+        cls.table = ephemeris_table.EphemerisTable(path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.table._mm.close()
+        cls.workdir.cleanup()
+
+    def test_table_matches_swisseph(self):
+        report = ephemeris_table.verify(self.table, samples=200)
+        for body, errors in report.items():
+            self.assertLess(errors["max_arcsec"], 1.0, body)
+
+    def test_bulk_positions_use_table(self):
+        jd, _ = julian_day("2024-06-01", "06:30")
+        # Последние дни выходят за таблицу - для них swisseph
+        jds = [jd + day for day in range(0, 240, 7)]
+        longitudes, speeds = body_positions_many(jds, table=self.table)
+        reference, reference_speeds = body_positions_many(jds, table=False)
+        self.assertEqual(longitudes.shape, (len(jds), len(TRANSIT_BODIES)))
+        error = abs((longitudes - reference + 180.0) % 360.0 - 180.0) * 3600
+        self.assertLess(error.max(), 1.0)
+        self.assertLess(abs(speeds - reference_speeds).max(), 1e-4)
+        self.assertIsNone(self.table.position(jds[-1], 5))
+
+
+class TransitDaysTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calculator = load_calculator()
+        natal = self.calculator.process_request(dict(load_corpus(1)[0], use_cache=False))
+        self.user = {"id": 1, "longitudes": natal["natal_longitudes"]}
+
+    def test_days_match_single_day_requests(self):
+        period = self.calculator.process_request({"command": "transits", "date": "2024-02-27", "days": 3,
+                                                  "users": [self.user]})
+        self.assertTrue(period["success"], period)
+        self.assertEqual([day["moment"] for day in period["days"]],
+                         ["2024-02-27T12:00Z", "2024-02-28T12:00Z", "2024-02-29T12:00Z"])
+        for day in period["days"]:
+            single = self.calculator.process_request({"command": "transits", "date": day["moment"][:10],
+                                                      "users": [self.user]})
+            self.assertEqual(day["positions"], single["positions"])
+            self.assertEqual(day["users"], single["users"])
+
+    def test_invalid_days(self):
+        for days in (0, 367, "7", True):
+            response = self.calculator.process_request({"command": "transits", "days": days, "users": [self.user]})
+            self.assertFalse(response["success"], days)
+            self.assertIn("days", response["error"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Офлайн-геокодер: город ищется только в стране из запроса"""
+
+import os
+import tempfile
+import unittest
+
+import tests.support  # noqa: F401 - путь к модулям калькулятора
+
+import city_geocoder
+
+# Строки в формате дампа GeoNames: name, asciiname, alternatenames, lat, lng, страна, население, пояс
+CITIES = (
+    ("Moscow", "Moscow", "Moskva,Москва", 55.75222, 37.61556, "RU", 10381222, "Europe/Moscow"),
+    ("Moscow", "Moscow", "Москва", 46.73239, -117.00017, "US", 25435, "America/Los_Angeles"),
+    ("Berlin", "Berlin", "Берлин", 52.52437, 13.41053, "DE", 3426354, "Europe/Berlin"),
+    ("Berezniki", "Berezniki", "Березники", 59.4091, 56.8204, "RU", 156466, "Asia/Yekaterinburg"),
+    ("Paris", "Paris", "Париж", 48.85341, 2.3488, "FR", 2138551, "Europe/Paris"),
+    ("Almaty", "Almaty", "Алматы", 43.25, 76.91667, "KZ", 2000900, "Asia/Almaty"),
+)
+
+
+class CityGeocoderTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.workdir = tempfile.TemporaryDirectory(prefix="natal-geocoder-test-")
+        source = os.path.join(cls.workdir.name, "cities.txt")
+        with open(source, "w", encoding="utf-8") as source_file:
+            for geoname_id, (name, ascii_name, alternate, lat, lng, country, population, tz) in enumerate(CITIES, 1):
+                columns = [str(geoname_id), name, ascii_name, alternate, str(lat), str(lng), "P", "PPL", country,
+                           "", "", "", "", "", str(population), "", "", tz, "2024-01-01"]
+                source_file.write("\t".join(columns) + "\n")
+        path = os.path.join(cls.workdir.name, "geocoder_cities.idx")
+        city_geocoder.build_index([source], path)
+        cls.geocoder = city_geocoder.CityGeocoder(path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.geocoder._mm.close()
+        cls.workdir.cleanup()
+
+    def lookup(self, city, country_code=None):
+        result = self.geocoder.lookup(city, country_code)
+        return result and (result["country_code"], result["tz"], result["match"])
+
+    def test_namesakes_stay_in_requested_country(self):
+        self.assertEqual(self.lookup("Moscow", "US"), ("US", "America/Los_Angeles", "exact"))
+        self.assertEqual(self.lookup("Москва", "RU"), ("RU", "Europe/Moscow", "exact"))
+        self.assertEqual(self.lookup("Москва"), ("RU", "Europe/Moscow", "exact"))
+
+    def test_no_city_in_country_is_a_miss(self):
+        self.assertIsNone(self.lookup("Paris", "RU"))
+        self.assertIsNone(self.lookup("Moscow", "KZ"))
+
+    def test_prefix_matches_only_in_country(self):
+        self.assertEqual(self.lookup("Бер", "RU"), ("RU", "Asia/Yekaterinburg", "prefix"))
+        self.assertEqual(self.lookup("Бер", "DE"), ("DE", "Europe/Berlin", "prefix"))
+        self.assertIsNone(self.lookup("Берл", "RU"))
+        self.assertIsNone(self.lookup("Моск", "KZ"))
+        self.assertEqual(self.lookup("Моск", "US"), ("US", "America/Los_Angeles", "prefix"))
+
+    def test_fuzzy_matches_only_in_country(self):
+        self.assertEqual(self.lookup("Москвы", "RU"), ("RU", "Europe/Moscow", "fuzzy"))
+        self.assertEqual(self.lookup("Москвы", "US"), ("US", "America/Los_Angeles", "fuzzy"))
+        self.assertIsNone(self.lookup("Москвы", "KZ"))
+        self.assertIsNone(self.lookup("Берлинн", "FR"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Урезание промта по бюджету токенов"""
+
+import re
+import unittest
+
+from tests.support import load_calculator, load_corpus
+
+
+class PromptBudgetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calculator = load_calculator()
+        subject = self.calculator.create_subject(load_corpus(1)[0])
+        self.translated = self.calculator.translate_natal_chart(subject, "RU")
+
+    def budget_dropping(self, prompt_format, tag):
+        """Бюджет, при котором убираются все части до tag включительно и ни одной после"""
+        tokens = self.calculator.format_prompt(self.translated, "RU", prompt_format)["prompt_tokens"]
+        for budget in range(tokens, 0, -1):
+            result = self.calculator.format_prompt(self.translated, "RU", prompt_format, budget)
+            if tag in result.get("prompt_truncated", ()):
+                return result
+        self.fail(f"{tag} is never dropped")
+
+    def numbers(self, instructions):
+        return [int(number) for number in re.findall(r"^(\d+)\. ", instructions, re.MULTILINE)]
+
+    def test_split_system_prompt_follows_dropped_houses(self):
+        full = self.calculator.format_prompt(self.translated, "RU", "split")
+        self.assertIn("Каждый дом", full["ai_system_prompt"])
+        self.assertEqual(self.numbers(full["ai_system_prompt"]), [1, 2, 3, 4])
+
+        result = self.budget_dropping("split", "houses")
+        self.assertNotIn("Каждый дом", result["ai_system_prompt"])
+        self.assertEqual(self.numbers(result["ai_system_prompt"]), [1, 2, 3])
+
+    def test_compact_instructions_renumbered(self):
+        result = self.budget_dropping("compact", "houses")
+        self.assertNotIn("Каждый дом", result["ai_prompt"])
+        self.assertEqual(self.numbers(result["ai_prompt"]), [1, 2, 3])
+
+    def test_over_budget_is_flagged(self):
+        for prompt_format in ("full", "compact", "split"):
+            result = self.calculator.format_prompt(self.translated, "RU", prompt_format, 10)
+            self.assertTrue(result["prompt_over_budget"])
+            self.assertGreater(result["prompt_tokens"], 10)
+            self.assertIn("uranus", result["prompt_truncated"])
+
+            fits = self.calculator.format_prompt(self.translated, "RU", prompt_format, result["prompt_tokens"])
+            self.assertNotIn("prompt_over_budget", fits)
+
+    def test_over_budget_in_response(self):
+        response = self.calculator.calculate_natal_chart(dict(load_corpus(1)[0], prompt_format="compact",
+                                                              prompt_token_budget=10))
+        self.assertTrue(response["success"], response)
+        self.assertTrue(response["prompt_over_budget"])
+
+
+if __name__ == "__main__":
+    unittest.main()
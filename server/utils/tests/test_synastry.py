@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Синастрия: очки совместимости и карты по chart_key"""
+
+import logging
+import unittest
+
+from tests.support import load_calculator, load_corpus, make_subject
+
+
+class RelationshipScoreTest(unittest.TestCase):
+
+    def test_scores_match_kerykeion(self):
+        from kerykeion.relationship_score.relationship_score_factory import RelationshipScoreFactory
+        from aspect_engine import natal_matrix, relationship_description, relationship_scores, subject_longitudes
+
+        subjects = [make_subject(item) for item in load_corpus(12)]
+        others = natal_matrix([subject_longitudes(subject) for subject in subjects])
+        logging.disable(logging.CRITICAL)
+        try:
+            for first_subject in subjects:
+                first = natal_matrix([subject_longitudes(first_subject)])[0]
+                scores, _ = relationship_scores(first, others)
+                for other_subject, score in zip(subjects, scores):
+                    expected = RelationshipScoreFactory(first_subject, other_subject).get_relationship_score()
+                    self.assertEqual(int(score), expected.score_value)
+                    self.assertEqual(relationship_description(int(score)), expected.score_description)
+        finally:
+            logging.disable(logging.NOTSET)
+
+
+class SynastryChartKeyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calculator = load_calculator()
+        corpus = load_corpus(3)
+        self.keys = [self.calculator.process_request(item)["chart_key"] for item in corpus]
+        self.longitudes = [self.calculator.process_request(item)["natal_longitudes"] for item in corpus]
+
+    def synastry(self, subject, partners):
+        return self.calculator.process_request({"command": "synastry", "subject": subject, "partners": partners})
+
+    def test_chart_keys_from_sync_natal(self):
+        by_key = self.synastry({"chart_key": self.keys[0]},
+                               [{"id": 1, "chart_key": self.keys[1]}, {"id": 2, "chart_key": self.keys[2]}])
+        by_longitudes = self.synastry({"longitudes": self.longitudes[0]},
+                                      [{"id": 1, "longitudes": self.longitudes[1]},
+                                       {"id": 2, "longitudes": self.longitudes[2]}])
+        self.assertTrue(by_key["success"], by_key)
+        self.assertEqual(by_key["partners"], by_longitudes["partners"])
+
+    def test_unknown_partner_fails_only_that_partner(self):
+        response = self.synastry({"chart_key": self.keys[0]},
+                                 [{"id": 1, "chart_key": "0" * 64}, {"id": 2, "chart_key": self.keys[1]}])
+        self.assertTrue(response["success"])
+        self.assertIn("Unknown chart_key", response["partners"][0]["error"])
+        self.assertIn("score", response["partners"][1])
+
+    def test_unknown_subject_is_input_error(self):
+        response = self.synastry({"id": 7, "chart_key": "0" * 64}, [{"id": 1, "chart_key": self.keys[1]}])
+        self.assertFalse(response["success"])
+        self.assertTrue(response["error"].startswith("subject: Unknown chart_key"), response["error"])
+        self.assertEqual(response["subject"], {"id": 7})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Офлайн-индекс часовых поясов: проверка входа и пояс у побережья"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from tests.support import load_calculator, load_corpus
+
+import timezone_index
+
+# Суша - квадрат lat 40..45, lng 10..15; вокруг - океан (индекс без with-oceans)
+LAND = {
+    "type": "FeatureCollection",
+    "features": [{
+        "type": "Feature",
+        "properties": {"tzid": "Europe/Rome"},
+        "geometry": {"type": "Polygon", "coordinates": [[[10, 40], [15, 40], [15, 45], [10, 45], [10, 40]]]},
+    }],
+}
+
+
+class TimezoneIndexTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.workdir = tempfile.TemporaryDirectory(prefix="natal-tz-test-")
+        source = os.path.join(cls.workdir.name, "land.json")
+        with open(source, "w", encoding="utf-8") as source_file:
+            json.dump(LAND, source_file)
+        path = os.path.join(cls.workdir.name, "timezone_grid.idx")
+        timezone_index.build_index(source, path, cells_per_degree=4)
+        cls.index = timezone_index.TimezoneIndex(path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.index._mm.close()
+        cls.workdir.cleanup()
+
+    def test_coast_uses_nearest_land_zone(self):
+        points = [[42.5, 12.5], [45.6, 12.5], [42.5, 9.3], [39.2, 16.1], [48.0, 12.5], [42.5, 20.0]]
+        expected = ["Europe/Rome", "Europe/Rome", "Europe/Rome", "Europe/Rome", "Etc/GMT-1", "Etc/GMT-1"]
+        self.assertEqual([self.index.lookup(lat, lng) for lat, lng in points], expected)
+        self.assertEqual(self.index.lookup_many(points), expected)
+
+    def test_invalid_coordinates_rejected(self):
+        for coordinates in ([[1, 2, 3], [4, 5, 6]], [[91, 0]], [[0, -180.5]], [[float("nan"), 0]],
+                            [["55.7", "37.6"]], [[True, 0]], [55.7, 37.6], "55.7,37.6"):
+            with self.assertRaises(ValueError, msg=coordinates):
+                timezone_index.validate_coordinates(coordinates)
+        with self.assertRaises(ValueError):
+            self.index.lookup_many([[1, 2, 3], [4, 5, 6]])
+        timezone_index.validate_coordinates([[90, 180], [-90, -180], [55.75, 37.62]])
+
+    def test_tz_source_in_response(self):
+        calculator = load_calculator()
+        request = load_corpus(1)[0]
+        self.assertEqual(calculator.process_request(dict(request, use_cache=False))["tz_source"], "input")
+
+        without_tz = {field: value for field, value in request.items() if field != "birth_tz"}
+        response = calculator.process_request(dict(without_tz, use_cache=False))
+        self.assertTrue(response["success"], response)
+        self.assertIn(response["tz_source"], ("timezone_index", "fallback"))
+
+    def test_command_reports_invalid_coordinates(self):
+        response = load_calculator().process_request({"command": "timezones", "coordinates": [[1, 2, 3], [4, 5, 6]]})
+        self.assertFalse(response["success"])
+        self.assertIn("coordinates[0]", response["error"])
+
+
+if __name__ == "__main__":
+    unittest.main()
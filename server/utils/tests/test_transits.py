@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""Транзиты по картам из ответа расчета"""
+
+import unittest
+
+from tests.support import load_calculator, load_corpus
+
+
+class TransitsChartKeyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calculator = load_calculator()
+
+    def transits(self, user):
+        return self.calculator.process_request({"command": "transits", "date": "2024-03-20", "time": "12:00",
+                                                "users": [user]})
+
+    def test_chart_key_from_sync_natal(self):
+        for use_cache in (True, False):
+            natal = self.calculator.process_request(dict(load_corpus(2)[1], use_cache=use_cache))
+            self.assertTrue(natal["success"], natal)
+            self.assertEqual(natal["svg_status"], "ready")
+
+            by_key = self.transits({"id": 1, "chart_key": natal["chart_key"]})
+            by_longitudes = self.transits({"id": 1, "longitudes": natal["natal_longitudes"]})
+            self.assertTrue(by_key["success"], by_key)
+            self.assertNotIn("error", by_key["users"][0])
+            self.assertEqual(by_key["users"], by_longitudes["users"])
+
+    def test_unknown_chart_key(self):
+        response = self.transits({"id": 1, "chart_key": "0" * 64})
+        self.assertIn("Unknown chart_key", response["users"][0]["error"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Офлайн-определение часового пояса по координатам для Lunaria AI
+
+Индекс - растровая сетка поверх полигонов часовых поясов
+(timezone-boundary-builder, combined.json / combined-with-oceans.json,
+https://github.com/evansiroky/timezone-boundary-builder/releases).
+Двухуровневая структура: грубая сетка 1°x1°, где однородная клетка хранит
+номер пояса сразу, а клетка на границе поясов ссылается на блок мелкой
+сетки (по умолчанию 1/20°, около 5 км). Файл открывается через mmap:
+загрузка - миллисекунды, поиск - микросекунды, никакой сети.
+
+Вне полигонов (океан, если собирали без with-oceans) в пределах
+OCEAN_FALLBACK_DEGREES от суши клетки еще при сборке получают пояс
+ближайшей суши: у побережья это пояс страны с ее историей перехода на
+летнее время, а поиск остается одним чтением клетки. Дальше от суши
+возвращается морской пояс Etc/GMT±N по долготе. В индексе старого формата
+(LNTZ0001) прибрежных поясов нет - его стоит пересобрать.
+
+    python3 timezone_index.py build combined-with-oceans.json [--output PATH] [--cells-per-degree N]
+    python3 timezone_index.py lookup 55.75 37.62
+    echo '[[55.75, 37.62], [40.71, -74.0]]' | python3 timezone_index.py bulk
+"""
+
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from pathlib import Path
+
+DEFAULT_INDEX_PATH = Path(__file__).resolve().parent.parent.parent / 'cache' / 'timezone_grid.idx'
+DEFAULT_CELLS_PER_DEGREE = 20
+
+# LNTZ0002 - с прибрежными поясами; LNTZ0001 читается, но без них
+INDEX_MAGIC = b'LNTZ0002'
+LEGACY_INDEX_MAGICS = (b'LNTZ0001',)
+# magic, cells_per_degree, n_blocks, off_coarse, off_blocks, off_tz, len_tz
+HEADER = struct.Struct('<8sIIIIII')
+COARSE_CELL = struct.Struct('<I')
+FINE_CELL = struct.Struct('<H')
+
+# Старший бит грубой клетки: значение - номер блока мелкой сетки, а не пояса
+BLOCK_FLAG = 0x80000000
+NO_ZONE = 0
+
+# Сколько градусов от суши клетки вне полигонов получают пояс ближайшей суши (при сборке)
+OCEAN_FALLBACK_DEGREES = 2
+
+
+def validate_coordinates(coordinates):
+    """Проверяет список точек [[lat, lng], ...]: пары конечных чисел в пределах широты и долготы"""
+    if not isinstance(coordinates, list):
+        raise ValueError("Field 'coordinates' must be a list of [lat, lng] pairs")
+    for position, point in enumerate(coordinates):
+        if not isinstance(point, (list, tuple)) or len(point) != 2:
+            raise ValueError(f"coordinates[{position}] must be a [lat, lng] pair")
+        lat, lng = point
+        if not all(isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+                   for value in point):
+            raise ValueError(f"coordinates[{position}] must contain finite numbers")
+        if not -90.0 <= lat <= 90.0:
+            raise ValueError(f"coordinates[{position}]: latitude {lat} is out of range [-90, 90]")
+        if not -180.0 <= lng <= 180.0:
+            raise ValueError(f"coordinates[{position}]: longitude {lng} is out of range [-180, 180]")
+
+
+def ocean_timezone(lng):
+    """Морской пояс по долготе (знак в Etc/GMT инвертирован: Etc/GMT-3 = UTC+3)"""
+    offset = int(round(lng / 15.0))
+    if offset == 0:
+        return "Etc/GMT"
+    return f"Etc/GMT{-offset:+d}"
+
+
+def _rasterize_polygon(raster, rings, zone_id, cells_per_degree):
+    """
+    Закрашивает полигон (внешний контур + дыры) построчным алгоритмом even-odd.
+    Все пересечения ребер со строками сетки считаются сразу массивами numpy.
+    """
+    import numpy as np
+
+    edges_x1, edges_y1, edges_x2, edges_y2 = [], [], [], []
+    for ring in rings:
+        points = np.asarray(ring, dtype=np.float64)
+        if len(points) < 3:
+            continue
+        # Переводим в координаты сетки: x = столбец, y = строка
+        xs = (points[:, 0] + 180.0) * cells_per_degree
+        ys = (points[:, 1] + 90.0) * cells_per_degree
+        edges_x1.append(xs)
+        edges_y1.append(ys)
+        edges_x2.append(np.roll(xs, -1))
+        edges_y2.append(np.roll(ys, -1))
+    if not edges_x1:
+        return
+
+    x1 = np.concatenate(edges_x1)
+    y1 = np.concatenate(edges_y1)
+    x2 = np.concatenate(edges_x2)
+    y2 = np.concatenate(edges_y2)
+
+    # Строка r пересекается ребром, если центр строки r + 0.5 лежит в [ymin, ymax)
+    y_min = np.minimum(y1, y2)
+    y_max = np.maximum(y1, y2)
+    first_row = np.ceil(y_min - 0.5).astype(np.int64)
+    last_row = np.ceil(y_max - 0.5).astype(np.int64) - 1
+    counts = np.maximum(last_row - first_row + 1, 0)
+    if counts.sum() == 0:
+        return
+
+    edge_index = np.repeat(np.arange(len(x1)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    rows = first_row[edge_index] + offsets
+    row_y = rows + 0.5
+    t = (row_y - y1[edge_index]) / (y2[edge_index] - y1[edge_index])
+    cross_x = x1[edge_index] + t * (x2[edge_index] - x1[edge_index])
+
+    order = np.lexsort((cross_x, rows))
+    rows = rows[order]
+    cross_x = cross_x[order]
+    # Пересечения внутри строки идут парами: [вход, выход)
+    starts_row = rows[0::2]
+    start_x = cross_x[0::2]
+    end_x = cross_x[1::2]
+    if len(end_x) != len(start_x):
+        return
+
+    height, width = raster.shape
+    valid = (starts_row >= 0) & (starts_row < height)
+    starts_row = starts_row[valid]
+    # Клетка закрашивается, если ее центр c + 0.5 внутри [start_x, end_x)
+    first_col = np.clip(np.ceil(start_x[valid] - 0.5).astype(np.int64), 0, width)
+    end_col = np.clip(np.ceil(end_x[valid] - 0.5).astype(np.int64), 0, width)
+    keep = end_col > first_col
+    if not keep.any():
+        return
+    starts_row, first_col, end_col = starts_row[keep], first_col[keep], end_col[keep]
+
+    row_lo, row_hi = starts_row.min(), starts_row.max() + 1
+    col_lo, col_hi = first_col.min(), end_col.max()
+    # Разностный массив: +1 на входе, -1 на выходе, кумулятивная сумма = маска
+    diff = np.zeros((row_hi - row_lo, col_hi - col_lo + 1), dtype=np.int32)
+    np.add.at(diff, (starts_row - row_lo, first_col - col_lo), 1)
+    np.add.at(diff, (starts_row - row_lo, end_col - col_lo), -1)
+    mask = np.cumsum(diff, axis=1)[:, :-1] > 0
+    raster[row_lo:row_hi, col_lo:col_hi][mask] = zone_id
+
+
+def _fill_coastal_waters(raster, radius):
+    """
+    Клетки вне полигонов не дальше radius клеток от суши получают пояс
+    ближайшей суши: волна расширяется на клетку за шаг, сначала по
+    сторонам, затем по диагоналям (расстояние - по сетке). Долгота
+    замкнута через 180°. Дальше от суши остается NO_ZONE.
+    """
+    import numpy as np
+
+    height = raster.shape[0]
+    for _ in range(radius):
+        empty = raster == NO_ZONE
+        if not empty.any():
+            break
+        grown = raster.copy()
+        for d_row, d_col in ((-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)):
+            # shifted[r, c] = raster[r + d_row, c + d_col]; за полюсом соседей нет
+            shifted = np.roll(raster, -d_col, axis=1) if d_col else raster
+            neighbour = np.full_like(raster, NO_ZONE)
+            if d_row > 0:
+                neighbour[:height - 1] = shifted[1:]
+            elif d_row < 0:
+                neighbour[1:] = shifted[:height - 1]
+            else:
+                neighbour = shifted
+            take = empty & (grown == NO_ZONE) & (neighbour != NO_ZONE)
+            grown[take] = neighbour[take]
+        raster[:] = grown
+
+
+def build_index(geojson_path, output_path=None, cells_per_degree=DEFAULT_CELLS_PER_DEGREE):
+    """Собирает индекс из GeoJSON с полигонами поясов (свойство tzid)"""
+    import numpy as np
+
+    output_path = Path(output_path or DEFAULT_INDEX_PATH)
+    with open(geojson_path, encoding="utf-8") as source:
+        collection = json.load(source)
+
+    n = cells_per_degree
+    raster = np.zeros((180 * n, 360 * n), dtype=np.uint16)
+    tz_names = [""]
+
+    for feature in collection["features"]:
+        tz_name = feature["properties"].get("tzid")
+        geometry = feature.get("geometry") or {}
+        if not tz_name or geometry.get("type") not in ("Polygon", "MultiPolygon"):
+            continue
+        zone_id = len(tz_names)
+        tz_names.append(tz_name)
+        polygons = geometry["coordinates"]
+        if geometry["type"] == "Polygon":
+            polygons = [polygons]
+        for rings in polygons:
+            _rasterize_polygon(raster, rings, zone_id, n)
+        print(f"🗺️ Rasterized {tz_name}", file=sys.stderr)
+
+    if len(tz_names) > 0xFFFF:
+        raise ValueError("Too many time zones for a 16-bit index")
+
+    _fill_coastal_waters(raster, OCEAN_FALLBACK_DEGREES * n)
+
+    # Грубая сетка 1°: однородный блок хранит пояс, неоднородный - ссылку на блок
+    blocks = raster.reshape(180, n, 360, n).transpose(0, 2, 1, 3).reshape(180 * 360, n * n)
+    uniform = (blocks == blocks[:, :1]).all(axis=1)
+    coarse = np.where(uniform, blocks[:, 0].astype(np.uint32), 0).astype(np.uint32)
+    mixed = np.flatnonzero(~uniform)
+    coarse[mixed] = BLOCK_FLAG | np.arange(len(mixed), dtype=np.uint32)
+
+    tz_blob = "\n".join(tz_names).encode("utf-8")
+    off_coarse = HEADER.size
+    off_blocks = off_coarse + coarse.nbytes
+    off_tz = off_blocks + len(mixed) * n * n * FINE_CELL.size
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_suffix(output_path.suffix + ".tmp")
+    with open(tmp_path, "wb") as out:
+        out.write(HEADER.pack(INDEX_MAGIC, n, len(mixed), off_coarse, off_blocks, off_tz, len(tz_blob)))
+        out.write(coarse.astype('<u4').tobytes())
+        out.write(blocks[mixed].astype('<u2').tobytes())
+        out.write(tz_blob)
+    os.replace(tmp_path, output_path)
+
+    return {"timezones": len(tz_names) - 1, "cells_per_degree": n, "mixed_blocks": int(len(mixed)),
+            "size_bytes": output_path.stat().st_size, "path": str(output_path)}
+
+
+class TimezoneIndex:
+    """Поиск часового пояса по memory-mapped сетке"""
+
+    def __init__(self, path=None):
+        self.path = Path(path or os.environ.get("NATAL_CHART_TZ_INDEX_PATH") or DEFAULT_INDEX_PATH)
+        with open(self.path, "rb") as index_file:
+            self._mm = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.cells_per_degree, self.n_blocks, self._off_coarse,
+         self._off_blocks, off_tz, len_tz) = HEADER.unpack_from(self._mm, 0)
+        if magic in LEGACY_INDEX_MAGICS:
+            from instrumentation import log
+            log("warning", "timezone_index_outdated", path=str(self.path),
+                hint="rebuild the index to get coastal time zones offshore")
+        elif magic != INDEX_MAGIC:
+            raise ValueError(f"Not a timezone index: {self.path}")
+        self.tz_names = self._mm[off_tz:off_tz + len_tz].decode("utf-8").split("\n")
+
+    def _cell(self, lat, lng):
+        n = self.cells_per_degree
+        row = min(max(int((lat + 90.0) * n), 0), 180 * n - 1)
+        col = int(((lng + 180.0) % 360.0) * n) % (360 * n)
+        return row, col
+
+    def lookup(self, lat, lng):
+        """IANA-пояс для точки (lat, lng)"""
+        n = self.cells_per_degree
+        row, col = self._cell(lat, lng)
+        value = COARSE_CELL.unpack_from(self._mm, self._off_coarse + ((row // n) * 360 + col // n) * 4)[0]
+        if value & BLOCK_FLAG:
+            fine_offset = ((value & ~BLOCK_FLAG) * n * n + (row % n) * n + col % n) * 2
+            value = FINE_CELL.unpack_from(self._mm, self._off_blocks + fine_offset)[0]
+        return self.tz_names[value] if value != NO_ZONE else ocean_timezone(lng)
+
+    def lookup_many(self, coordinates):
+        """
+        Пакетный поиск: [(lat, lng), ...] -> [tz, ...] (через numpy, если он есть).
+        Вход проверяется validate_coordinates - ValueError на первой неверной точке.
+        """
+        validate_coordinates(list(coordinates))
+        try:
+            import numpy as np
+        except ImportError:
+            return [self.lookup(lat, lng) for lat, lng in coordinates]
+
+        points = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        if not len(points):
+            return []
+        n = self.cells_per_degree
+        rows = np.clip(((points[:, 0] + 90.0) * n).astype(np.int64), 0, 180 * n - 1)
+        cols = (((points[:, 1] + 180.0) % 360.0) * n).astype(np.int64) % (360 * n)
+
+        coarse = np.frombuffer(self._mm, dtype='<u4', count=180 * 360, offset=self._off_coarse)
+        values = coarse[(rows // n) * 360 + cols // n].astype(np.int64)
+        in_block = (values & BLOCK_FLAG) != 0
+        if in_block.any() and self.n_blocks:
+            fine = np.frombuffer(self._mm, dtype='<u2', count=self.n_blocks * n * n, offset=self._off_blocks)
+            block = values[in_block] & ~BLOCK_FLAG
+            values[in_block] = fine[block * n * n + (rows[in_block] % n) * n + cols[in_block] % n]
+
+        return [self.tz_names[value] if value != NO_ZONE else ocean_timezone(lng)
+                for value, lng in zip(values.tolist(), points[:, 1].tolist())]
+
+
+_index = None
+
+
+def get_timezone_index():
+    """Общий экземпляр индекса на процесс; None, если индекс не собран"""
+    global _index
+    if _index is None:
+        try:
+            _index = TimezoneIndex()
+        except (OSError, ValueError) as e:
+            from instrumentation import log
+            log("warning", "timezone_index_unavailable", error=str(e))
+            _index = False
+    return _index or None
+
+
+def lookup_timezone(lat, lng):
+    """Пояс для одной точки; None, если индекс не собран"""
+    index = get_timezone_index()
+    return index.lookup(float(lat), float(lng)) if index else None
+
+
+def lookup_timezones(coordinates):
+    """Пояса для списка точек [(lat, lng), ...]; None, если индекс не собран"""
+    index = get_timezone_index()
+    return index.lookup_many(coordinates) if index else None
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] not in ("build", "lookup", "bulk"):
+        print(__doc__, file=sys.stderr)
+        sys.exit(1)
+
+    if args[0] == "build":
+        output = None
+        cells_per_degree = DEFAULT_CELLS_PER_DEGREE
+        sources = []
+        rest = iter(args[1:])
+        for arg in rest:
+            if arg == "--output":
+                output = next(rest)
+            elif arg == "--cells-per-degree":
+                cells_per_degree = int(next(rest))
+            else:
+                sources.append(arg)
+        if len(sources) != 1:
+            print("❌ Expected exactly one GeoJSON source file", file=sys.stderr)
+            sys.exit(1)
+        stats = build_index(sources[0], output, cells_per_degree)
+        print(f"✅ Timezone index built: {stats['timezones']} zones, {stats['mixed_blocks']} border blocks", file=sys.stderr)
+        print(json.dumps(stats))
+    elif args[0] == "lookup":
+        result = lookup_timezone(float(args[1]), float(args[2]))
+        print(json.dumps(result))
+        if result is None:
+            sys.exit(1)
+    else:
+        result = lookup_timezones(json.load(sys.stdin))
+        print(json.dumps(result))
+        if result is None:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()